@@ -1,6 +1,9 @@
 def user_change(sender, instance, **kwargs):
     from accounts.services import UserService
     UserService.invalidate_user_cache(instance.id)
+    if kwargs.get('created'):
+        # a tombstone may be cached for the profile of the new id
+        UserService.invalidate_profile_cache(instance.id)
 
 def user_profile_change(sender, instance, **kwargs):
     from accounts.services import UserService
@@ -2,45 +2,150 @@ from accounts.models import User, UserProfile
 from django.conf import settings
 from django.core.cache import caches
 from twitter.cache import USER_PATTERN, USER_PROFILE_PATTERN
+from utils.memcached.local_cache import LocalCache
+from utils.memcached.memcached_helper import TOMBSTONE
 
 cache = caches['testing'] if settings.TESTING else caches['default']
+# users and profiles are read many times per page, each process keeps the
+# recent ones in memory for a few seconds
+local_cache = LocalCache(
+    max_size=settings.LOCAL_CACHE_MAX_SIZE,
+    ttl=settings.LOCAL_CACHE_TTL,
+    channel=settings.LOCAL_CACHE_INVALIDATION_CHANNEL,
+)
 
 
 class UserService:
+    memcached_stats = {'hits': 0, 'misses': 0}
 
     @classmethod
-    def get_user_through_memcached(cls, user_id):
-        key = USER_PATTERN.format(user_id=user_id)
-        user = cache.get(key)
-        if user is not None:
-            return user
+    def get_cache_stats(cls):
+        # hits and misses of each tier since the process started
+        return {
+            'local': local_cache.get_stats(),
+            'memcached': dict(cls.memcached_stats),
+        }
+
+    @classmethod
+    def _get_many_through_caches(cls, pattern, user_ids, load_from_db):
+        # {user_id: object} from the local cache, then memcached, then db.
+        # load_from_db returns {user_id: object} of the ids it finds, the
+        # others are cached as a tombstone and left out of the result
+        keys = {
+            pattern.format(user_id=user_id): user_id
+            for user_id in set(user_ids)
+            if user_id is not None
+        }
+        found = local_cache.get_many(keys)
+        missing_keys = [key for key in keys if key not in found]
+        if missing_keys:
+            cached_objects = cache.get_many(missing_keys)
+            cls.memcached_stats['hits'] += len(cached_objects)
+            cls.memcached_stats['misses'] += len(missing_keys) - len(cached_objects)
+            local_cache.set_many(cached_objects)
+            found.update(cached_objects)
+
+        missing_user_ids = [
+            user_id for key, user_id in keys.items()
+            if key not in found
+        ]
+        if missing_user_ids:
+            missing_objects = load_from_db(missing_user_ids)
+            mapping = {
+                pattern.format(user_id=user_id): obj
+                for user_id, obj in missing_objects.items()
+            }
+            tombstones = {
+                pattern.format(user_id=user_id): TOMBSTONE
+                for user_id in missing_user_ids
+                if user_id not in missing_objects
+            }
+            cache.set_many(mapping)
+            cache.set_many(tombstones, settings.NEGATIVE_CACHE_TIMEOUT)
+            local_cache.set_many({**mapping, **tombstones})
+            found.update(mapping)
 
-        try:
-            user = User.objects.get(id=user_id)
-            cache.set(key, user)
-        except:
-            user = None
+        return {
+            keys[key]: obj
+            for key, obj in found.items()
+            if obj != TOMBSTONE
+        }
 
-        return user
+    @classmethod
+    def _load_users(cls, user_ids):
+        return {user.id: user for user in User.objects.filter(id__in=user_ids)}
+
+    @classmethod
+    def _load_profiles(cls, user_ids):
+        # missing profiles of existing users are created
+        profiles = {
+            profile.user_id: profile
+            for profile in UserProfile.objects.filter(user_id__in=user_ids)
+        }
+        missing_user_ids = [
+            user_id for user_id in user_ids
+            if user_id not in profiles
+        ]
+        if not missing_user_ids:
+            return profiles
+
+        for user_id in User.objects.filter(id__in=missing_user_ids).values_list('id', flat=True):
+            profiles[user_id], _ = UserProfile.objects.get_or_create(
+                user_id=user_id,
+            )
+        return profiles
+
+    @classmethod
+    def get_user_through_memcached(cls, user_id):
+        return cls.get_users_through_memcached([user_id]).get(user_id)
+
+    @classmethod
+    def get_users_through_memcached(cls, user_ids):
+        # {user_id: user} with one get_many and one query for the misses
+        return cls._get_many_through_caches(USER_PATTERN, user_ids, cls._load_users)
 
     @classmethod
     def invalidate_user_cache(cls, user_id):
         key = USER_PATTERN.format(user_id=user_id)
         cache.delete(key)
+        local_cache.delete(key)
 
     @classmethod
     def get_profile_through_memcached(cls, user_id):
-        key = USER_PROFILE_PATTERN.format(user_id=user_id)
-        profile = cache.get(key)
-        if profile is not None:
-            return profile
+        return cls.get_profiles_through_memcached([user_id]).get(user_id)
 
-        profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
-        cache.set(key, profile)
+    @classmethod
+    def get_profiles_through_memcached(cls, user_ids):
+        # {user_id: profile} with one get_many and one query for the misses
+        return cls._get_many_through_caches(
+            USER_PROFILE_PATTERN,
+            user_ids,
+            cls._load_profiles,
+        )
+
+    @classmethod
+    def fill_cached_users(
+        cls,
+        objects,
+        user_id_field='user_id',
+        cached_user_field='_cached_user',
+    ):
+        # attach the users of a page and their profiles with two get_many,
+        # objects of the same user share one user instance
+        objects = [obj for obj in objects if obj is not None]
+        users = cls.get_users_through_memcached(
+            getattr(obj, user_id_field) for obj in objects
+        )
+        profiles = cls.get_profiles_through_memcached(users.keys())
+        for user_id, user in users.items():
+            setattr(user, '_cached_user_profile', profiles[user_id])
+        for obj in objects:
+            setattr(obj, cached_user_field, users.get(getattr(obj, user_id_field)))
 
-        return profile
+        return objects
 
     @classmethod
     def invalidate_profile_cache(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
-        cache.delete(key)
\ No newline at end of file
+        cache.delete(key)
+        local_cache.delete(key)
\ No newline at end of file
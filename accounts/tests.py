@@ -1,12 +1,181 @@
 from accounts.models import UserProfile
+from accounts.services import UserService, local_cache
+from django.contrib.auth.models import User
+from redis.exceptions import ConnectionError
 from testing.testcases import TestCase
+from unittest import mock
+from utils.memcached.local_cache import LocalCache
+from utils.redis.redis_client import RedisClient
+import time
 
 
 class UserProfileTests(TestCase):
 
+    def setUp(self):
+        self.clear_cache()
+
     def test_userprofile(self):
         user1 = self.create_user('testuser1')
         self.assertEqual(UserProfile.objects.count(), 0)
         profile = user1.profile
         self.assertEqual(isinstance(profile, UserProfile), True)
-        self.assertEqual(UserProfile.objects.count(), 1)
\ No newline at end of file
+        self.assertEqual(UserProfile.objects.count(), 1)
+
+    def test_fill_cached_users(self):
+        users = [self.create_user('testuser{}'.format(i)) for i in range(2)]
+        profile = users[0].profile
+        profile.nickname = 'nickname'
+        profile.save()
+        tweets = [self.create_tweet(users[i % 2]) for i in range(6)]
+        self.clear_cache()
+
+        # users and profiles are loaded in one query each, missing profile
+        # is created
+        UserService.fill_cached_users(tweets)
+        self.assertEqual(UserProfile.objects.count(), 2)
+        self.assertEqual(tweets[0].cached_user, users[0])
+        self.assertEqual(tweets[1].cached_user, users[1])
+        # tweets of one user share the same user instance
+        self.assertIs(tweets[0].cached_user, tweets[2].cached_user)
+        self.assertEqual(tweets[0].cached_user.profile.nickname, 'nickname')
+
+        # cache hit
+        tweets = [self.create_tweet(users[i % 2]) for i in range(6)]
+        with self.assertNumQueries(0):
+            UserService.fill_cached_users(tweets)
+            self.assertEqual(tweets[0].cached_user.profile.nickname, 'nickname')
+            self.assertEqual(tweets[1].cached_user.username, 'testuser1')
+
+    def test_local_cache(self):
+        local = LocalCache(max_size=2, ttl=60, channel='test_local_cache')
+        users = [self.create_user('testuser{}'.format(i)) for i in range(3)]
+        local.set_many({'user:{}'.format(user.id): user for user in users[:2]})
+        self.assertEqual(local.get('user:{}'.format(users[0].id)), users[0])
+
+        # each get returns a copy, attributes set on it are not cached
+        user = local.get('user:{}'.format(users[0].id))
+        user._cached_user_profile = 'profile'
+        self.assertIsNot(local.get('user:{}'.format(users[0].id)), user)
+        self.assertFalse(hasattr(
+            local.get('user:{}'.format(users[0].id)),
+            '_cached_user_profile',
+        ))
+
+        # the least recently used key is dropped first
+        local.set('user:{}'.format(users[2].id), users[2])
+        self.assertIsNone(local.get('user:{}'.format(users[1].id)))
+        self.assertIsNotNone(local.get('user:{}'.format(users[0].id)))
+
+        # expired keys are misses
+        local.ttl = 0
+        local.set('user:{}'.format(users[1].id), users[1])
+        self.assertIsNone(local.get('user:{}'.format(users[1].id)))
+
+        # deleted keys are dropped by the local caches of other processes
+        other_local = LocalCache(max_size=2, ttl=60, channel='test_local_cache')
+        other_local.start_listener()
+        other_local.set('user:{}'.format(users[0].id), users[0])
+        local.delete('user:{}'.format(users[0].id))
+        for _ in range(100):
+            if other_local.get('user:{}'.format(users[0].id)) is None:
+                break
+            time.sleep(0.01)
+        self.assertIsNone(other_local.get('user:{}'.format(users[0].id)))
+
+    def test_local_cache_without_redis(self):
+        local = LocalCache(max_size=2, ttl=60, channel='test_local_cache')
+        user = self.create_user('testuser')
+        key = 'user:{}'.format(user.id)
+
+        # no deletion can be received, the local tier is bypassed
+        with mock.patch.object(
+            RedisClient,
+            'get_pubsub',
+            side_effect=ConnectionError,
+        ) as get_pubsub:
+            local.set(key, user)
+            self.assertIsNone(local.get(key))
+            self.assertEqual(get_pubsub.call_count, 1)
+        local.retry_at = 0
+        local.set(key, user)
+        self.assertEqual(local.get(key), user)
+
+        # the listener lost its connection
+        local.subscribed = False
+        self.assertIsNone(local.get(key))
+        local.subscribed = True
+
+        with mock.patch.object(
+            RedisClient,
+            'get_connection',
+            side_effect=ConnectionError,
+        ):
+            local.delete(key)
+        self.assertIsNone(local.get(key))
+
+    def test_cache_tiers(self):
+        user = self.create_user('testuser')
+        profile = user.profile
+        self.clear_cache()
+        stats = UserService.get_cache_stats()
+
+        # db, then memcached, then the local cache
+        self.assertEqual(UserService.get_profile_through_memcached(user.id), profile)
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            UserService.get_profile_through_memcached(user.id)
+            UserService.get_profile_through_memcached(user.id)
+        new_stats = UserService.get_cache_stats()
+        self.assertEqual(new_stats['local']['hits'] - stats['local']['hits'], 1)
+        self.assertEqual(new_stats['local']['misses'] - stats['local']['misses'], 2)
+        self.assertEqual(
+            new_stats['memcached']['hits'] - stats['memcached']['hits'],
+            1,
+        )
+        self.assertEqual(
+            new_stats['memcached']['misses'] - stats['memcached']['misses'],
+            1,
+        )
+
+        # changes are seen at once by the process that made them
+        profile.nickname = 'nickname'
+        profile.save()
+        self.assertEqual(
+            UserService.get_profile_through_memcached(user.id).nickname,
+            'nickname',
+        )
+        user.username = 'newname'
+        user.save()
+        self.assertEqual(UserService.get_user_through_memcached(user.id).username, 'newname')
+
+    def test_negative_cache(self):
+        user = self.create_user('testuser')
+        missing_id = user.id + 100
+        UserService.get_user_through_memcached(user.id)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(UserService.get_user_through_memcached(missing_id), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(UserService.get_user_through_memcached(missing_id), None)
+        # the tombstone is kept by memcached as well
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(UserService.get_user_through_memcached(missing_id), None)
+            self.assertEqual(
+                UserService.get_users_through_memcached([user.id, missing_id]),
+                {user.id: user},
+            )
+
+        # no profile is created for a missing user
+        self.assertEqual(UserService.get_profile_through_memcached(missing_id), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(UserService.get_profile_through_memcached(missing_id), None)
+        self.assertEqual(UserProfile.objects.count(), 0)
+
+        # post_save of the new user clears the tombstones of its id
+        new_user = User.objects.create_user(id=missing_id, username='newuser')
+        self.assertEqual(UserService.get_user_through_memcached(missing_id), new_user)
+        self.assertEqual(
+            UserService.get_profile_through_memcached(missing_id).user_id,
+            missing_id,
+        )
\ No newline at end of file
@@ -1,14 +1,13 @@
 from accounts.api.serializers import UserSerializerForComment
 from comments.models import Comment
-from likes.services import LikeService
-from random import randint
+from likes.api.serializers import LikedObjectIdSetMixin
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.models import Tweet
 from utils.redis.redis_helper import RedisHelper
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(LikedObjectIdSetMixin, serializers.ModelSerializer):
     user = UserSerializerForComment(source='cached_user')
     has_liked = serializers.SerializerMethodField()
     likes_count = serializers.SerializerMethodField()
@@ -26,18 +25,12 @@ class CommentSerializer(serializers.ModelSerializer):
             'has_liked',
         )
 
-    def get_has_liked(self, obj):
-        return LikeService.has_liked(self.context['request'].user, obj)
-
     def get_likes_count(self, obj):
-        if randint(0, 999) == 0:
-            actual_likes_count = obj.like_set.count()
-            if obj.likes_count != actual_likes_count:
-                obj.likes_count = actual_likes_count
-                obj.save()
-            return actual_likes_count
-
-        return RedisHelper.get_count(obj, 'likes_count')
+        return RedisHelper.get_count(
+            obj,
+            'likes_count',
+            self.context.get('counts'),
+        )
 
 
 class CommentSerializerForCreate(serializers.ModelSerializer):
@@ -1,6 +1,7 @@
 from comments.models import Comment
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from utils.redis.redis_helper import RedisHelper
 
 COMMENT_UTL = '/api/comments/'
 COMMENT_DETAIL_URL = '/api/comments/{}/'
@@ -180,6 +181,8 @@ class CommentApiTest(TestCase):
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['comments_count'], 1)
+        # counters are written to db by flush_counter_deltas_task
+        RedisHelper.flush_counter_deltas()
         self.tweet.refresh_from_db()
         self.assertEqual(self.tweet.comments_count, 1)
 
@@ -189,6 +192,7 @@ class CommentApiTest(TestCase):
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['comments_count'], 2)
+        RedisHelper.flush_counter_deltas()
         self.tweet.refresh_from_db()
         self.assertEqual(self.tweet.comments_count, 2)
 
@@ -198,6 +202,7 @@ class CommentApiTest(TestCase):
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['comments_count'], 2)
+        RedisHelper.flush_counter_deltas()
         self.tweet.refresh_from_db()
         self.assertEqual(self.tweet.comments_count, 2)
 
@@ -206,5 +211,6 @@ class CommentApiTest(TestCase):
         response = self.user1_client.get(tweet_url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['comments_count'], 1)
+        RedisHelper.flush_counter_deltas()
         self.tweet.refresh_from_db()
         self.assertEqual(self.tweet.comments_count, 1)
\ No newline at end of file
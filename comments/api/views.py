@@ -1,3 +1,4 @@
+from accounts.services import UserService
 from comments.api.serializers import (
     CommentSerializer,
     CommentSerializerForCreate,
@@ -6,12 +7,14 @@ from comments.api.serializers import (
 from comments.models import Comment
 from django.utils.decorators import method_decorator
 from inbox.services import NotificationService
+from likes.services import LikeService
 from ratelimit.decorators import ratelimit
 from rest_framework import viewsets, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from utils.decorators import required_param
 from utils.permissions import IsObjectOwner
+from utils.redis.redis_helper import RedisHelper
 
 
 class CommentViewSet(viewsets.GenericViewSet):
@@ -34,15 +37,21 @@ class CommentViewSet(viewsets.GenericViewSet):
     @method_decorator(ratelimit(key='user_or_ip', rate='10/s', method='GET', block=True))
     def list(self, request):
         queryset = self.get_queryset()
-        comments = self.filter_queryset(queryset).\
-            prefetch_related('user').\
-            order_by('created_at')
+        comments = self.filter_queryset(queryset).order_by('created_at')
+        UserService.fill_cached_users(comments)
         # comments = Comment.objects.filter(
         #     tweet_id=request.query_params['tweet_id']
         # ).prefetch_related('user').order_by('created_at')
         serializer = CommentSerializer(
             comments,
-            context={'request': request},
+            context={
+                'request': request,
+                'liked_object_ids': LikeService.get_liked_object_ids(
+                    request.user,
+                    comments,
+                ),
+                'counts': RedisHelper.get_counts(comments, ['likes_count']),
+            },
             many=True
         )
         return Response({'comments': serializer.data})
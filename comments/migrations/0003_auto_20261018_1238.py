@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0005_auto_20261018_1122'),
+        ('comments', '0002_comment_likes_count'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together={('created_at',), ('tweet', 'created_at')},
+        ),
+    ]
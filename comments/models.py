@@ -7,6 +7,7 @@ from django.db.models.signals import pre_delete, post_save
 from likes.models import Like
 from tweets.models import Tweet
 from utils.memcached.memcached_helper import MemcachedHelper
+from utils.sharding.shard_helper import ShardHelper
 
 
 class Comment(models.Model):
@@ -19,7 +20,8 @@ class Comment(models.Model):
     likes_count = models.IntegerField(default=0, null=True)
 
     class Meta:
-        index_together = (('tweet', 'created_at'),)
+        # created_at alone is read by reconcile_counters_task
+        index_together = (('tweet', 'created_at'), ('created_at',))
 
     def __str__(self):
         return '{} - {} says {} at tweet {}'.format(
@@ -31,13 +33,17 @@ class Comment(models.Model):
 
     @property
     def like_set(self):
-        return Like.objects.filter(
+        return ShardHelper.get_queryset(Like, self.id).filter(
             object_id=self.id,
             content_type=ContentType.objects.get_for_model(Comment)
         ).order_by('-created_at')
 
     @property
     def cached_user(self):
+        # filled for a whole page by UserService.fill_cached_users
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
+
         return UserService.get_user_through_memcached(self.user_id)
 
 
@@ -1,3 +1,4 @@
+from accounts.services import UserService
 from django.contrib.auth.models import User
 from django.utils.decorators import method_decorator
 from friendships.api.serializers import (
@@ -24,6 +25,7 @@ class FriendshipViewSet(viewsets.GenericViewSet):
     def followings(self, request, pk):
         friendships = Friendship.objects.filter(from_user=pk).order_by('-created_at')
         page = self.paginate_queryset(friendships)
+        UserService.fill_cached_users(page, 'to_user_id', '_cached_to_user')
         serializer = FollowingSerializer(
             page,
             context={'request': request},
@@ -37,6 +39,7 @@ class FriendshipViewSet(viewsets.GenericViewSet):
     def followers(self, request, pk):
         friendships = Friendship.objects.filter(to_user=pk).order_by('-created_at')
         page = self.paginate_queryset(friendships)
+        UserService.fill_cached_users(page, 'from_user_id', '_cached_from_user')
         serializer = FollowerSerializer(
             page,
             context={'request': request},
@@ -1,3 +1,22 @@
 def invalidate_following_cache(sender, instance, **kwargs):
     from friendships.services import FriendshipService
-    FriendshipService.invalidate_following_cache(instance.from_user_id)
\ No newline at end of file
+    from newsfeeds.services import NewsFeedService
+    FriendshipService.invalidate_following_cache(instance.from_user_id)
+    NewsFeedService.invalidate_pull_mode_following_ids(instance.from_user_id)
+
+def incr_follower_count(sender, instance, created, **kwargs):
+    from friendships.services import FriendshipService
+    if created and instance.to_user_id is not None:
+        FriendshipService.change_follower_count(instance.to_user_id, 1)
+
+def decr_follower_count(sender, instance, **kwargs):
+    from friendships.services import FriendshipService
+    if instance.to_user_id is not None:
+        FriendshipService.change_follower_count(instance.to_user_id, -1)
+
+def update_pull_mode(sender, instance, **kwargs):
+    # connected after the follower count is changed, and after the
+    # friendship is deleted
+    from newsfeeds.services import NewsFeedService
+    if instance.to_user_id is not None:
+        NewsFeedService.update_pull_mode(instance.to_user_id)
\ No newline at end of file
@@ -1,8 +1,13 @@
+from accounts.services import UserService
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import pre_delete, post_save
-from friendships.listeners import invalidate_following_cache
-from utils.memcached.memcached_helper import MemcachedHelper
+from django.db.models.signals import post_delete, pre_delete, post_save
+from friendships.listeners import (
+    decr_follower_count,
+    incr_follower_count,
+    invalidate_following_cache,
+    update_pull_mode,
+)
 
 
 class Friendship(models.Model):
@@ -32,12 +37,22 @@ class Friendship(models.Model):
 
     @property
     def cached_from_user(self):
-        return MemcachedHelper.get_object_through_memcached(User, self.from_user_id)
+        if hasattr(self, '_cached_from_user'):
+            return self._cached_from_user
+
+        return UserService.get_user_through_memcached(self.from_user_id)
 
     @property
     def cached_to_user(self):
-        return MemcachedHelper.get_object_through_memcached(User, self.to_user_id)
+        if hasattr(self, '_cached_to_user'):
+            return self._cached_to_user
+
+        return UserService.get_user_through_memcached(self.to_user_id)
 
 
 pre_delete.connect(invalidate_following_cache, sender=Friendship)
-post_save.connect(invalidate_following_cache, sender=Friendship)
\ No newline at end of file
+post_save.connect(invalidate_following_cache, sender=Friendship)
+post_delete.connect(decr_follower_count, sender=Friendship)
+post_save.connect(incr_follower_count, sender=Friendship)
+post_delete.connect(update_pull_mode, sender=Friendship)
+post_save.connect(update_pull_mode, sender=Friendship)
\ No newline at end of file
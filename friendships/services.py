@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.core.cache import caches
+from django.db.models import Count, Q
 from friendships.models import Friendship
-from twitter.cache import FOLLOWING_PATTERN
+from twitter.cache import FOLLOWER_COUNT_PATTERN, FOLLOWING_PATTERN
 
 cache = caches['testing'] if settings.TESTING else caches['default']
 
@@ -9,9 +10,81 @@ cache = caches['testing'] if settings.TESTING else caches['default']
 class FriendshipService:
 
     @classmethod
-    def get_follower_ids(cls, to_user_id):
-        friendships = Friendship.objects.filter(to_user_id=to_user_id)
-        return [friendship.from_user_id for friendship in friendships]
+    def iter_follower_id_batches(cls, to_user_id, batch_size):
+        # keyset pagination on the (to_user, created_at) index, id breaks
+        # the ties, so every batch is one index range scan and only one
+        # batch of ids is held in memory
+        queryset = Friendship.objects.filter(
+            to_user_id=to_user_id,
+            from_user__isnull=False,
+        ).order_by('created_at', 'id')
+        last_created_at, last_id = None, None
+        while True:
+            batch_queryset = queryset
+            if last_id is not None:
+                batch_queryset = queryset.filter(
+                    Q(created_at__gt=last_created_at) |
+                    Q(created_at=last_created_at, id__gt=last_id)
+                )
+            rows = list(batch_queryset.values_list(
+                'created_at',
+                'id',
+                'from_user_id',
+            )[:batch_size])
+            if not rows:
+                return
+
+            yield [from_user_id for _, _, from_user_id in rows]
+            if len(rows) < batch_size:
+                return
+            last_created_at, last_id, _ = rows[-1]
+
+    @classmethod
+    def get_follower_count(cls, to_user_id):
+        return cls.get_follower_counts([to_user_id])[to_user_id]
+
+    @classmethod
+    def get_follower_counts(cls, to_user_ids):
+        # one get_many for all users, one GROUP BY query for all cache misses
+        keys = {
+            FOLLOWER_COUNT_PATTERN.format(user_id=user_id): user_id
+            for user_id in to_user_ids
+        }
+        follower_counts = {
+            keys[key]: count
+            for key, count in cache.get_many(list(keys)).items()
+        }
+        missing_user_ids = [
+            user_id for user_id in keys.values()
+            if user_id not in follower_counts
+        ]
+        if not missing_user_ids:
+            return follower_counts
+
+        missing_counts = {user_id: 0 for user_id in missing_user_ids}
+        rows = Friendship.objects.filter(to_user_id__in=missing_user_ids).\
+            values('to_user_id').\
+            annotate(count=Count('id'))
+        for row in rows:
+            missing_counts[row['to_user_id']] = row['count']
+        cache.set_many({
+            FOLLOWER_COUNT_PATTERN.format(user_id=user_id): count
+            for user_id, count in missing_counts.items()
+        })
+        follower_counts.update(missing_counts)
+
+        return follower_counts
+
+    @classmethod
+    def change_follower_count(cls, to_user_id, delta):
+        # a follow or unfollow changes the cached count, the followers of a
+        # big account are not counted again on every change. A count that is
+        # not cached is counted from db when it is read
+        key = FOLLOWER_COUNT_PATTERN.format(user_id=to_user_id)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
 
     @classmethod
     def get_following_user_id_set_through_memcached(cls, from_user_id):
@@ -45,4 +45,22 @@ class FriendshipServiceTests(TestCase):
         self.assertEqual(
             user_id_set,
             set([self.user2.id, self.user3.id, user5.id]),
-        )
\ No newline at end of file
+        )
+
+    def test_iter_follower_id_batches(self):
+        followers = [self.create_user('follower{}'.format(i)) for i in range(5)]
+        for follower in followers:
+            self.create_friendship(follower, self.user1)
+        # friendships created at the same time are not skipped or repeated
+        created_at = Friendship.objects.first().created_at
+        Friendship.objects.filter(to_user=self.user1).update(created_at=created_at)
+
+        batches = list(FriendshipService.iter_follower_id_batches(self.user1.id, 2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(
+            sorted(user_id for batch in batches for user_id in batch),
+            sorted(follower.id for follower in followers),
+        )
+
+        batches = list(FriendshipService.iter_follower_id_batches(self.user2.id, 2))
+        self.assertEqual(batches, [])
\ No newline at end of file
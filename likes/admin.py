@@ -1,8 +1,9 @@
 from django.contrib import admin
 from likes.models import Like
+from utils.sharding.admin import ShardedModelAdmin
 
 
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(ShardedModelAdmin):
     date_hierarchy = 'created_at'
     list_display = ('object_id', 'content_type', 'user', 'created_at')
\ No newline at end of file
@@ -2,9 +2,23 @@ from accounts.api.serializers import UserSerializerForLike
 from comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
 from likes.models import Like
+from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.models import Tweet
+from utils.sharding.shard_helper import ShardHelper
+
+
+class LikedObjectIdSetMixin:
+
+    # context['liked_object_ids'] is filled by LikeService.get_liked_object_ids
+    # for a whole page, objects out of the page are checked one by one
+    def get_has_liked(self, obj):
+        liked_object_ids = self.context.get('liked_object_ids', {})
+        if obj.__class__ in liked_object_ids:
+            return obj.id in liked_object_ids[obj.__class__]
+
+        return LikeService.has_liked(self.context['request'].user, obj)
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -48,7 +62,7 @@ class LikeSerializerForCreate(BaseLikeSerializerForCreateAndCancel):
     def get_or_create(self):
         validated_data = self.validated_data
         model_class = self._get_model_class(validated_data)
-        return Like.objects.get_or_create(
+        return ShardHelper.get_queryset(Like, validated_data['object_id']).get_or_create(
             object_id=validated_data['object_id'],
             content_type=ContentType.objects.get_for_model(model_class),
             user=self.context['request'].user,
@@ -59,8 +73,9 @@ class LikeSerializerForCancel(BaseLikeSerializerForCreateAndCancel):
 
     def cancel(self):
         model_class = self._get_model_class(self.validated_data)
-        deleted, _ = Like.objects.filter(
-            object_id=self.validated_data['object_id'],
+        object_id = self.validated_data['object_id']
+        deleted, _ = ShardHelper.get_queryset(Like, object_id).filter(
+            object_id=object_id,
             content_type=ContentType.objects.get_for_model(model_class),
             user=self.context['request'].user,
         ).delete()
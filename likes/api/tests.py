@@ -1,5 +1,6 @@
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from utils.redis.redis_helper import RedisHelper
 
 LIKE_BASE_URL = '/api/likes/'
 LIKE_CANCEL_URL = '/api/likes/cancel/'
@@ -305,6 +306,8 @@ class LikeApiTests(TestCase):
         })
         response = self.anonymous_client.get(tweet_url)
         self.assertEqual(response.data['likes_count'], 1)
+        # counters are written to db by flush_counter_deltas_task
+        RedisHelper.flush_counter_deltas()
         tweet.refresh_from_db()
         self.assertEqual(tweet.likes_count, 1)
 
@@ -315,6 +318,7 @@ class LikeApiTests(TestCase):
         })
         response = self.anonymous_client.get(tweet_url)
         self.assertEqual(response.data['likes_count'], 2)
+        RedisHelper.flush_counter_deltas()
         tweet.refresh_from_db()
         self.assertEqual(tweet.likes_count, 2)
 
@@ -325,6 +329,7 @@ class LikeApiTests(TestCase):
         })
         response = self.anonymous_client.get(tweet_url)
         self.assertEqual(response.data['likes_count'], 1)
+        RedisHelper.flush_counter_deltas()
         tweet.refresh_from_db()
         self.assertEqual(tweet.likes_count, 1)
 
@@ -345,5 +350,6 @@ class LikeApiTests(TestCase):
         self.assertEqual(response.data['results'][0]['tweet']['likes_count'], 0)
         response = self.user2_client.get(NEWSFEED_LIST_URL)
         self.assertEqual(response.data['results'][0]['tweet']['likes_count'], 0)
+        RedisHelper.flush_counter_deltas()
         tweet.refresh_from_db()
         self.assertEqual(tweet.likes_count, 0)
\ No newline at end of file
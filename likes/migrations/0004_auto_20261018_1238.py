@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('likes', '0003_auto_20261018_1133'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='like',
+            index_together={('content_type', 'object_id', 'created_at'), ('content_type', 'created_at')},
+        ),
+    ]
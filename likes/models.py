@@ -1,28 +1,39 @@
 from accounts.services import UserService
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models.signals import pre_delete, post_save
 from likes.listeners import decr_likes_count, incr_likes_count
 from utils.memcached.memcached_helper import MemcachedHelper
+from utils.snowflake import generate_id
 
 
 class Like(models.Model):
-    object_id = models.IntegerField()
+    # rows are sharded by object_id, ids are unique over the shards
+    id = models.BigIntegerField(primary_key=True, default=generate_id, editable=False)
+    # tweet ids do not fit an int
+    object_id = models.BigIntegerField()
     content_type = models.ForeignKey(
         ContentType,
         on_delete=models.SET_NULL,
-        null=True
+        null=True,
+        db_constraint=False,
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        db_constraint=False,
     )
-    # content_object not save in db
-    content_object = GenericForeignKey('content_type', 'object_id')
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = (('user', 'content_type', 'object_id'),)
-        index_together = (('content_type', 'object_id', 'created_at'),)
+        index_together = (
+            ('content_type', 'object_id', 'created_at'),
+            # recent likes of a content type, read by reconcile_counters_task
+            ('content_type', 'created_at'),
+        )
 
     def __str__(self):
         return '{} - {} liked {} {}'.format(
@@ -32,8 +43,18 @@ class Like(models.Model):
             self.object_id,
         )
 
+    @property
+    def content_object(self):
+        # the liked tweet or comment. Not a GenericForeignKey, it would read
+        # content types and targets from the shard of the like
+        return self.content_type.get_object_for_this_type(id=self.object_id)
+
     @property
     def cached_user(self):
+        # filled for a whole page by UserService.fill_cached_users
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
+
         return UserService.get_user_through_memcached(self.user_id)
 
 
@@ -1,5 +1,8 @@
+from collections import defaultdict
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
 from likes.models import Like
+from utils.sharding.shard_helper import ShardHelper
 
 
 class LikeService:
@@ -9,8 +12,62 @@ class LikeService:
         if user.is_anonymous:
             return False
 
-        return Like.objects.filter(
+        return ShardHelper.get_queryset(Like, target.id).filter(
             object_id=target.id,
             content_type=ContentType.objects.get_for_model(target.__class__),
             user=user,
-        ).exists()
\ No newline at end of file
+        ).exists()
+
+    @classmethod
+    def get_liked_object_ids(cls, user, targets):
+        # {model_class: set of liked object ids}, one query per content type
+        # and database
+        object_ids = defaultdict(set)
+        for target in targets:
+            if target is not None:
+                object_ids[target.__class__].add(target.id)
+
+        liked_object_ids = {}
+        for model_class, ids in object_ids.items():
+            if user.is_anonymous:
+                liked_object_ids[model_class] = set()
+                continue
+
+            content_type = ContentType.objects.get_for_model(model_class)
+            liked_object_ids[model_class] = set()
+            for database, shard_ids in ShardHelper.group_by_database(ids).items():
+                liked_object_ids[model_class].update(Like.objects.using(database).filter(
+                    object_id__in=shard_ids,
+                    content_type=content_type,
+                    user=user,
+                ).values_list('object_id', flat=True))
+
+        return liked_object_ids
+
+    @classmethod
+    def get_recently_liked_object_ids(cls, model_class, since):
+        # not scoped by object_id, every database is read
+        content_type = ContentType.objects.get_for_model(model_class)
+        return set(
+            like.object_id for like in ShardHelper.fan_in(
+                Like,
+                lambda queryset: queryset.filter(
+                    content_type=content_type,
+                    created_at__gte=since,
+                ).only('object_id'),
+            )
+        )
+
+    @classmethod
+    def get_likes_counts(cls, model_class, object_ids):
+        # {object id: number of likes} with one GROUP BY query per database
+        likes_counts = {object_id: 0 for object_id in object_ids}
+        content_type = ContentType.objects.get_for_model(model_class)
+        for database, shard_ids in ShardHelper.group_by_database(object_ids).items():
+            queryset = Like.objects.using(database).filter(
+                content_type=content_type,
+                object_id__in=shard_ids,
+            ).values('object_id').annotate(count=Count('id'))
+            for row in queryset:
+                likes_counts[row['object_id']] = row['count']
+        return likes_counts
\ No newline at end of file
@@ -0,0 +1,40 @@
+from comments.models import Comment
+from django.contrib.auth.models import AnonymousUser
+from likes.services import LikeService
+from testing.testcases import TestCase
+from tweets.models import Tweet
+
+
+class LikeServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user1 = self.create_user('testuser1')
+        self.user2 = self.create_user('testuser2')
+
+    def test_get_liked_object_ids(self):
+        tweets = [self.create_tweet(self.user1) for _ in range(3)]
+        comments = [self.create_comment(self.user1, tweets[0]) for _ in range(2)]
+        self.create_like(self.user2, tweets[0])
+        self.create_like(self.user2, tweets[2])
+        self.create_like(self.user2, comments[1])
+        self.create_like(self.user1, tweets[1])
+
+        # one query per content type
+        with self.assertNumQueries(2):
+            liked_object_ids = LikeService.get_liked_object_ids(
+                self.user2,
+                tweets + comments,
+            )
+        self.assertEqual(liked_object_ids, {
+            Tweet: {tweets[0].id, tweets[2].id},
+            Comment: {comments[1].id},
+        })
+
+        # anonymous user has not liked anything
+        with self.assertNumQueries(0):
+            liked_object_ids = LikeService.get_liked_object_ids(
+                AnonymousUser(),
+                tweets,
+            )
+        self.assertEqual(liked_object_ids, {Tweet: set()})
\ No newline at end of file
@@ -1,8 +1,15 @@
 from django.contrib import admin
-from newsfeeds.models import NewsFeed
+from newsfeeds.models import NewsFeed, PullModeAuthor
+from utils.sharding.admin import ShardedModelAdmin
 
 
 @admin.register(NewsFeed)
-class NewsFeedAdmin(admin.ModelAdmin):
+class NewsFeedAdmin(ShardedModelAdmin):
     date_hierarchy = 'created_at'
-    list_display = ('user', 'tweet', 'created_at')
\ No newline at end of file
+    list_display = ('user', 'tweet', 'created_at')
+
+
+@admin.register(PullModeAuthor)
+class PullModeAuthorAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    list_display = ('user', 'created_at')
\ No newline at end of file
@@ -1,11 +1,14 @@
 from django.conf import settings
+from newsfeeds.constants import PULL_MODE_FOLLOWERS_THRESHOLD
 from newsfeeds.models import NewsFeed
 from newsfeeds.services import NewsFeedService
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 from utils.paginations.endless_paginations import EndlessPagination
+from utils.sharding.shard_helper import ShardHelper
 
 NEWSFEEDS_URL = '/api/newsfeeds/'
+NEWSFEEDS_NEW_COUNT_URL = '/api/newsfeeds/new_count/'
 POST_TWEETS_URL = '/api/tweets/'
 
 
@@ -39,7 +42,7 @@ class NewsFeedApiTests(TestCase):
             response.data['results'][0]['tweet']['user']['username'],
             'testuser1'
         )
-        self.assertEqual(NewsFeed.objects.count(), 1)
+        self.assertEqual(ShardHelper.count(NewsFeed), 1)
 
         # user1 follow user2 and user2 post a tweet
         self.create_friendship(self.user1, self.user2)
@@ -51,7 +54,7 @@ class NewsFeedApiTests(TestCase):
             response.data['results'][0]['tweet']['user']['username'],
             'testuser2'
         )
-        self.assertEqual(NewsFeed.objects.count(), 3)
+        self.assertEqual(ShardHelper.count(NewsFeed), 3)
 
     def test_endless_pagination(self):
         page_size = EndlessPagination.page_size
@@ -113,6 +116,14 @@ class NewsFeedApiTests(TestCase):
         self.assertEqual(response.data['results'][0]['id'], new_newsfeed.id)
         self.assertEqual(response.data['has_next_page'], False)
 
+        # pages mix newsfeeds and pulled tweets, id cursors are rejected
+        for param in ['id__lt', 'id__gt']:
+            response = self.user1_client.get(NEWSFEEDS_URL, {
+                param: new_newsfeed.id,
+            })
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(param, response.data)
+
     def test_user_in_memcached(self):
         profile = self.user1.profile
         profile.nickname = 'user1_nickname'
@@ -214,7 +225,9 @@ class NewsFeedApiTests(TestCase):
         # only cache limited objects
         cached_newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(self.user1.id)
         self.assertEqual(len(cached_newsfeeds), list_limit)
-        queryset = NewsFeed.objects.filter(user_id=self.user1.id)
+        queryset = ShardHelper.get_queryset(NewsFeed, self.user1.id).filter(
+            user_id=self.user1.id,
+        )
         self.assertEqual(len(queryset), list_limit + page_size)
 
         # test through api
@@ -237,4 +250,92 @@ class NewsFeedApiTests(TestCase):
 
         # cache expired
         self.clear_cache()
-        _test_newsfeeds_after_new_feed_pushed()
\ No newline at end of file
+        _test_newsfeeds_after_new_feed_pushed()
+
+    def test_pull_mode_newsfeeds_pagination(self):
+        list_limit = settings.REDIS_LIST_LENGTH_LIMIT
+        page_size = EndlessPagination.page_size
+        celebrity = self.create_user('celebrity')
+        self.create_friendship(self.user1, celebrity)
+        for i in range(PULL_MODE_FOLLOWERS_THRESHOLD):
+            self.create_friendship(self.create_user('fan{}'.format(i)), celebrity)
+
+        tweet_ids = []
+        for i in range(list_limit + page_size):
+            if i % 2:
+                tweet = self.create_tweet(celebrity)
+            else:
+                tweet = self.create_tweet(self.user2)
+                self.create_newsfeed(self.user1, tweet)
+            tweet_ids.append(tweet.id)
+        tweet_ids = tweet_ids[::-1]
+
+        results = self._paginate_to_get_all_newsfeeds(self.user1_client)
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            tweet_ids,
+        )
+
+        # cache expired
+        self.clear_cache()
+        results = self._paginate_to_get_all_newsfeeds(self.user1_client)
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            tweet_ids,
+        )
+
+    def test_new_since(self):
+        celebrity = self.create_user('celebrity')
+        self.create_friendship(self.user1, celebrity)
+        for i in range(PULL_MODE_FOLLOWERS_THRESHOLD):
+            self.create_friendship(self.create_user('fan{}'.format(i)), celebrity)
+        cursor = self.create_newsfeed(self.user1, self.create_tweet(self.user2)).created_at
+
+        tweet_ids = []
+        for i in range(10):
+            if i % 2:
+                tweet = self.create_tweet(celebrity)
+            else:
+                tweet = self.create_tweet(self.user2)
+                self.create_newsfeed(self.user1, tweet)
+            tweet_ids.append(tweet.id)
+        tweet_ids = tweet_ids[::-1]
+
+        response = self.user1_client.get(NEWSFEEDS_NEW_COUNT_URL)
+        self.assertEqual(response.status_code, 400)
+        response = self.user1_client.get(NEWSFEEDS_NEW_COUNT_URL, {
+            'created_at__gt': 'abc',
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.user1_client.get(NEWSFEEDS_NEW_COUNT_URL, {
+            'created_at__gt': cursor,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'count': 10, 'has_gap': False})
+
+        # only the newest page is returned, the client jumps to the top
+        response = self.user1_client.get(NEWSFEEDS_URL, {
+            'created_at__gt': cursor,
+            'page_size': 3,
+        })
+        self.assertEqual(
+            [result['tweet']['id'] for result in response.data['results']],
+            tweet_ids[:3],
+        )
+        self.assertEqual(response.data['has_gap'], True)
+        self.assertEqual(response.data['has_next_page'], False)
+
+        response = self.user1_client.get(NEWSFEEDS_URL, {
+            'created_at__gt': cursor,
+        })
+        self.assertEqual(
+            [result['tweet']['id'] for result in response.data['results']],
+            tweet_ids,
+        )
+        self.assertEqual(response.data['has_gap'], False)
+
+        newest = response.data['results'][0]['created_at']
+        response = self.user1_client.get(NEWSFEEDS_NEW_COUNT_URL, {
+            'created_at__gt': newest,
+        })
+        self.assertEqual(response.data, {'count': 0, 'has_gap': False})
\ No newline at end of file
@@ -1,11 +1,19 @@
+from accounts.services import UserService
 from django.utils.decorators import method_decorator
+from functools import partial
+from likes.services import LikeService
 from newsfeeds.api.serializers import NewsFeedSerializer
 from newsfeeds.models import NewsFeed
 from newsfeeds.services import NewsFeedService
 from ratelimit.decorators import ratelimit
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from tweets.services import TweetService
+from utils.decorators import required_param
 from utils.paginations.endless_paginations import EndlessPagination
+from utils.redis.redis_helper import RedisHelper
 
 
 class NewsFeedViewSet(viewsets.GenericViewSet):
@@ -15,17 +23,51 @@ class NewsFeedViewSet(viewsets.GenericViewSet):
 
     @method_decorator(ratelimit(key='user', rate='5/s', method='GET', block=True))
     def list(self, request):
-        cached_newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(request.user.id)
-        newsfeeds = self.paginator.get_paginated_cached_list_in_redis(
-            cached_newsfeeds,
-            request
+        newsfeeds = self.paginator.paginate_load_page(
+            partial(NewsFeedService.get_cached_newsfeeds_page, request.user.id),
+            request,
         )
         if newsfeeds == None:
-            queryset = NewsFeed.objects.filter(user=request.user)
-            newsfeeds = self.paginate_queryset(queryset)
+            newsfeeds = self.paginator.paginate_load_page(
+                partial(NewsFeedService.get_newsfeeds_page, request.user.id),
+                request,
+            )
+        NewsFeedService.fill_cached_tweets(newsfeeds)
+        tweets = [newsfeed.cached_tweet for newsfeed in newsfeeds]
+        UserService.fill_cached_users(tweets)
         serializer = NewsFeedSerializer(
             newsfeeds,
-            context={'request': request},
+            context={
+                'request': request,
+                'liked_object_ids': LikeService.get_liked_object_ids(
+                    request.user,
+                    tweets,
+                ),
+                'counts': RedisHelper.get_counts(
+                    tweets,
+                    ['likes_count', 'comments_count'],
+                ),
+                'photo_urls': TweetService.get_photo_urls(tweets),
+            },
             many=True
         )
-        return self.get_paginated_response(serializer.data)
\ No newline at end of file
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['GET'], detail=False)
+    @required_param(method='GET', params=['created_at__gt'])
+    @method_decorator(ratelimit(key='user', rate='5/s', method='GET', block=True))
+    def new_count(self, request):
+        # polled by clients to show "n new tweets", no tweet is read
+        _, created_at__gt = self.paginator.get_cursor(
+            request,
+            'gt',
+            fields=('created_at',),
+        )
+        count, has_gap = NewsFeedService.count_new_cached_newsfeeds(
+            request.user.id,
+            created_at__gt,
+        )
+        return Response({
+            'count': count,
+            'has_gap': has_gap,
+        })
\ No newline at end of file
@@ -1,3 +1,12 @@
 from django.conf import settings
 
-FANOUT_BATCH_SIZE = 100 if not settings.TESTING else 3
\ No newline at end of file
+FANOUT_BATCH_SIZE = 100 if not settings.TESTING else 3
+# authors with more followers than this are not fanned out (pull mode),
+# their tweets are merged into the readers' newsfeeds at read time
+PULL_MODE_FOLLOWERS_THRESHOLD = 10000 if not settings.TESTING else 5
+# pull mode authors go back to push mode only under this many followers, an
+# author around the threshold does not switch on every follow and unfollow
+PUSH_MODE_FOLLOWERS_THRESHOLD = 9000 if not settings.TESTING else 3
+# the newest tweets posted in pull mode are fanned out when an author goes
+# back to push mode, they are not pulled by the followers any more
+PULL_MODE_BACKFILL_LIMIT = 200 if not settings.TESTING else 20
\ No newline at end of file
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from newsfeeds.constants import PULL_MODE_FOLLOWERS_THRESHOLD
+import django.db.models.deletion
+
+
+def create_pull_mode_authors(apps, schema_editor):
+    # authors already over the threshold stay in pull mode
+    Friendship = apps.get_model('friendships', 'Friendship')
+    PullModeAuthor = apps.get_model('newsfeeds', 'PullModeAuthor')
+    rows = Friendship.objects.filter(to_user__isnull=False).\
+        values('to_user_id').\
+        annotate(count=Count('id')).\
+        filter(count__gt=PULL_MODE_FOLLOWERS_THRESHOLD)
+    PullModeAuthor.objects.bulk_create([
+        PullModeAuthor(user_id=row['to_user_id'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('friendships', '0001_initial'),
+        ('newsfeeds', '0003_auto_20261018_1133'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PullModeAuthor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(create_pull_mode_authors, migrations.RunPython.noop),
+    ]
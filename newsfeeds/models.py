@@ -4,12 +4,25 @@ from django.db.models.signals import post_save
 from newsfeeds.listeners import push_newsfeed_to_redis
 from tweets.models import Tweet
 from utils.memcached.memcached_helper import MemcachedHelper
+from utils.snowflake import generate_id
 
 
 class NewsFeed(models.Model):
+    id = models.BigIntegerField(primary_key=True, default=generate_id, editable=False)
     # who is able to see this tweet
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    tweet = models.ForeignKey(Tweet, on_delete=models.SET_NULL, null=True)
+    # rows are sharded by user_id, users and tweets are on another database
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        db_constraint=False,
+    )
+    tweet = models.ForeignKey(
+        Tweet,
+        on_delete=models.SET_NULL,
+        null=True,
+        db_constraint=False,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -22,7 +35,22 @@ class NewsFeed(models.Model):
 
     @property
     def cached_tweet(self):
+        # filled for a whole page by NewsFeedService.fill_cached_tweets
+        if hasattr(self, '_cached_tweet'):
+            return self._cached_tweet
+
         return MemcachedHelper.get_object_through_memcached(Tweet, self.tweet_id)
 
 
+
+class PullModeAuthor(models.Model):
+    # authors whose tweets are not fanned out, their followers pull them at
+    # read time. created_at is when the author switched to pull mode
+    user = models.OneToOneField(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{} is in pull mode since {}'.format(self.user, self.created_at)
+
+
 post_save.connect(push_newsfeed_to_redis, sender=NewsFeed)
\ No newline at end of file
@@ -1,7 +1,35 @@
-from newsfeeds.models import NewsFeed
-from newsfeeds.tasks import fanout_newsfeeds_main_task
-from twitter.cache import USER_NEWSFEEDS_PATTERN
+from bisect import bisect_left, bisect_right
+from django.conf import settings
+from django.core.cache import caches
+from friendships.services import FriendshipService
+from heapq import merge
+from newsfeeds.constants import (
+    PULL_MODE_FOLLOWERS_THRESHOLD,
+    PUSH_MODE_FOLLOWERS_THRESHOLD,
+)
+from newsfeeds.models import NewsFeed, PullModeAuthor
+from newsfeeds.storages import get_newsfeed_storage
+from newsfeeds.tasks import backfill_pull_mode_tweets_task, fanout_newsfeeds_main_task
+from tweets.models import Tweet
+from tweets.services import TweetService
+from twitter.cache import (
+    PULL_MODE_AUTHORS_KEY,
+    PULL_MODE_FOLLOWINGS_PATTERN,
+    USER_NEWSFEEDS_PATTERN,
+)
+from utils.memcached.memcached_helper import MemcachedHelper
 from utils.redis.redis_helper import RedisHelper
+from utils.redis.redis_serializers import DjangoModelIdSerializer, get_reverse_keys
+from utils.time_helpers import datetime_to_score, score_to_datetime
+import uuid
+
+cache = caches['testing'] if settings.TESTING else caches['default']
+
+
+class NewsFeedIdSerializer(DjangoModelIdSerializer):
+    # user_id is known from the key, only (id, tweet_id) is cached
+    model_class = NewsFeed
+    id_fields = ('id', 'tweet_id')
 
 
 class NewsFeedService:
@@ -10,14 +38,255 @@ class NewsFeedService:
     def fanout_to_followers(cls, tweet):
         fanout_newsfeeds_main_task.delay(tweet.id, tweet.user_id)
 
+    @classmethod
+    def get_pull_mode_authors(cls):
+        # (version, ids) of the authors in pull mode, a new version is set
+        # whenever an author switches mode
+        authors = cache.get(PULL_MODE_AUTHORS_KEY)
+        if authors is None:
+            authors = cls.reset_pull_mode_authors()
+        return authors
+
+    @classmethod
+    def reset_pull_mode_authors(cls):
+        # the users' cached pull mode followings of older versions are
+        # rebuilt when they are read
+        author_ids = frozenset(
+            PullModeAuthor.objects.filter(user__isnull=False).
+            values_list('user_id', flat=True)
+        )
+        authors = (uuid.uuid4().hex, author_ids)
+        cache.set(PULL_MODE_AUTHORS_KEY, authors)
+        return authors
+
+    @classmethod
+    def is_pull_mode_author(cls, user_id):
+        _, author_ids = cls.get_pull_mode_authors()
+        return user_id in author_ids
+
+    @classmethod
+    def update_pull_mode(cls, user_id):
+        # called when the followers of user_id change. An author switches to
+        # pull mode over PULL_MODE_FOLLOWERS_THRESHOLD followers and back
+        # under PUSH_MODE_FOLLOWERS_THRESHOLD, the tweets posted in pull
+        # mode are then fanned out since nobody pulls them any more. Both the
+        # follower count and the authors are cached, db is only read when
+        # the mode changes. Concurrent follows and unfollows may both see
+        # the change, only one of them creates or deletes the row
+        follower_count = FriendshipService.get_follower_count(user_id)
+        if not cls.is_pull_mode_author(user_id):
+            if follower_count > PULL_MODE_FOLLOWERS_THRESHOLD:
+                PullModeAuthor.objects.get_or_create(user_id=user_id)
+                cls.reset_pull_mode_authors()
+            return
+
+        if follower_count >= PUSH_MODE_FOLLOWERS_THRESHOLD:
+            return
+        pull_mode_author = PullModeAuthor.objects.filter(user_id=user_id).first()
+        deleted = 0
+        if pull_mode_author is not None:
+            deleted, _ = PullModeAuthor.objects.filter(id=pull_mode_author.id).delete()
+        cls.reset_pull_mode_authors()
+        if deleted:
+            backfill_pull_mode_tweets_task.delay(
+                user_id,
+                datetime_to_score(pull_mode_author.created_at),
+            )
+
+    @classmethod
+    def get_pull_mode_following_ids(cls, user_id):
+        # one get_many for the authors and the user's cached list, the list
+        # is rebuilt from the following set when an author switched mode
+        key = PULL_MODE_FOLLOWINGS_PATTERN.format(user_id=user_id)
+        values = cache.get_many([PULL_MODE_AUTHORS_KEY, key])
+        authors = values.get(PULL_MODE_AUTHORS_KEY) or cls.reset_pull_mode_authors()
+        version, author_ids = authors
+        if key in values and values[key][0] == version:
+            return values[key][1]
+
+        following_ids = FriendshipService.get_following_user_id_set_through_memcached(
+            user_id,
+        )
+        pull_mode_following_ids = sorted(author_ids & following_ids)
+        cache.set(key, (version, pull_mode_following_ids))
+        return pull_mode_following_ids
+
+    @classmethod
+    def invalidate_pull_mode_following_ids(cls, user_id):
+        key = PULL_MODE_FOLLOWINGS_PATTERN.format(user_id=user_id)
+        cache.delete(key)
+
+    @classmethod
+    def create_newsfeed(cls, user_id, tweet_id):
+        newsfeed = get_newsfeed_storage().create(user_id, tweet_id)
+        cls.push_newsfeeds_to_redis(newsfeed)
+        return newsfeed
+
+    @classmethod
+    def get_newsfeeds_page(
+        cls,
+        user_id,
+        created_at__gt=None,
+        created_at__lt=None,
+        count=None,
+    ):
+        # used when the cached newsfeeds are not enough for the page, reads
+        # the newsfeed storage and the tweets of pull mode authors. Nothing
+        # is missing, so the horizon is always None
+        newsfeeds = get_newsfeed_storage().get_newsfeeds(
+            user_id,
+            created_at__gt=created_at__gt,
+            created_at__lt=created_at__lt,
+            count=count,
+        )
+        pull_mode_user_ids = cls.get_pull_mode_following_ids(user_id)
+        if not pull_mode_user_ids:
+            return newsfeeds, None
+
+        tweets = Tweet.objects.filter(user_id__in=pull_mode_user_ids)
+        if created_at__gt is not None:
+            tweets = tweets.filter(created_at__gt=created_at__gt)
+        if created_at__lt is not None:
+            tweets = tweets.filter(created_at__lt=created_at__lt)
+        tweets = tweets.order_by('-created_at')
+        if count is not None:
+            tweets = tweets[:count]
+        merged_list = merge(
+            newsfeeds,
+            tweets,
+            key=lambda obj: obj.created_at,
+            reverse=True,
+        )
+        return cls.tweets_to_newsfeeds(user_id, merged_list)[:count], None
+
+    @classmethod
+    def tweets_to_newsfeeds(cls, user_id, objects):
+        # pulled tweets are wrapped into unsaved newsfeeds (id is None), a
+        # tweet that is also in the pushed newsfeeds is only returned once
+        newsfeeds = []
+        tweet_ids = set()
+        for obj in objects:
+            if isinstance(obj, Tweet):
+                obj = NewsFeed(
+                    id=None,
+                    user_id=user_id,
+                    tweet_id=obj.id,
+                    created_at=obj.created_at,
+                )
+            if obj.tweet_id in tweet_ids:
+                continue
+            tweet_ids.add(obj.tweet_id)
+            newsfeeds.append(obj)
+
+        return newsfeeds
+
+    @classmethod
+    def fill_cached_tweets(cls, newsfeeds):
+        # hydrate the tweets of a page with one memcached get_many
+        tweets = MemcachedHelper.get_objects_through_memcached(
+            Tweet,
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+        )
+        for newsfeed in newsfeeds:
+            setattr(newsfeed, '_cached_tweet', tweets.get(newsfeed.tweet_id))
+
+        return newsfeeds
+
     @classmethod
     def get_cached_newsfeeds_from_redis(cls, user_id):
-        queryset = NewsFeed.objects.filter(user_id=user_id)
+        newsfeeds, _ = cls.get_cached_newsfeeds_page(user_id)
+        return newsfeeds
+
+    @classmethod
+    def get_cached_newsfeeds_page(
+        cls,
+        user_id,
+        created_at__gt=None,
+        created_at__lt=None,
+        count=None,
+    ):
+        # returns the cached newsfeeds in the range and the created_at under
+        # which the cache may miss newsfeeds (None if nothing is missing)
+        queryset = get_newsfeed_storage().filter(user_id)
         key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
-        return RedisHelper.load_objects(key, queryset)
+        newsfeeds, horizon = RedisHelper.load_sorted_objects(
+            key,
+            queryset,
+            NewsFeedIdSerializer,
+            created_at__gt=created_at__gt,
+            created_at__lt=created_at__lt,
+            count=count,
+        )
+        for newsfeed in newsfeeds:
+            newsfeed.user_id = user_id
+
+        pull_mode_user_ids = cls.get_pull_mode_following_ids(user_id)
+        if not pull_mode_user_ids:
+            return newsfeeds, horizon
+
+        cached_lists = [newsfeeds]
+        horizons = [] if horizon is None else [horizon]
+        for pull_mode_user_id in pull_mode_user_ids:
+            tweets = TweetService.get_cached_tweets_from_redis(pull_mode_user_id)
+            if len(tweets) >= settings.REDIS_LIST_LENGTH_LIMIT:
+                horizons.append(tweets[-1].created_at)
+            # only the tweets of the page are deserialized
+            reverse_timestamps = get_reverse_keys(tweets)
+            start, end = 0, len(tweets)
+            if created_at__lt is not None:
+                start = bisect_right(reverse_timestamps, -datetime_to_score(created_at__lt))
+            if created_at__gt is not None:
+                end = bisect_left(reverse_timestamps, -datetime_to_score(created_at__gt))
+            if count is not None:
+                end = min(end, start + count)
+            cached_lists.append(tweets[start:end])
+        merged_list = merge(
+            *cached_lists,
+            key=lambda obj: obj.created_at,
+            reverse=True,
+        )
+        newsfeeds = cls.tweets_to_newsfeeds(user_id, merged_list)[:count]
+
+        return newsfeeds, max(horizons) if horizons else None
+
+    @classmethod
+    def count_new_cached_newsfeeds(cls, user_id, created_at__gt):
+        # returns how many newsfeeds are newer than created_at__gt and if
+        # the count may miss some (the cursor is under a horizon), counted
+        # with ZCOUNT and the timestamps of pull mode authors' cached tweets
+        queryset = get_newsfeed_storage().filter(user_id)
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
+        count, horizon = RedisHelper.count_sorted_objects(
+            key,
+            queryset,
+            NewsFeedIdSerializer,
+            created_at__gt,
+        )
+        horizons = [] if horizon is None else [horizon]
+        for pull_mode_user_id in cls.get_pull_mode_following_ids(user_id):
+            tweets = TweetService.get_cached_tweets_from_redis(pull_mode_user_id)
+            reverse_timestamps = get_reverse_keys(tweets)
+            if len(tweets) >= settings.REDIS_LIST_LENGTH_LIMIT:
+                horizons.append(score_to_datetime(-reverse_timestamps[-1]))
+            count += bisect_left(reverse_timestamps, -datetime_to_score(created_at__gt))
+
+        return count, any(created_at__gt < horizon for horizon in horizons)
 
     @classmethod
     def push_newsfeeds_to_redis(cls, newsfeed):
-        queryset = NewsFeed.objects.filter(user_id=newsfeed.user_id)
+        queryset = get_newsfeed_storage().filter(newsfeed.user_id)
         key = USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id)
-        RedisHelper.push_object(key, newsfeed, queryset)
\ No newline at end of file
+        RedisHelper.push_sorted_object(key, newsfeed, queryset, NewsFeedIdSerializer)
+
+    @classmethod
+    def push_newsfeeds_to_cached_redis(cls, newsfeeds):
+        # followers whose newsfeeds are not cached are skipped, their cache
+        # is rebuilt from db when they read the newsfeeds next time
+        key_newsfeed_pairs = [
+            (USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id), newsfeed)
+            for newsfeed in newsfeeds
+        ]
+        return RedisHelper.push_sorted_objects_if_cached(
+            key_newsfeed_pairs,
+            NewsFeedIdSerializer,
+        )
\ No newline at end of file
@@ -0,0 +1,183 @@
+from abc import ABC, abstractmethod
+from django.conf import settings
+from newsfeeds.models import NewsFeed
+from utils.sharding.shard_helper import ShardHelper
+from utils.time_helpers import (
+    ONE_MICROSECOND,
+    datetime_to_score,
+    score_to_datetime,
+    utc_now,
+)
+from utils.wide_column.wide_column_client import WideColumnClient
+import struct
+
+# row key of a newsfeed in the wide column table: user_id, then the
+# reversed created_at score so a user's newest newsfeeds come first, then
+# tweet_id so two newsfeeds of the same microsecond do not collide
+ROW_KEY_FORMAT = '>QQQ'
+ROW_PREFIX_FORMAT = '>QQ'
+USER_PREFIX_FORMAT = '>Q'
+MAX_SCORE = 2 ** 63 - 1
+
+
+class NewsFeedStorage(ABC):
+    # where newsfeed rows are kept, see get_newsfeed_storage. Writes do not
+    # push to redis, NewsFeedService does it
+
+    def create(self, user_id, tweet_id):
+        return self.bulk_create([user_id], tweet_id)[0]
+
+    @abstractmethod
+    def bulk_create(self, user_ids, tweet_id, created_at=None):
+        # created_at is now unless given, newsfeeds that already exist are
+        # kept when it is given (a backfill may run twice)
+        pass
+
+    @abstractmethod
+    def get_newsfeeds(self, user_id, created_at__gt=None, created_at__lt=None, count=None):
+        # the newsfeeds of a user in the range, newest first
+        pass
+
+    def filter(self, user_id):
+        # the newsfeeds of a user, newest first and sliced like a queryset,
+        # what RedisHelper loads the cache from
+        return NewsFeedRange(self, user_id)
+
+
+class NewsFeedRange:
+
+    def __init__(self, storage, user_id):
+        self.storage = storage
+        self.user_id = user_id
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.start or index.step:
+            raise TypeError('only [:count] is supported')
+        return self.storage.get_newsfeeds(self.user_id, count=index.stop)
+
+    def __iter__(self):
+        return iter(self.storage.get_newsfeeds(self.user_id))
+
+
+class MySQLNewsFeedStorage(NewsFeedStorage):
+    # the newsfeeds_newsfeed table, sharded by user_id over SHARD_DATABASES
+
+    def bulk_create(self, user_ids, tweet_id, created_at=None):
+        # ids are generated before the insert, bulk_create sets them. One
+        # insert per database
+        newsfeeds = []
+        for database, shard_user_ids in ShardHelper.group_by_database(user_ids).items():
+            shard_newsfeeds = [
+                NewsFeed(user_id=user_id, tweet_id=tweet_id)
+                for user_id in shard_user_ids
+            ]
+            NewsFeed.objects.using(database).bulk_create(
+                shard_newsfeeds,
+                ignore_conflicts=created_at is not None,
+            )
+            if created_at is not None:
+                # auto_now_add overrides created_at on insert
+                NewsFeed.objects.using(database).filter(
+                    id__in=[newsfeed.id for newsfeed in shard_newsfeeds],
+                ).update(created_at=created_at)
+                # rows that were already there keep their id, the ignored
+                # ones were never inserted with the id bulk_create gave them
+                shard_newsfeeds = list(NewsFeed.objects.using(database).filter(
+                    user_id__in=shard_user_ids,
+                    tweet_id=tweet_id,
+                ))
+            newsfeeds.extend(shard_newsfeeds)
+        return newsfeeds
+
+    def get_newsfeeds(self, user_id, created_at__gt=None, created_at__lt=None, count=None):
+        queryset = self.filter(user_id)
+        if created_at__gt is not None:
+            queryset = queryset.filter(created_at__gt=created_at__gt)
+        if created_at__lt is not None:
+            queryset = queryset.filter(created_at__lt=created_at__lt)
+        queryset = queryset.order_by('-created_at')
+        if count is not None:
+            queryset = queryset[:count]
+        return list(queryset)
+
+    def filter(self, user_id):
+        return ShardHelper.get_queryset(NewsFeed, user_id).filter(user_id=user_id)
+
+
+class WideColumnNewsFeedStorage(NewsFeedStorage):
+    # one row per newsfeed in a row key ordered table, a page of a user's
+    # newsfeeds is one scan of consecutive rows
+    table_name = 'newsfeeds'
+
+    def get_table(self):
+        return WideColumnClient.get_table(self.table_name)
+
+    def get_row_key(self, newsfeed):
+        return struct.pack(
+            ROW_KEY_FORMAT,
+            newsfeed.user_id,
+            MAX_SCORE - datetime_to_score(newsfeed.created_at),
+            newsfeed.tweet_id,
+        )
+
+    def get_row_prefix(self, user_id, created_at):
+        return struct.pack(
+            ROW_PREFIX_FORMAT,
+            user_id,
+            MAX_SCORE - datetime_to_score(created_at),
+        )
+
+    def from_row(self, row_key, columns):
+        user_id, reversed_score, tweet_id = struct.unpack(ROW_KEY_FORMAT, row_key)
+        return NewsFeed(
+            id=columns['id'],
+            user_id=user_id,
+            tweet_id=tweet_id,
+            created_at=score_to_datetime(MAX_SCORE - reversed_score),
+        )
+
+    def bulk_create(self, user_ids, tweet_id, created_at=None):
+        # rows of a backfill that already exist keep their id, only the
+        # missing ones are written
+        is_backfill = created_at is not None
+        created_at = created_at or utc_now()
+        newsfeeds = [
+            NewsFeed(user_id=user_id, tweet_id=tweet_id, created_at=created_at)
+            for user_id in user_ids
+        ]
+        rows = {self.get_row_key(newsfeed): newsfeed for newsfeed in newsfeeds}
+        existing_rows = {}
+        if is_backfill:
+            existing_rows = self.get_table().get_many(rows.keys())
+        for row_key, columns in existing_rows.items():
+            rows[row_key].id = columns['id']
+        self.get_table().put_many(
+            (row_key, {'id': newsfeed.id})
+            for row_key, newsfeed in rows.items()
+            if row_key not in existing_rows
+        )
+        return newsfeeds
+
+    def get_newsfeeds(self, user_id, created_at__gt=None, created_at__lt=None, count=None):
+        # created_at__lt starts the scan after the rows of that microsecond,
+        # created_at__gt stops it before them
+        if created_at__lt is not None:
+            row_start = self.get_row_prefix(user_id, created_at__lt - ONE_MICROSECOND)
+        else:
+            row_start = struct.pack(USER_PREFIX_FORMAT, user_id)
+        if created_at__gt is not None:
+            row_stop = self.get_row_prefix(user_id, created_at__gt)
+        else:
+            row_stop = struct.pack(USER_PREFIX_FORMAT, user_id + 1)
+        rows = self.get_table().scan(row_start, row_stop, limit=count)
+        return [self.from_row(row_key, columns) for row_key, columns in rows]
+
+
+STORAGES = {
+    'mysql': MySQLNewsFeedStorage(),
+    'wide_column': WideColumnNewsFeedStorage(),
+}
+
+
+def get_newsfeed_storage():
+    return STORAGES[settings.NEWSFEED_STORAGE]
\ No newline at end of file
@@ -1,35 +1,82 @@
 from celery import shared_task
 from friendships.services import FriendshipService
-from newsfeeds.constants import FANOUT_BATCH_SIZE
-from newsfeeds.models import NewsFeed
+from newsfeeds.constants import FANOUT_BATCH_SIZE, PULL_MODE_BACKFILL_LIMIT
+from newsfeeds.storages import get_newsfeed_storage
+from tweets.models import Tweet
 from utils.time_constants import ONE_HOUR
+from utils.time_helpers import datetime_to_score, score_to_datetime
 
 @shared_task(time_limit=ONE_HOUR, routing_key='default')
 def fanout_newsfeeds_main_task(tweet_id, tweet_user_id):
+    from newsfeeds.services import NewsFeedService
     # owner can see the tweet first after posting
-    NewsFeed.objects.create(user_id=tweet_user_id, tweet_id=tweet_id)
-    follower_ids = FriendshipService.get_follower_ids(tweet_user_id)
-    index = 0
-    while index < len(follower_ids):
-        batch_ids = follower_ids[index: index + FANOUT_BATCH_SIZE]
+    NewsFeedService.create_newsfeed(tweet_user_id, tweet_id)
+    # followers of a pull mode author merge the author's tweets at read time
+    if NewsFeedService.is_pull_mode_author(tweet_user_id):
+        follower_count = FriendshipService.get_follower_count(tweet_user_id)
+        return '{} followers will pull the tweet, no batches are created'.format(
+            follower_count
+        )
+
+    # batches are enqueued while the followers are still being enumerated
+    follower_count, batch_count = 0, 0
+    for batch_ids in FriendshipService.iter_follower_id_batches(
+        tweet_user_id,
+        FANOUT_BATCH_SIZE,
+    ):
         fanout_newsfeeds_batch_task.delay(tweet_id, batch_ids)
-        index += FANOUT_BATCH_SIZE
+        follower_count += len(batch_ids)
+        batch_count += 1
 
     return '{} newsfeeds will be fanned out, {} batches are created'.format(
-        len(follower_ids),
-        (len(follower_ids) - 1) // FANOUT_BATCH_SIZE + 1
+        follower_count,
+        batch_count,
     )
 
 @shared_task(time_limit=ONE_HOUR, routing_key='newsfeeds')
-def fanout_newsfeeds_batch_task(tweet_id, follower_ids):
-    newsfeeds = [
-        NewsFeed(user_id=follower_id, tweet_id=tweet_id)
-        for follower_id in follower_ids
-    ]
-    NewsFeed.objects.bulk_create(newsfeeds)
-    # bulk_create won't trigger listener
-    for newsfeed in newsfeeds:
-        from newsfeeds.services import NewsFeedService
-        NewsFeedService.push_newsfeeds_to_redis(newsfeed)
-
-    return '{} newsfeeds are created.'.format(len(newsfeeds))
\ No newline at end of file
+def fanout_newsfeeds_batch_task(tweet_id, follower_ids, created_at_score=None):
+    # created_at_score is set for the tweets of a backfill, their newsfeeds
+    # take the time of the tweet instead of now
+    created_at = None
+    if created_at_score is not None:
+        created_at = score_to_datetime(created_at_score)
+    newsfeeds = get_newsfeed_storage().bulk_create(
+        follower_ids,
+        tweet_id,
+        created_at=created_at,
+    )
+    # bulk_create won't trigger listener, push to redis in one round trip
+    from newsfeeds.services import NewsFeedService
+    NewsFeedService.push_newsfeeds_to_cached_redis(newsfeeds)
+
+    return '{} newsfeeds are created.'.format(len(follower_ids))
+
+@shared_task(time_limit=ONE_HOUR, routing_key='default')
+def backfill_pull_mode_tweets_task(tweet_user_id, since_score):
+    # the author went back to push mode, the newest tweets it posted in pull
+    # mode since since_score are fanned out to its followers
+    tweets = Tweet.objects.filter(
+        user_id=tweet_user_id,
+        created_at__gte=score_to_datetime(since_score),
+    ).order_by('-created_at')[:PULL_MODE_BACKFILL_LIMIT]
+    tweets = [(tweet.id, tweet.created_at) for tweet in tweets]
+    if not tweets:
+        return 'no tweets to backfill'
+
+    batch_count = 0
+    for batch_ids in FriendshipService.iter_follower_id_batches(
+        tweet_user_id,
+        FANOUT_BATCH_SIZE,
+    ):
+        for tweet_id, created_at in tweets:
+            fanout_newsfeeds_batch_task.delay(
+                tweet_id,
+                batch_ids,
+                datetime_to_score(created_at),
+            )
+            batch_count += 1
+
+    return '{} tweets will be backfilled, {} batches are created'.format(
+        len(tweets),
+        batch_count,
+    )
\ No newline at end of file
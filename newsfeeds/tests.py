@@ -1,9 +1,27 @@
-from newsfeeds.models import NewsFeed
-from newsfeeds.services import NewsFeedService
-from newsfeeds.tasks import fanout_newsfeeds_main_task
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from friendships.models import Friendship
+from friendships.services import FriendshipService
+from newsfeeds.models import NewsFeed, PullModeAuthor
+from newsfeeds.services import NewsFeedIdSerializer, NewsFeedService
+from newsfeeds.storages import get_newsfeed_storage
+from newsfeeds.tasks import (
+    backfill_pull_mode_tweets_task,
+    fanout_newsfeeds_batch_task,
+    fanout_newsfeeds_main_task,
+)
+from rest_framework.test import APIClient
 from testing.testcases import TestCase
 from twitter.cache import USER_NEWSFEEDS_PATTERN
+from unittest import mock
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
+from utils.redis.redis_serializers import DjangoModelSerializer
+from utils.sharding.shard_helper import ShardHelper
+from utils.time_helpers import datetime_to_score
+from utils.wide_column.wide_column_client import WideColumnClient
 
 
 class NewsFeedServiceTests(TestCase):
@@ -54,6 +72,42 @@ class NewsFeedServiceTests(TestCase):
         user1_profile.save()
         self.assertEqual(newsfeeds[0].tweet.user.profile.nickname, 'user1_nickname')
 
+    def test_newsfeeds_sorted_set_in_redis(self):
+        newsfeeds = [
+            self.create_newsfeed(self.user2, self.create_tweet(self.user1))
+            for _ in range(3)
+        ]
+        newsfeeds = newsfeeds[::-1]
+        conn = RedisClient.get_connection()
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.user2.id)
+        self.assertEqual(conn.type(key), b'zset')
+        self.assertEqual(
+            conn.zrevrange(key, 0, 0),
+            ['{}:{}'.format(newsfeeds[0].id, newsfeeds[0].tweet_id).encode()],
+        )
+
+        # only the requested page is loaded
+        page, horizon = NewsFeedService.get_cached_newsfeeds_page(
+            self.user2.id,
+            created_at__lt=newsfeeds[0].created_at,
+            count=1,
+        )
+        self.assertEqual(horizon, None)
+        self.assertEqual(len(page), 1)
+        self.assertEqual(page[0].id, newsfeeds[1].id)
+        self.assertEqual(page[0].tweet_id, newsfeeds[1].tweet_id)
+        self.assertEqual(page[0].user_id, self.user2.id)
+        self.assertEqual(page[0].created_at, newsfeeds[1].created_at)
+
+        page, _ = NewsFeedService.get_cached_newsfeeds_page(
+            self.user2.id,
+            created_at__gt=newsfeeds[2].created_at,
+        )
+        self.assertEqual(
+            [newsfeed.id for newsfeed in page],
+            [newsfeeds[0].id, newsfeeds[1].id],
+        )
+
 
 class NewsFeedTaskTests(TestCase):
 
@@ -67,7 +121,7 @@ class NewsFeedTaskTests(TestCase):
         self.create_friendship(self.user2, self.user1)
         msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
         self.assertEqual(msg, '1 newsfeeds will be fanned out, 1 batches are created')
-        self.assertEqual(NewsFeed.objects.count(), 2)
+        self.assertEqual(ShardHelper.count(NewsFeed), 2)
         cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.user1.id)
         self.assertEqual(len(cached_list), 1)
 
@@ -79,7 +133,7 @@ class NewsFeedTaskTests(TestCase):
         msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
         # testing batch size is 3
         self.assertEqual(msg, '3 newsfeeds will be fanned out, 1 batches are created')
-        self.assertEqual(NewsFeed.objects.count(), 6)
+        self.assertEqual(ShardHelper.count(NewsFeed), 6)
         cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.user1.id)
         self.assertEqual(len(cached_list), 2)
 
@@ -89,8 +143,284 @@ class NewsFeedTaskTests(TestCase):
         tweet = self.create_tweet(self.user1)
         msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
         self.assertEqual(msg,'4 newsfeeds will be fanned out, 2 batches are created')
-        self.assertEqual(NewsFeed.objects.count(), 11)
+        self.assertEqual(ShardHelper.count(NewsFeed), 11)
         cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.user1.id)
         self.assertEqual(len(cached_list), 3)
         cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
-        self.assertEqual(len(cached_list), 3)
\ No newline at end of file
+        self.assertEqual(len(cached_list), 3)
+
+    def test_fanout_main_task_in_pull_mode(self):
+        followers = [self.create_user('user{}'.format(i)) for i in range(6)]
+        for follower in followers:
+            self.create_friendship(follower, self.user1)
+        tweet = self.create_tweet(self.user1)
+        msg = fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(msg, '6 followers will pull the tweet, no batches are created')
+        # only the owner's newsfeed is created
+        self.assertEqual(ShardHelper.count(NewsFeed), 1)
+
+        # followers merge the tweet at read time
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+        self.assertEqual(len(cached_list), 1)
+        self.assertEqual(cached_list[0].id, None)
+        self.assertEqual(cached_list[0].tweet_id, tweet.id)
+
+        # pushed and pulled newsfeeds are merged by created_at
+        self.create_friendship(followers[0], self.user2)
+        user2_tweet = self.create_tweet(self.user2)
+        self.create_newsfeed(followers[0], user2_tweet)
+        new_tweet = self.create_tweet(self.user1)
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in cached_list],
+            [new_tweet.id, user2_tweet.id, tweet.id],
+        )
+
+    def test_pull_mode_switch(self):
+        followers = [self.create_user('user{}'.format(i)) for i in range(6)]
+        for follower in followers:
+            self.create_friendship(follower, self.user1)
+        self.assertEqual(PullModeAuthor.objects.get().user, self.user1)
+        self.assertEqual(
+            NewsFeedService.get_pull_mode_following_ids(followers[0].id),
+            [self.user1.id],
+        )
+        # cached per user, follower counts are not read on every page
+        self.create_newsfeed(followers[0], self.create_tweet(self.user2))
+        pulled_tweets = [self.create_tweet(self.user1)]
+        NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+        with self.assertNumQueries(0):
+            with mock.patch.object(FriendshipService, 'get_follower_counts') as get_counts:
+                NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+                NewsFeedService.get_pull_mode_following_ids(followers[0].id)
+        get_counts.assert_not_called()
+        # a followed push mode author does not change the list
+        self.create_friendship(followers[0], self.user2)
+        self.assertEqual(
+            NewsFeedService.get_pull_mode_following_ids(followers[0].id),
+            [self.user1.id],
+        )
+        pulled_tweets += [self.create_tweet(self.user1) for _ in range(3)]
+        for tweet in pulled_tweets:
+            fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        self.assertEqual(
+            ShardHelper.get_queryset(NewsFeed, followers[5].id).filter(user=followers[5]).count(),
+            0,
+        )
+
+        # the follower count is kept in cache, a follow does not count again
+        with CaptureQueriesContext(connection) as queries:
+            self.create_friendship(self.user2, self.user1)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipService.get_follower_count(self.user1.id), 7)
+        Friendship.objects.filter(from_user=self.user2, to_user=self.user1).delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipService.get_follower_count(self.user1.id), 6)
+        # a concurrent follow already made the author a pull mode one
+        NewsFeedService.reset_pull_mode_authors()
+        with mock.patch.object(NewsFeedService, 'is_pull_mode_author', return_value=False):
+            NewsFeedService.update_pull_mode(self.user1.id)
+        self.assertEqual(PullModeAuthor.objects.count(), 1)
+
+        # no switch back before PUSH_MODE_FOLLOWERS_THRESHOLD
+        for follower in followers[3:]:
+            Friendship.objects.filter(from_user=follower, to_user=self.user1).delete()
+        self.assertEqual(PullModeAuthor.objects.count(), 1)
+        self.assertEqual(NewsFeedService.get_pull_mode_following_ids(followers[5].id), [])
+
+        # back in push mode, the tweets posted in pull mode are backfilled
+        # at the time they were posted
+        Friendship.objects.filter(from_user=followers[2], to_user=self.user1).delete()
+        self.assertEqual(PullModeAuthor.objects.count(), 0)
+        self.assertEqual(NewsFeedService.get_pull_mode_following_ids(followers[0].id), [])
+        newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(followers[1].id)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [tweet.id for tweet in pulled_tweets[::-1]],
+        )
+        self.assertEqual(
+            [newsfeed.created_at for newsfeed in newsfeeds],
+            [tweet.created_at for tweet in pulled_tweets[::-1]],
+        )
+        self.assertIsNotNone(newsfeeds[0].id)
+        self.assertEqual(
+            ShardHelper.get_queryset(NewsFeed, followers[2].id).filter(user=followers[2]).count(),
+            0,
+        )
+
+        # a backfill that runs again creates nothing twice
+        since = datetime_to_score(pulled_tweets[0].created_at)
+        backfill_pull_mode_tweets_task(self.user1.id, since)
+        self.assertEqual(
+            ShardHelper.get_queryset(NewsFeed, followers[1].id).filter(user=followers[1]).count(),
+            4,
+        )
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(followers[1].id)
+        self.assertEqual(
+            [newsfeed.id for newsfeed in cached_list],
+            [newsfeed.id for newsfeed in newsfeeds],
+        )
+
+    def test_pulled_tweets_are_sliced(self):
+        followers = [self.create_user('user{}'.format(i)) for i in range(6)]
+        for follower in followers:
+            self.create_friendship(follower, self.user1)
+        tweets = [self.create_tweet(self.user1) for _ in range(6)]
+        NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+
+        # only the tweets of the page are deserialized
+        with mock.patch.object(
+            DjangoModelSerializer,
+            'deserializer',
+            wraps=DjangoModelSerializer.deserializer,
+        ) as deserializer:
+            newsfeeds, _ = NewsFeedService.get_cached_newsfeeds_page(
+                followers[0].id,
+                created_at__lt=tweets[4].created_at,
+                count=2,
+            )
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [tweets[3].id, tweets[2].id],
+        )
+        self.assertEqual(deserializer.call_count, 2)
+
+    def test_fanout_batch_task_skips_cold_cache(self):
+        user3 = self.create_user('testuser3')
+        conn = RedisClient.get_connection()
+        user2_key = USER_NEWSFEEDS_PATTERN.format(user_id=self.user2.id)
+        user3_key = USER_NEWSFEEDS_PATTERN.format(user_id=user3.id)
+        # user2's newsfeeds are cached, user3's are not
+        self.create_newsfeed(self.user2, self.create_tweet(self.user1))
+        self.assertEqual(conn.zcard(user2_key), 1)
+
+        tweet = self.create_tweet(self.user1)
+        msg = fanout_newsfeeds_batch_task(tweet.id, [self.user2.id, user3.id])
+        self.assertEqual(msg, '2 newsfeeds are created.')
+        self.assertEqual(
+            ShardHelper.count(NewsFeed, lambda queryset: queryset.filter(tweet=tweet)),
+            2,
+        )
+        self.assertEqual(conn.zcard(user2_key), 2)
+        self.assertEqual(conn.exists(user3_key), False)
+
+        # cached newsfeeds have ids, cold caches are rebuilt from db on read
+        newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(self.user2.id)
+        self.assertEqual(newsfeeds[0].tweet_id, tweet.id)
+        self.assertEqual(
+            newsfeeds[0].id,
+            ShardHelper.get_queryset(NewsFeed, self.user2.id).get(
+                user=self.user2,
+                tweet=tweet,
+            ).id,
+        )
+        newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(user3.id)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [tweet.id])
+
+        # a reader is rebuilding user4's cache from a db snapshot older than
+        # the fanout, the pushed newsfeed is merged into the rebuilt cache
+        user4 = self.create_user('testuser4')
+        user4_key = USER_NEWSFEEDS_PATTERN.format(user_id=user4.id)
+        old_tweet = self.create_tweet(self.user1)
+        snapshot = [self.create_newsfeed(user4, old_tweet)]
+        conn.delete(user4_key)
+        token = RedisHelper.acquire_lock(user4_key)
+        tweet = self.create_tweet(self.user1)
+        fanout_newsfeeds_batch_task(tweet.id, [user4.id])
+        self.assertEqual(conn.exists(user4_key), False)
+        RedisHelper._load_sorted_objects_to_cache(user4_key, snapshot, NewsFeedIdSerializer)
+        RedisHelper.release_lock(user4_key, token)
+        newsfeeds = NewsFeedService.get_cached_newsfeeds_from_redis(user4.id)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [tweet.id, old_tweet.id],
+        )
+        self.assertEqual(conn.exists('{}:pending'.format(user4_key)), False)
+
+
+@override_settings(NEWSFEED_STORAGE='wide_column')
+class WideColumnNewsFeedStorageTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        WideColumnClient.clear()
+        self.user1 = self.create_user('testuser1')
+        self.user2 = self.create_user('testuser2')
+
+    def test_fanout_and_scan(self):
+        followers = [self.create_user('user{}'.format(i)) for i in range(3)]
+        for follower in followers:
+            self.create_friendship(follower, self.user1)
+        tweets = [self.create_tweet(self.user1) for _ in range(3)]
+        for tweet in tweets:
+            fanout_newsfeeds_main_task(tweet.id, self.user1.id)
+        tweets = tweets[::-1]
+
+        # the rows do not go to the relational database
+        self.assertEqual(ShardHelper.count(NewsFeed), 0)
+        storage = get_newsfeed_storage()
+        for user in [self.user1] + followers:
+            newsfeeds = storage.get_newsfeeds(user.id)
+            self.assertEqual(
+                [newsfeed.tweet_id for newsfeed in newsfeeds],
+                [tweet.id for tweet in tweets],
+            )
+            self.assertEqual(
+                set(newsfeed.user_id for newsfeed in newsfeeds),
+                {user.id},
+            )
+        self.assertEqual(storage.get_newsfeeds(self.user2.id), [])
+
+        # a range of rows is one scan, the cursors are exclusive
+        newsfeeds = storage.get_newsfeeds(followers[0].id)
+        self.assertEqual(
+            storage.get_newsfeeds(followers[0].id, created_at__lt=newsfeeds[0].created_at),
+            newsfeeds[1:],
+        )
+        self.assertEqual(
+            storage.get_newsfeeds(followers[0].id, created_at__gt=newsfeeds[2].created_at),
+            newsfeeds[:2],
+        )
+        self.assertEqual(storage.get_newsfeeds(followers[0].id, count=1), newsfeeds[:1])
+
+        # rows of a backfill that exist keep their id
+        backfilled = storage.bulk_create(
+            [followers[0].id, self.user2.id],
+            tweets[0].id,
+            created_at=newsfeeds[0].created_at,
+        )
+        self.assertEqual(backfilled[0].id, newsfeeds[0].id)
+        self.assertEqual(storage.get_newsfeeds(followers[0].id), newsfeeds)
+        self.assertEqual(storage.get_newsfeeds(self.user2.id), backfilled[1:])
+
+        # the redis cache is loaded from the storage
+        self.clear_cache()
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(followers[0].id)
+        self.assertEqual(
+            [newsfeed.id for newsfeed in cached_list],
+            [newsfeed.id for newsfeed in newsfeeds],
+        )
+
+    def test_paginate_beyond_cache(self):
+        list_limit = settings.REDIS_LIST_LENGTH_LIMIT
+        newsfeed_ids = [
+            NewsFeedService.create_newsfeed(
+                self.user1.id,
+                self.create_tweet(self.user2).id,
+            ).id
+            for _ in range(list_limit + 5)
+        ][::-1]
+
+        client = APIClient()
+        client.force_authenticate(self.user1)
+        results = []
+        params = {}
+        while True:
+            response = client.get('/api/newsfeeds/', params)
+            results.extend(response.data['results'])
+            if not response.data['has_next_page']:
+                break
+            params = {'created_at__lt': results[-1]['created_at']}
+        self.assertEqual([result['id'] for result in results], newsfeed_ids)
+        self.assertEqual(ShardHelper.count(NewsFeed), 0)
\ No newline at end of file
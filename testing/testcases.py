@@ -1,3 +1,4 @@
+from accounts.services import local_cache
 from comments.models import Comment
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
@@ -9,11 +10,13 @@ from newsfeeds.models import NewsFeed
 from rest_framework.test import APIClient
 from tweets.models import Tweet
 from utils.redis.redis_client import RedisClient
+from utils.sharding.shard_helper import ShardHelper
 
 
 class TestCase(DjangoTestCase):
 
     def clear_cache(self):
+        local_cache.clear()
         caches['testing'].clear()
         RedisClient.clear()
 
@@ -47,10 +50,10 @@ class TestCase(DjangoTestCase):
         return Comment.objects.create(user=user, tweet=tweet, content=content)
 
     def create_newsfeed(self, user, tweet):
-        return NewsFeed.objects.create(user=user, tweet=tweet)
+        return ShardHelper.get_queryset(NewsFeed, user.id).create(user=user, tweet=tweet)
 
     def create_like(self, user, target):
-        like, _ = Like.objects.get_or_create(
+        like, _ = ShardHelper.get_queryset(Like, target.id).get_or_create(
             object_id=target.id,
             content_type=ContentType.objects.get_for_model(target.__class__),
             user=user
@@ -1,17 +1,15 @@
 from accounts.api.serializers import UserSerializerForTweet
 from comments.api.serializers import CommentSerializer
-from likes.api.serializers import LikeSerializer
-from likes.services import LikeService
-from random import randint
+from likes.api.serializers import LikedObjectIdSetMixin, LikeSerializer
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.constants import TWEET_PHOTO_UPLOAD_LIMIT
-from tweets.models import Tweet, TweetPhoto
+from tweets.models import Tweet
 from tweets.services import TweetService
 from utils.redis.redis_helper import RedisHelper
 
 
-class TweetSerializer(serializers.ModelSerializer):
+class TweetSerializer(LikedObjectIdSetMixin, serializers.ModelSerializer):
     user = UserSerializerForTweet(source='cached_user')
     has_liked = serializers.SerializerMethodField()
     likes_count = serializers.SerializerMethodField()
@@ -31,33 +29,27 @@ class TweetSerializer(serializers.ModelSerializer):
             'photo_urls',
         )
 
-    def get_has_liked(self, obj): # obj is the object being serialized
-        return LikeService.has_liked(self.context['request'].user, obj)
-
     def get_likes_count(self, obj):
-        if randint(0, 999) == 0:
-            actual_likes_count = obj.like_set.count()
-            if obj.likes_count != actual_likes_count:
-                obj.likes_count = actual_likes_count
-                obj.save()
-            return actual_likes_count
-
-        return RedisHelper.get_count(obj, 'likes_count')
+        return RedisHelper.get_count(
+            obj,
+            'likes_count',
+            self.context.get('counts'),
+        )
 
     def get_comments_count(self, obj):
-        if randint(0, 999) == 0:
-            actual_comments_count = obj.comment_set.count()
-            if obj.comments_count != actual_comments_count:
-                obj.comments_count = actual_comments_count
-                obj.save()
-            return actual_comments_count
-
-        return RedisHelper.get_count(obj, 'comments_count')
+        return RedisHelper.get_count(
+            obj,
+            'comments_count',
+            self.context.get('counts'),
+        )
 
     def get_photo_urls(self, obj):
-        photos = TweetPhoto.objects.filter(tweet=obj).order_by('order')
-        photo_urls = [photo.file.url for photo in photos]
-        return photo_urls
+        # context['photo_urls'] is filled by TweetService.get_photo_urls
+        photo_urls = self.context.get('photo_urls', {})
+        if obj.id in photo_urls:
+            return photo_urls[obj.id]
+
+        return TweetService.get_photo_urls([obj])[obj.id]
 
 class TweetSerializerForCreate(serializers.ModelSerializer):
     content = serializers.CharField(min_length=6, max_length=140)
@@ -95,7 +87,7 @@ class TweetSerializerForCreate(serializers.ModelSerializer):
 
 class TweetSerializerForDetail(TweetSerializer):
     comments = CommentSerializer(source='comment_set', many=True)
-    likes = LikeSerializer(source='like_set', many=True)
+    likes = serializers.SerializerMethodField()
 
     class Meta:
         model = Tweet
@@ -111,4 +103,11 @@ class TweetSerializerForDetail(TweetSerializer):
             'likes_count',
             'has_liked',
             'photo_urls',
-        )
\ No newline at end of file
+        )
+
+    def get_likes(self, obj):
+        # context['likes'] holds the likes with their cached users filled
+        likes = self.context.get('likes')
+        if likes is None:
+            likes = obj.like_set
+        return LikeSerializer(likes, many=True, context=self.context).data
\ No newline at end of file
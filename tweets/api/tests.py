@@ -1,7 +1,9 @@
+from accounts.services import UserService
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 from tweets.models import Tweet, TweetPhoto
+from unittest import mock
 from utils.paginations.endless_paginations import EndlessPagination
 
 TWEET_LIST_API = '/api/tweets/'
@@ -121,6 +123,20 @@ class TweetApiTests(TestCase):
             self.user2.id
         )
 
+        # the users of the likes are filled in one batch
+        self.create_like(self.user1, tweet)
+        self.create_like(self.user2, tweet)
+        with mock.patch.object(
+            UserService,
+            'get_user_through_memcached',
+        ) as get_user_through_memcached:
+            response = self.anonymous_client.get(url)
+        get_user_through_memcached.assert_not_called()
+        self.assertEqual(
+            [like['user']['id'] for like in response.data['likes']],
+            [self.user2.id, self.user1.id],
+        )
+
     def test_create_tweet_with_pictures(self):
         # upload empty files
         response = self.user1_client.post(TWEET_CREATE_API, {
@@ -238,4 +254,91 @@ class TweetApiTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['has_next_page'], False)
         self.assertEqual(len(response.data['results']), 1)
-        self.assertEqual(response.data['results'][0]['id'], new_tweet.id)
\ No newline at end of file
+        self.assertEqual(response.data['results'][0]['id'], new_tweet.id)
+
+    def test_page_size(self):
+        for i in range(5):
+            self.tweet1.append(self.create_tweet(self.user1))
+        tweets = self.tweet1[::-1]
+
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'page_size': 3,
+        })
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweet.id for tweet in tweets[:3]],
+        )
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'created_at__lt': tweets[2].created_at,
+            'page_size': 3,
+        })
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweet.id for tweet in tweets[3:6]],
+        )
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'created_at__lt': tweets[5].created_at,
+            'page_size': 3,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweet.id for tweet in tweets[6:]],
+        )
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'created_at__gt': tweets[-1].created_at,
+            'page_size': 3,
+        })
+        self.assertEqual(response.data['has_gap'], True)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweet.id for tweet in tweets[:3]],
+        )
+
+    def test_id_cursors(self):
+        for i in range(5):
+            self.tweet1.append(self.create_tweet(self.user1))
+        tweets = self.tweet1[::-1]
+
+        # from the cached list, then from db
+        for _ in range(2):
+            response = self.user1_client.get(TWEET_LIST_API, {
+                'user_id': self.user1.id,
+                'id__lt': tweets[2].id,
+                'page_size': 3,
+            })
+            self.assertEqual(response.data['has_next_page'], True)
+            self.assertEqual(
+                [tweet['id'] for tweet in response.data['results']],
+                [tweet.id for tweet in tweets[3:6]],
+            )
+            response = self.user1_client.get(TWEET_LIST_API, {
+                'user_id': self.user1.id,
+                'id__gt': tweets[4].id,
+            })
+            self.assertEqual(
+                [tweet['id'] for tweet in response.data['results']],
+                [tweet.id for tweet in tweets[:4]],
+            )
+            self.clear_cache()
+
+        # cursors that can not be parsed are a bad request
+        for cursor in [{'id__lt': 'abc'}, {'created_at__gt': 'abc'}]:
+            response = self.user1_client.get(TWEET_LIST_API, {
+                'user_id': self.user1.id,
+                **cursor,
+            })
+            self.assertEqual(response.status_code, 400)
+
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'id__lt': tweets[-1].id,
+        })
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['has_next_page'], False)
\ No newline at end of file
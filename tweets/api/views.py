@@ -1,4 +1,7 @@
+from accounts.services import UserService
+from django.db.models import prefetch_related_objects
 from django.utils.decorators import method_decorator
+from likes.services import LikeService
 from newsfeeds.services import NewsFeedService
 from ratelimit.decorators import ratelimit
 from rest_framework import viewsets, status
@@ -13,6 +16,7 @@ from tweets.models import Tweet
 from tweets.services import TweetService
 from utils.decorators import required_param
 from utils.paginations.endless_paginations import EndlessPagination
+from utils.redis.redis_helper import RedisHelper
 
 
 class TweetViewSet(viewsets.GenericViewSet):
@@ -36,9 +40,21 @@ class TweetViewSet(viewsets.GenericViewSet):
         if tweets == None:
             queryset = Tweet.objects.filter(user_id=user_id)
             tweets=self.paginate_queryset(queryset)
+        UserService.fill_cached_users(tweets)
         serializer = TweetSerializer(
             tweets,
-            context={'request': request},
+            context={
+                'request': request,
+                'liked_object_ids': LikeService.get_liked_object_ids(
+                    request.user,
+                    tweets,
+                ),
+                'counts': RedisHelper.get_counts(
+                    tweets,
+                    ['likes_count', 'comments_count'],
+                ),
+                'photo_urls': TweetService.get_photo_urls(tweets),
+            },
             many=True,
         )
         return self.get_paginated_response(serializer.data)
@@ -46,9 +62,24 @@ class TweetViewSet(viewsets.GenericViewSet):
     @method_decorator(ratelimit(key='user_or_ip', rate='5/s', method='GET', block=True))
     def retrieve(self, request, *args, **kwargs):
         tweet = self.get_object()
+        prefetch_related_objects([tweet], 'comment_set')
+        comments = list(tweet.comment_set.all())
+        likes = list(tweet.like_set)
+        UserService.fill_cached_users([tweet] + comments + likes)
+        counts = RedisHelper.get_counts([tweet], ['likes_count', 'comments_count'])
+        counts.update(RedisHelper.get_counts(comments, ['likes_count']))
         serializer = TweetSerializerForDetail(
             tweet,
-            context={'request': request}
+            context={
+                'request': request,
+                'liked_object_ids': LikeService.get_liked_object_ids(
+                    request.user,
+                    [tweet] + comments,
+                ),
+                'counts': counts,
+                'likes': likes,
+                'photo_urls': TweetService.get_photo_urls([tweet]),
+            }
         )
         return Response(serializer.data)
 
@@ -4,4 +4,8 @@ def push_tweet_to_redis(sender, instance, created, **kwargs):
 
     # avoid cycle import
     from tweets.services import TweetService
-    TweetService.push_tweet_to_redis(instance)
\ No newline at end of file
+    TweetService.push_tweet_to_redis(instance)
+
+def invalidate_photo_urls_cache(sender, instance, **kwargs):
+    from tweets.services import TweetService
+    TweetService.invalidate_photo_urls_cache(instance.tweet_id)
\ No newline at end of file
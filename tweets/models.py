@@ -5,12 +5,16 @@ from django.db import models
 from django.db.models.signals import pre_delete, post_save
 from likes.models import Like
 from tweets.constants import TweetPhotoStatus, TWEET_PHOTO_STATUS_CHOICES
-from tweets.listeners import push_tweet_to_redis
+from tweets.listeners import invalidate_photo_urls_cache, push_tweet_to_redis
 from utils.memcached.listeners import invalidate_object_cache
+from utils.sharding.shard_helper import ShardHelper
+from utils.snowflake import generate_id
 from utils.time_helpers import utc_now
 
 
 class Tweet(models.Model):
+    # time ordered, pages are cut with id__lt / id__gt
+    id = models.BigIntegerField(primary_key=True, default=generate_id, editable=False)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     content = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -31,13 +35,17 @@ class Tweet(models.Model):
 
     @property
     def like_set(self):
-        return Like.objects.filter(
+        return ShardHelper.get_queryset(Like, self.id).filter(
             object_id=self.id,
             content_type= ContentType.objects.get_for_model(Tweet)
         ).order_by('-created_at')
 
     @property
     def cached_user(self):
+        # filled for a whole page by UserService.fill_cached_users
+        if hasattr(self, '_cached_user'):
+            return self._cached_user
+
         return UserService.get_user_through_memcached(self.user_id)
 
 
@@ -69,4 +77,7 @@ class TweetPhoto(models.Model):
 pre_delete.connect(invalidate_object_cache, sender=Tweet)
 post_save.connect(invalidate_object_cache, sender=Tweet)
 # new tweet is created, push to redis
-post_save.connect(push_tweet_to_redis, sender=Tweet)
\ No newline at end of file
+post_save.connect(push_tweet_to_redis, sender=Tweet)
+# photo urls are cached per tweet
+pre_delete.connect(invalidate_photo_urls_cache, sender=TweetPhoto)
+post_save.connect(invalidate_photo_urls_cache, sender=TweetPhoto)
\ No newline at end of file
@@ -1,7 +1,12 @@
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import caches
 from tweets.models import Tweet, TweetPhoto
-from twitter.cache import USER_TWEETS_PATTERN
+from twitter.cache import TWEET_PHOTO_NAMES_PATTERN, USER_TWEETS_PATTERN
 from utils.redis.redis_helper import RedisHelper
 
+cache = caches['testing'] if settings.TESTING else caches['default']
+
 
 class TweetService:
 
@@ -18,6 +23,53 @@ class TweetService:
             photos.append(photo)
 
         TweetPhoto.objects.bulk_create(photos)
+        # bulk_create won't trigger listener
+        cls.invalidate_photo_urls_cache(tweet.id)
+
+    @classmethod
+    def get_photo_urls(cls, tweets):
+        # {tweet_id: ordered photo urls} with one get_many, the misses are
+        # read in one query. Only the file names are cached, urls are
+        # signed on every read since a signed s3 url expires long before
+        # the cache does
+        keys = {
+            TWEET_PHOTO_NAMES_PATTERN.format(tweet_id=tweet.id): tweet.id
+            for tweet in tweets if tweet is not None
+        }
+        photo_names = {
+            keys[key]: names
+            for key, names in cache.get_many(list(keys)).items()
+        }
+        missing_tweet_ids = [
+            tweet_id for tweet_id in keys.values()
+            if tweet_id not in photo_names
+        ]
+        if missing_tweet_ids:
+            missing_photo_names = defaultdict(list)
+            photos = TweetPhoto.objects.filter(tweet_id__in=missing_tweet_ids).\
+                order_by('tweet_id', 'order')
+            for photo in photos:
+                missing_photo_names[photo.tweet_id].append(photo.file.name)
+            missing_photo_names = {
+                tweet_id: missing_photo_names[tweet_id]
+                for tweet_id in missing_tweet_ids
+            }
+            cache.set_many({
+                TWEET_PHOTO_NAMES_PATTERN.format(tweet_id=tweet_id): names
+                for tweet_id, names in missing_photo_names.items()
+            })
+            photo_names.update(missing_photo_names)
+
+        storage = TweetPhoto._meta.get_field('file').storage
+        return {
+            tweet_id: [storage.url(name) for name in names]
+            for tweet_id, names in photo_names.items()
+        }
+
+    @classmethod
+    def invalidate_photo_urls_cache(cls, tweet_id):
+        key = TWEET_PHOTO_NAMES_PATTERN.format(tweet_id=tweet_id)
+        cache.delete(key)
 
     @classmethod
     def get_cached_tweets_from_redis(cls, user_id):
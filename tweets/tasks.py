@@ -0,0 +1,61 @@
+from celery import shared_task
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count
+from utils.redis.redis_helper import RedisHelper
+from utils.time_constants import ONE_HOUR
+from utils.time_helpers import utc_now
+
+def get_comments_counts(tweet_ids):
+    # {tweet id: number of comments} with one GROUP BY query
+    from comments.models import Comment
+
+    comments_counts = {tweet_id: 0 for tweet_id in tweet_ids}
+    queryset = Comment.objects.filter(tweet_id__in=tweet_ids).\
+        values('tweet_id').annotate(count=Count('id'))
+    for row in queryset:
+        comments_counts[row['tweet_id']] = row['count']
+    return comments_counts
+
+@shared_task(time_limit=ONE_HOUR, routing_key='default')
+def reconcile_counters_task():
+    # scheduled by CELERY_BEAT_SCHEDULE, recounts the counters of tweets
+    # and comments liked or commented on in COUNTER_RECONCILE_WINDOW
+    from comments.models import Comment
+    from likes.services import LikeService
+    from tweets.models import Tweet
+
+    # pending deltas are written first, so most counters are settled
+    RedisHelper.flush_counter_deltas()
+    since = utc_now() - timedelta(seconds=settings.COUNTER_RECONCILE_WINDOW)
+    commented_tweet_ids = set(Comment.objects.filter(
+        created_at__gte=since,
+        tweet_id__isnull=False,
+    ).values_list('tweet_id', flat=True))
+    counters = [
+        (
+            Tweet,
+            'likes_count',
+            LikeService.get_recently_liked_object_ids(Tweet, since),
+            lambda ids: LikeService.get_likes_counts(Tweet, ids),
+        ),
+        (Tweet, 'comments_count', commented_tweet_ids, get_comments_counts),
+        (
+            Comment,
+            'likes_count',
+            LikeService.get_recently_liked_object_ids(Comment, since),
+            lambda ids: LikeService.get_likes_counts(Comment, ids),
+        ),
+    ]
+
+    stats = Counter(checked=0, db_fixed=0, cache_fixed=0, drift=0)
+    batch_size = settings.COUNTER_RECONCILE_BATCH_SIZE
+    for model_class, attr, object_ids, get_counts in counters:
+        object_ids = sorted(object_ids)
+        for start in range(0, len(object_ids), batch_size):
+            actual_counts = get_counts(object_ids[start:start + batch_size])
+            stats.update(RedisHelper.reconcile_counts(model_class, attr, actual_counts))
+
+    return '{checked} counters are checked, {db_fixed} in db and {cache_fixed} ' \
+        'in redis are fixed, drift {drift}.'.format(**stats)
\ No newline at end of file
@@ -1,13 +1,30 @@
 from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from redis.exceptions import ConnectionError
 from testing.testcases import TestCase
 from tweets.constants import TweetPhotoStatus
 from tweets.models import Tweet, TweetPhoto
 from tweets.services import TweetService
-from twitter.cache import USER_TWEETS_PATTERN
+from tweets.tasks import reconcile_counters_task
+from twitter.cache import (
+    SNOWFLAKE_WORKERS_KEY,
+    TWEET_PHOTO_NAMES_PATTERN,
+    USER_TWEETS_PATTERN,
+)
+from unittest import mock
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
 from utils.redis.redis_serializers import DjangoModelSerializer
+from utils.snowflake import MAX_WORKER_ID, SnowflakeGenerator, id_to_datetime
 from utils.time_helpers import utc_now
 
+cache = caches['testing'] if settings.TESTING else caches['default']
+
 
 class TweetTests(TestCase):
 
@@ -72,4 +89,191 @@ class TweetTests(TestCase):
         new_tweet = self.create_tweet(user, 'a new tweet')
         tweets = TweetService.get_cached_tweets_from_redis(user.id)
         tweet_ids.insert(0, new_tweet.id)
-        self.assertEqual([tweet.id for tweet in tweets], tweet_ids)
\ No newline at end of file
+        self.assertEqual([tweet.id for tweet in tweets], tweet_ids)
+
+    def test_photo_urls_in_memcached(self):
+        user = self.create_user('testuser')
+        tweets = [self.create_tweet(user) for _ in range(2)]
+        TweetService.create_photos_from_files(tweets[0], [
+            SimpleUploadedFile(
+                name='selfie{}.jpg'.format(i),
+                content=str.encode('a fake image'),
+                content_type='image/jpeg',
+            )
+            for i in range(2)
+        ])
+        photos = list(TweetPhoto.objects.filter(tweet=tweets[0]).order_by('order'))
+
+        # cache miss, all tweets are loaded in one query
+        with self.assertNumQueries(1):
+            photo_urls = TweetService.get_photo_urls(tweets)
+        self.assertEqual(photo_urls, {
+            tweets[0].id: [photo.file.url for photo in photos],
+            tweets[1].id: [],
+        })
+
+        # cache hit, only the file names are cached and urls are signed on
+        # every read
+        with self.assertNumQueries(0):
+            self.assertEqual(TweetService.get_photo_urls(tweets), photo_urls)
+        self.assertEqual(
+            cache.get(TWEET_PHOTO_NAMES_PATTERN.format(tweet_id=tweets[0].id)),
+            [photo.file.name for photo in photos],
+        )
+        with mock.patch.object(
+            TweetPhoto._meta.get_field('file').storage,
+            'url',
+            side_effect=lambda name: 'signed/' + name,
+        ):
+            self.assertEqual(
+                TweetService.get_photo_urls(tweets)[tweets[0].id],
+                ['signed/' + photo.file.name for photo in photos],
+            )
+
+        # photo status changed
+        photos[0].status = TweetPhotoStatus.APPROVED
+        photos[0].save()
+        with self.assertNumQueries(1):
+            TweetService.get_photo_urls(tweets)
+
+        # new photos uploaded
+        TweetService.create_photos_from_files(tweets[1], [
+            SimpleUploadedFile(
+                name='selfie.jpg',
+                content=str.encode('a fake image'),
+                content_type='image/jpeg',
+            ),
+        ])
+        photo_urls = TweetService.get_photo_urls(tweets)
+        self.assertEqual(len(photo_urls[tweets[1].id]), 1)
+
+    def test_reconcile_counters_task(self):
+        self.clear_cache()
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        tweet = self.create_tweet(user1)
+        comment = self.create_comment(user1, tweet)
+        self.create_like(user1, tweet)
+        self.create_like(user2, tweet)
+        self.create_like(user2, comment)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(
+                reconcile_counters_task(),
+                '3 counters are checked, 0 in db and 0 in redis are fixed, drift 0.',
+            )
+        # recent likes and comments are found by an index on created_at
+        recent_queries = [
+            query['sql'] for query in context.captured_queries
+            if '"created_at" >=' in query['sql']
+        ]
+        self.assertEqual(len(recent_queries), 3)
+        with connection.cursor() as cursor:
+            for sql in recent_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn('created_at>?', plan)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 2)
+
+        # drift in db and in redis is fixed, without touching the read path
+        Tweet.objects.filter(id=tweet.id).update(likes_count=5, comments_count=0)
+        conn = RedisClient.get_connection()
+        conn.set(RedisHelper.get_key(comment, 'likes_count'), 3)
+        self.assertEqual(
+            reconcile_counters_task(),
+            '3 counters are checked, 2 in db and 1 in redis are fixed, drift 4.',
+        )
+        tweet.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 2)
+        self.assertEqual(tweet.comments_count, 1)
+        self.assertEqual(comment.likes_count, 1)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 2)
+        self.assertEqual(RedisHelper.get_count(comment, 'likes_count'), 1)
+
+        # counters with pending deltas are left to the next run
+        Tweet.objects.filter(id=tweet.id).update(likes_count=5)
+        RedisHelper.incr_count(tweet, 'likes_count')
+        stats = RedisHelper.reconcile_counts(Tweet, 'likes_count', {tweet.id: 2})
+        self.assertEqual(stats['db_fixed'], 0)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 5)
+
+    def test_snowflake_ids(self):
+        user = self.create_user('testuser')
+        tweets = [self.create_tweet(user) for _ in range(5)]
+        ids = [tweet.id for tweet in tweets]
+        self.assertEqual(ids, sorted(ids))
+        self.assertLess(ids[-1], 2 ** 53)
+        for tweet in tweets:
+            self.assertLess(
+                abs(id_to_datetime(tweet.id) - tweet.created_at),
+                timedelta(seconds=1),
+            )
+
+        # more than 128 ids in one millisecond wait for the next one, and
+        # a clock going back does not make ids go back
+        generator = SnowflakeGenerator()
+        now = 1.7e9
+        with mock.patch(
+            'utils.snowflake.time.time',
+            side_effect=[now] * 129 + [now + 0.0015] * 2,
+        ):
+            ids = [generator.generate() for _ in range(129)]
+        self.assertEqual(len(set(ids)), 129)
+        self.assertEqual(ids, sorted(ids))
+        with mock.patch('utils.snowflake.time.time', return_value=now - 1):
+            self.assertGreater(generator.generate(), ids[-1])
+
+    def test_snowflake_worker_ids(self):
+        # processes without SNOWFLAKE_WORKER_ID lease distinct worker ids on
+        # their first id
+        self.clear_cache()
+        generators = [SnowflakeGenerator() for _ in range(MAX_WORKER_ID + 1)]
+        for generator in generators:
+            generator.check()
+            self.assertIsNone(generator.worker_id)
+            generator.generate()
+        self.assertEqual(
+            sorted(generator.worker_id for generator in generators),
+            list(range(MAX_WORKER_ID + 1)),
+        )
+        with self.assertRaises(ImproperlyConfigured):
+            SnowflakeGenerator().generate()
+
+        # a released worker id can be leased again at once
+        generators[1].release()
+        self.assertIsNone(
+            RedisClient.get_connection().hget(SNOWFLAKE_WORKERS_KEY, 1),
+        )
+        generator = SnowflakeGenerator()
+        generator.generate()
+        self.assertEqual(generator.worker_id, 1)
+
+        # a lost lease is replaced before the next id
+        generator = generators[0]
+        RedisClient.get_connection().delete(SNOWFLAKE_WORKERS_KEY)
+        generator.lease_renewed_at -= settings.SNOWFLAKE_WORKER_LEASE_TIME
+        generator.generate()
+        self.assertEqual(generator.worker_id, 0)
+        lease = RedisClient.get_connection().hget(SNOWFLAKE_WORKERS_KEY, 0)
+        self.assertEqual(lease.split(b':')[0], generator.lease_token.encode())
+
+        with self.settings(SNOWFLAKE_WORKER_ID=3):
+            generator = SnowflakeGenerator()
+            generator.check()
+            generator.generate()
+            self.assertEqual(generator.worker_id, 3)
+        with self.settings(SNOWFLAKE_WORKER_ID=MAX_WORKER_ID + 1):
+            with self.assertRaises(ImproperlyConfigured):
+                SnowflakeGenerator().check()
+
+        # no redis and no SNOWFLAKE_WORKER_ID only fails on the first id
+        with mock.patch(
+            'redis.Redis.evalsha',
+            side_effect=ConnectionError('redis is down'),
+        ):
+            generator = SnowflakeGenerator()
+            generator.check()
+            with self.assertRaises(ImproperlyConfigured):
+                generator.generate()
\ No newline at end of file
@@ -1,8 +1,38 @@
 # memcached key
 FOLLOWING_PATTERN = 'followings:{user_id}'
+FOLLOWER_COUNT_PATTERN = 'follower_count:{user_id}'
+# (version, ids) of the pull mode authors and of those a user follows, a
+# user's list is rebuilt when its version is not the authors' one
+PULL_MODE_AUTHORS_KEY = 'pull_mode_authors'
+PULL_MODE_FOLLOWINGS_PATTERN = 'pull_mode_followings:{user_id}'
 USER_PATTERN = 'user:{user_id}'
 USER_PROFILE_PATTERN = 'userprofile:{user_id}'
+TWEET_PHOTO_NAMES_PATTERN = 'tweet_photo_names:{tweet_id}'
+# model instances cached by MemcachedHelper, bump the version of a model
+# when its cached shape changes, the keys of the old version are not read
+# any more and expire by themselves
+OBJECT_PATTERN = '{label}:v{version}:{object_id}'
+OBJECT_CACHE_VERSIONS = {
+    'tweets.tweet': 1,
+}
 
 # redis key
 USER_TWEETS_PATTERN = 'user_tweet:{user_id}'
-USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
\ No newline at end of file
+USER_NEWSFEEDS_PATTERN = 'user_newsfeed_ids:{user_id}'
+COUNT_PATTERN = '{model_name}.{attr}:{object_id}'
+COUNTER_DELTAS_KEY = 'counter_deltas'
+FLUSHING_COUNTER_DELTAS_KEY = 'counter_deltas:flushing'
+# id of the last flush started on a node, it has no ttl and is kept after
+# the flush so a counter loaded from db can tell which flushes it includes
+COUNTER_FLUSH_ID_KEY = 'counter_deltas:flush_id'
+# {worker id: 'token:expire at ms'}, the snowflake worker ids leased by the
+# running processes, kept in a hash without ttl so it is never evicted
+SNOWFLAKE_WORKERS_KEY = 'snowflake_workers'
+
+# redis key families with a ttl, reported by redis_memory_report. Pending
+# counter deltas have no ttl, they are removed when flushed to db
+REDIS_KEY_PATTERNS = (
+    USER_TWEETS_PATTERN,
+    USER_NEWSFEEDS_PATTERN,
+    COUNT_PATTERN,
+)
\ No newline at end of file
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
     'newsfeeds',
     'comments',
     'likes',
+    'utils',
 ]
 
 REST_FRAMEWORK = {
@@ -152,6 +153,20 @@ if TESTING:
     DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 else:
     DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+
+# NewsFeed and Like rows are hash sharded by user_id / object_id, see
+# utils/sharding/shard_helper.py. Run reshard_tables after changing
+# SHARD_DATABASES, LOGICAL_SHARD_COUNT never changes
+LOGICAL_SHARD_COUNT = 64
+SHARD_DATABASES = ['default']
+DATABASE_ROUTERS = ['utils.sharding.routers.ShardRouter']
+if TESTING:
+    # the sharding tests spread the rows over local sqlite databases
+    for index in (1, 2):
+        DATABASES['shard_{}'.format(index)] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(BASE_DIR / 'shard_{}.sqlite3'.format(index)),
+        }
 # AWS info
 AWS_STORAGE_BUCKET_NAME = 'mytwitter-django'
 AWS_S3_REGION_NAME = 'us-west-1'
@@ -181,16 +196,79 @@ CACHES = {
         'KEY_PREFIX': 'rl',
     },
 }
+# per process cache in front of memcached for users and profiles, see
+# utils/memcached/local_cache.py
+LOCAL_CACHE_MAX_SIZE = 1000
+LOCAL_CACHE_TTL = 10  # in seconds
+LOCAL_CACHE_INVALIDATION_CHANNEL = 'local_cache_invalidation'
+# how long the local cache is bypassed before subscribing again
+LOCAL_CACHE_RETRY_INTERVAL = 1  # in seconds
+# ids confirmed missing in db are cached as a tombstone for a short time
+NEGATIVE_CACHE_TIMEOUT = 60  # in seconds
+
+# tweets, newsfeeds and likes get time ordered ids, see utils/snowflake.py.
+# Every running process needs its own worker id from 0 to 31. None leases
+# one from redis on the first generated id, renewed while the process runs
+# and released at exit. A process that is killed keeps its lease for up to
+# SNOWFLAKE_WORKER_LEASE_TIME, so web workers + celery worker processes +
+# commands that insert rows must stay well below 32 across all hosts, or
+# every process gets a fixed SNOWFLAKE_WORKER_ID
+SNOWFLAKE_WORKER_ID = None
+SNOWFLAKE_WORKER_LEASE_TIME = 60  # in seconds
+
+# where newsfeed rows are kept, 'mysql' or 'wide_column', see
+# newsfeeds/storages.py. The wide column table is a sqlite file standing in
+# for hbase / bigtable
+NEWSFEED_STORAGE = 'mysql'
+WIDE_COLUMN_SQLITE_PATH = ':memory:' if TESTING else str(BASE_DIR / 'wide_column.sqlite3')
 
 # redis install: sudo apt-get install redis
 # pip install redis
 REDIS_HOST = '127.0.0.1'
 REDIS_PORT = 6379
 REDIS_DB = 0 if TESTING else 1
-REDIS_KEY_EXPIRE_TIME = 7 * 86400  # in seconds
+# cache keys are spread over the nodes by consistent hashing, see
+# utils/redis/consistent_hash.py
+REDIS_NODES = [
+    {'host': REDIS_HOST, 'port': REDIS_PORT, 'db': REDIS_DB},
+]
+REDIS_VIRTUAL_NODES = 160
+REDIS_MAX_CONNECTIONS = 50
+REDIS_POOL_TIMEOUT = 5  # in seconds, waiting for a free pooled connection
+REDIS_SOCKET_TIMEOUT = 1  # in seconds
+REDIS_SOCKET_CONNECT_TIMEOUT = 1  # in seconds
+REDIS_HEALTH_CHECK_INTERVAL = 30  # in seconds
+REDIS_RETRY_ATTEMPTS = 3
+REDIS_RETRY_BACKOFF = 0.05  # in seconds, doubled after each retry
+REDIS_KEY_EXPIRE_TIME = 7 * 86400  # in seconds, refreshed when a key is read
+# memory budget of the cache redis, applied by redis_memory_report
+# --apply-budget. Only keys with a ttl are evicted, least recently used first.
+# counter_deltas and snowflake_workers have no ttl and are never evicted, the
+# budget leaves room for them. The command refuses to run while the celery
+# broker is on one of REDIS_NODES
+REDIS_MAXMEMORY = '1gb'
+REDIS_MAXMEMORY_POLICY = 'volatile-lru'
 REDIS_LIST_LENGTH_LIMIT = 200 if not TESTING else 20
+REDIS_LOCK_TIMEOUT = 5000  # in milliseconds
+REDIS_LOCK_WAIT_TIME = 0.2  # in seconds
+REDIS_LOCK_POLL_INTERVAL = 0.02  # in seconds
+# likes_count and comments_count changes are kept in redis and written to
+# db in batches
+COUNTER_FLUSH_INTERVAL = 10  # in seconds
+COUNTER_FLUSH_BATCH_SIZE = 500
+# ids of flushed batches are kept in db to never write a batch twice
+COUNTER_FLUSH_ID_RETENTION = 86400  # in seconds
+# a counter missing in redis is read from db again when a flush committed
+# while it was read
+COUNTER_LOAD_ATTEMPTS = 3
+# counters of recently liked or commented objects are recounted from db
+COUNTER_RECONCILE_INTERVAL = 10 * 60  # in seconds
+COUNTER_RECONCILE_WINDOW = 2 * 60 * 60  # in seconds
+COUNTER_RECONCILE_BATCH_SIZE = 500
 
 # Celery Configuration Options
+# the broker keeps its own db, on the instance of the cache until it is moved
+# to a redis of its own, see REDIS_MAXMEMORY
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0' if TESTING else 'redis://127.0.0.1:6379/2'
 CELERY_TIMEZONE = "UTC"
 CELERY_TASK_ALWAYS_EAGER = TESTING # if true, celery will run Synchronously!
@@ -198,6 +276,18 @@ CELERY_QUEUES = [
     Queue('default', routing_key='default'),
     Queue('newsfeeds', routing_key='newsfeeds')
 ]
+CELERY_BEAT_SCHEDULE = {
+    'flush-counter-deltas': {
+        'task': 'utils.tasks.flush_counter_deltas_task',
+        'schedule': COUNTER_FLUSH_INTERVAL,
+        'options': {'routing_key': 'default'},
+    },
+    'reconcile-counters': {
+        'task': 'tweets.tasks.reconcile_counters_task',
+        'schedule': COUNTER_RECONCILE_INTERVAL,
+        'options': {'routing_key': 'default'},
+    },
+}
 
 # Rate Limiter
 RATELIMIT_USE_CACHE = 'ratelimit'
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class UtilsConfig(AppConfig):
+    name = 'utils'
+
+    def ready(self):
+        # fail at startup on a snowflake worker id out of range, leasing one
+        # waits for the first insert
+        from utils.snowflake import generator
+        generator.check()
\ No newline at end of file
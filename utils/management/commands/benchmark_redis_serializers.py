@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from newsfeeds.models import NewsFeed
+from timeit import timeit
+from tweets.models import Tweet
+from utils.redis.redis_serializers import (
+    DjangoJSONModelSerializer,
+    DjangoModelSerializer,
+)
+from utils.time_helpers import utc_now
+
+
+class Command(BaseCommand):
+    help = 'Compare the size and speed of the redis model serializers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        number = options['number']
+        instances = [
+            Tweet(
+                id=123456,
+                user_id=1234,
+                content='a' * 140,
+                created_at=utc_now(),
+                likes_count=12,
+                comments_count=3,
+            ),
+            NewsFeed(id=123456, user_id=1234, tweet_id=123456, created_at=utc_now()),
+        ]
+        for instance in instances:
+            for serializer in [DjangoJSONModelSerializer, DjangoModelSerializer]:
+                data = serializer.serialize(instance)
+                serialize_time = timeit(
+                    lambda: serializer.serialize(instance),
+                    number=number,
+                )
+                deserialize_time = timeit(
+                    lambda: serializer.deserializer(data),
+                    number=number,
+                )
+                self.stdout.write(
+                    '{:<10} {:<28} {:>5} bytes  serialize {:>7.2f} us  '
+                    'deserialize {:>7.2f} us'.format(
+                        instance.__class__.__name__,
+                        serializer.__name__,
+                        len(data),
+                        serialize_time / number * 10 ** 6,
+                        deserialize_time / number * 10 ** 6,
+                    )
+                )
\ No newline at end of file
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from redis.exceptions import ResponseError
+from twitter.cache import REDIS_KEY_PATTERNS
+from urllib.parse import urlparse
+from utils.redis.redis_client import RedisClient
+import re
+
+OTHER_KEYS = 'other'
+
+
+def pattern_to_regex(pattern):
+    # 'user_tweet:{user_id}' -> ^user_tweet:[^:]+$
+    parts = re.split(r'\{\w+\}', pattern)
+    return re.compile('^{}$'.format('[^:]+'.join(map(re.escape, parts))))
+
+
+class Command(BaseCommand):
+    help = 'Report key counts and memory of each redis key pattern on all nodes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000)
+        parser.add_argument(
+            '--apply-budget',
+            action='store_true',
+            help='Set maxmemory and maxmemory-policy from settings.',
+        )
+
+    def check_broker(self):
+        # maxmemory is set for the whole instance, whatever the db. Broker
+        # messages have no ttl, a full instance would fail task enqueues
+        broker = urlparse(settings.CELERY_BROKER_URL)
+        for node in settings.REDIS_NODES:
+            if (broker.hostname, broker.port or 6379) == (node['host'], node['port']):
+                raise CommandError(
+                    'The celery broker {} is on the cache node {}:{}, move it '
+                    'to its own redis before applying the memory budget.'.format(
+                        settings.CELERY_BROKER_URL,
+                        node['host'],
+                        node['port'],
+                    )
+                )
+
+    def handle(self, *args, **options):
+        conns = RedisClient.get_connections_by_name()
+        if options['apply_budget']:
+            self.check_broker()
+            for conn in conns.values():
+                self.apply_budget(conn)
+
+        regexes = [(pattern, pattern_to_regex(pattern)) for pattern in REDIS_KEY_PATTERNS]
+        stats = defaultdict(lambda: {'keys': 0, 'bytes': 0, 'no_ttl': 0})
+        for conn in conns.values():
+            batch = []
+            for key in conn.scan_iter(count=options['count']):
+                batch.append(key)
+                if len(batch) >= options['count']:
+                    self.add_batch(conn, batch, regexes, stats)
+                    batch = []
+            self.add_batch(conn, batch, regexes, stats)
+
+        self.stdout.write('{:<36} {:>10} {:>14} {:>10}'.format(
+            'pattern', 'keys', 'memory', 'no ttl',
+        ))
+        for pattern in list(REDIS_KEY_PATTERNS) + [OTHER_KEYS]:
+            self.stdout.write('{:<36} {:>10} {:>14} {:>10}'.format(
+                pattern,
+                stats[pattern]['keys'],
+                stats[pattern]['bytes'],
+                stats[pattern]['no_ttl'],
+            ))
+
+        for name, conn in conns.items():
+            used_memory = conn.info('memory')['used_memory']
+            maxmemory = int(conn.config_get('maxmemory').get('maxmemory', 0))
+            self.stdout.write('{} used memory {} bytes, budget {}'.format(
+                name,
+                used_memory,
+                '{} bytes'.format(maxmemory) if maxmemory else 'not set',
+            ))
+
+    def add_batch(self, conn, keys, regexes, stats):
+        if not keys:
+            return
+
+        pipe = conn.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+            pipe.ttl(key)
+        results = pipe.execute()
+        for index, key in enumerate(keys):
+            memory, ttl = results[2 * index], results[2 * index + 1]
+            name = key.decode() if isinstance(key, bytes) else key
+            pattern = next(
+                (pattern for pattern, regex in regexes if regex.match(name)),
+                OTHER_KEYS,
+            )
+            stats[pattern]['keys'] += 1
+            # the key may have expired between SCAN and MEMORY USAGE
+            stats[pattern]['bytes'] += memory or 0
+            if ttl == -1:
+                stats[pattern]['no_ttl'] += 1
+
+    def apply_budget(self, conn):
+        try:
+            conn.config_set('maxmemory', settings.REDIS_MAXMEMORY)
+            conn.config_set('maxmemory-policy', settings.REDIS_MAXMEMORY_POLICY)
+        except ResponseError as e:
+            # CONFIG is disabled on some managed redis, set it in redis.conf
+            self.stderr.write('Can not apply the memory budget: {}'.format(e))
+            return
+        self.stdout.write('maxmemory is set to {} with {}'.format(
+            settings.REDIS_MAXMEMORY,
+            settings.REDIS_MAXMEMORY_POLICY,
+        ))
\ No newline at end of file
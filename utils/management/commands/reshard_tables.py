@@ -0,0 +1,94 @@
+from collections import defaultdict
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from utils.sharding.shard_helper import SHARD_KEYS, ShardHelper
+
+
+class Command(BaseCommand):
+    help = 'Move the rows of sharded tables to the database of their shard key.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--from',
+            nargs='+',
+            dest='sources',
+            help='Databases to move rows out of, all of DATABASES by default.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows to move.',
+        )
+
+    def handle(self, *args, **options):
+        # run after adding a database to SHARD_DATABASES (and migrating it),
+        # rows are copied before they are deleted so a row is never lost
+        sources = options['sources'] or list(settings.DATABASES)
+        for label in SHARD_KEYS:
+            model_class = apps.get_model(label)
+            for source in sources:
+                moved = self.reshard(
+                    model_class,
+                    source,
+                    options['batch_size'],
+                    options['dry_run'],
+                )
+                for target, count in moved.items():
+                    self.stdout.write('{} {} rows of {} from {} to {}'.format(
+                        'would move' if options['dry_run'] else 'moved',
+                        count,
+                        label,
+                        source,
+                        target,
+                    ))
+
+    def reshard(self, model_class, source, batch_size, dry_run):
+        # {target database: rows moved}, rows are read in pk order
+        moved = defaultdict(int)
+        queryset = model_class.objects.using(source).order_by('pk')
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(batch[:batch_size])
+            if not rows:
+                return moved
+            last_pk = rows[-1].pk
+
+            rows_by_target = defaultdict(list)
+            for row in rows:
+                target = ShardHelper.get_database(ShardHelper.get_shard_key(row))
+                if target != source:
+                    rows_by_target[target].append(row)
+            for target, target_rows in rows_by_target.items():
+                moved[target] += len(target_rows)
+                if not dry_run:
+                    self.move(model_class, source, target, target_rows)
+
+    def move(self, model_class, source, target, rows):
+        # the copy is committed on the target before anything is deleted from
+        # the source, a failure in between leaves the rows on both databases
+        # and the next run deletes them from the source
+        pks = [row.pk for row in rows]
+        with transaction.atomic(using=target):
+            model_class.objects.using(target).bulk_create(rows, ignore_conflicts=True)
+        copied = set(
+            model_class.objects.using(target)
+            .filter(pk__in=pks)
+            .values_list('pk', flat=True)
+        )
+        if len(copied) != len(pks):
+            raise CommandError('{} of {} rows of {} were not copied to {}'.format(
+                len(pks) - len(copied),
+                len(pks),
+                model_class._meta.label_lower,
+                target,
+            ))
+        with transaction.atomic(using=source):
+            # a raw delete does not send pre_delete, the likes_count of the
+            # liked objects stays the same
+            model_class.objects.using(source).filter(
+                pk__in=pks,
+            )._raw_delete(source)
\ No newline at end of file
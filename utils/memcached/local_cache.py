@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.db import models
+from redis.exceptions import RedisError
+from utils.redis.redis_client import RedisClient
+import copy
+import os
+import threading
+import time
+
+
+def copy_instance(value):
+    # cached instances are shared by the threads of a process, everyone gets
+    # a copy so attributes set on it (_cached_user_profile) stay private
+    if not isinstance(value, models.Model):
+        return value
+    instance = value.__class__.__new__(value.__class__)
+    instance.__dict__ = dict(value.__dict__)
+    instance._state = copy.copy(value._state)
+    instance._state.fields_cache = {}
+    return instance
+
+
+class LocalCache:
+    # a size bounded per process LRU with a ttl in front of memcached, which
+    # is still the source of truth. Deleted keys are published on a redis
+    # channel, every process drops them from its own LocalCache
+
+    def __init__(self, max_size, ttl, channel):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.channel = channel
+        self.entries = OrderedDict()  # key -> (expire_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.listener_pid = None
+        self.pubsub = None
+        # the local tier is bypassed while deletions can not be received
+        self.subscribed = False
+        self.retry_at = 0
+
+    def get_many(self, keys):
+        if not self.start_listener():
+            return {}
+        now = time.monotonic()
+        values = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] < now:
+                    del self.entries[key]
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self.entries.move_to_end(key)
+                values[key] = entry[1]
+        return {key: copy_instance(value) for key, value in values.items()}
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, mapping):
+        if not self.start_listener():
+            return
+        expire_at = time.monotonic() + self.ttl
+        entries = [(key, copy_instance(value)) for key, value in mapping.items()]
+        with self.lock:
+            for key, value in entries:
+                self.entries[key] = (expire_at, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        self.delete_local(key)
+        try:
+            RedisClient.get_connection().publish(self.channel, key)
+        except RedisError:
+            # the other processes keep the key until it expires
+            pass
+
+    def delete_local(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def start_listener(self):
+        # one subscriber thread per process, a forked process starts its own
+        # and drops the entries it inherited. Returns False while the process
+        # is not subscribed, a failed start is retried after a while instead
+        # of on every lookup
+        if self.listener_pid == os.getpid():
+            return self.subscribed
+
+        with self.lock:
+            if self.listener_pid == os.getpid():
+                return self.subscribed
+            if time.monotonic() < self.retry_at:
+                return False
+            self.entries.clear()
+            try:
+                pubsub = RedisClient.get_pubsub()
+                # subscribed before anything is cached, no deletion is missed
+                pubsub.subscribe(self.channel)
+            except RedisError:
+                self.retry_at = time.monotonic() + settings.LOCAL_CACHE_RETRY_INTERVAL
+                return False
+            self.pubsub = pubsub
+            self.listener_pid = os.getpid()
+            self.subscribed = True
+        threading.Thread(target=self.listen, args=(pubsub,), daemon=True).start()
+        return True
+
+    def listen(self, pubsub):
+        disconnected = False
+        while True:
+            try:
+                message = pubsub.get_message(timeout=1)
+            except RedisError:
+                # deletions published while disconnected are lost, nothing is
+                # cached until pubsub reconnects and subscribes again
+                disconnected = True
+                self.subscribed = False
+                self.clear()
+                time.sleep(settings.LOCAL_CACHE_RETRY_INTERVAL)
+                continue
+            if disconnected:
+                disconnected = False
+                self.clear()
+                self.subscribed = True
+            if message is not None:
+                self.delete_local(message['data'].decode())
\ No newline at end of file
@@ -1,27 +1,81 @@
 from django.conf import settings
 from django.core.cache import caches
+from twitter.cache import OBJECT_CACHE_VERSIONS, OBJECT_PATTERN
 
 cache = caches['testing'] if settings.TESTING else caches['default']
+# cached in place of an object that is not in db, so lookups of deleted or
+# made up ids do not query db every time. post_save listeners delete it
+TOMBSTONE = 'tombstone'
 
 
 class MemcachedHelper:
 
     @classmethod
     def get_key(cls, model_class, object_id):
-        # model_class.__class__.__name__ to get class name, Tweet =>'Tweet', User=>'User'
-        return '{}:{}'.format(model_class.__class__.__name__, object_id)
+        # 'tweets.tweet:v1:5', models without a version in
+        # OBJECT_CACHE_VERSIONS are at version 1
+        label = model_class._meta.label_lower
+        return OBJECT_PATTERN.format(
+            label=label,
+            version=OBJECT_CACHE_VERSIONS.get(label, 1),
+            object_id=object_id,
+        )
 
     @classmethod
     def get_object_through_memcached(cls, model_class, object_id):
         key = cls.get_key(model_class, object_id)
         obj = cache.get(key) # cache hit
+        if obj == TOMBSTONE:
+            raise model_class.DoesNotExist
         if obj is not None:
             return obj
 
-        obj = model_class.objects.get(id=object_id) # cache miss
+        try:
+            obj = model_class.objects.get(id=object_id) # cache miss
+        except model_class.DoesNotExist:
+            cache.set(key, TOMBSTONE, settings.NEGATIVE_CACHE_TIMEOUT)
+            raise
         cache.set(key, obj)
         return obj
 
+    @classmethod
+    def get_objects_through_memcached(cls, model_class, object_ids):
+        # one get_many for all ids, one id__in query and one set_many for
+        # the misses. Returns {id: object}, ids not in db are left out
+        keys = {
+            cls.get_key(model_class, object_id): object_id
+            for object_id in set(object_ids)
+            if object_id is not None
+        }
+        cached_objects = cache.get_many(list(keys))
+        objects = {
+            keys[key]: obj
+            for key, obj in cached_objects.items()
+            if obj != TOMBSTONE
+        }
+        missing_ids = [
+            object_id for key, object_id in keys.items()
+            if key not in cached_objects
+        ]
+        if not missing_ids:
+            return objects
+
+        missing_objects = {
+            obj.id: obj
+            for obj in model_class.objects.filter(id__in=missing_ids)
+        }
+        cache.set_many({
+            cls.get_key(model_class, object_id): obj
+            for object_id, obj in missing_objects.items()
+        })
+        cache.set_many({
+            cls.get_key(model_class, object_id): TOMBSTONE
+            for object_id in missing_ids
+            if object_id not in missing_objects
+        }, settings.NEGATIVE_CACHE_TIMEOUT)
+        objects.update(missing_objects)
+        return objects
+
     @classmethod
     def invalidate_cached_object(cls, model_class, object_id):
         key = cls.get_key(model_class, object_id)
@@ -0,0 +1,111 @@
+from django.contrib.auth.models import User
+from testing.testcases import TestCase
+from tweets.models import Tweet
+from twitter.cache import OBJECT_CACHE_VERSIONS
+from unittest import mock
+from utils.memcached.memcached_helper import MemcachedHelper
+
+
+class MemcachedHelperTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user = self.create_user('testuser')
+
+    def test_get_objects_through_memcached(self):
+        tweets = [self.create_tweet(self.user) for _ in range(3)]
+        tweet_ids = [tweet.id for tweet in tweets]
+
+        # cache miss, all misses are loaded in one query
+        with self.assertNumQueries(1):
+            cached_tweets = MemcachedHelper.get_objects_through_memcached(
+                Tweet,
+                tweet_ids + [tweet_ids[0], -1],
+            )
+        self.assertEqual(sorted(cached_tweets.keys()), sorted(tweet_ids))
+        self.assertEqual(cached_tweets[tweets[0].id], tweets[0])
+
+        # cache hit
+        with self.assertNumQueries(0):
+            cached_tweets = MemcachedHelper.get_objects_through_memcached(
+                Tweet,
+                tweet_ids,
+            )
+        self.assertEqual(sorted(cached_tweets.keys()), sorted(tweet_ids))
+
+        # updated tweet is invalidated
+        tweets[1].content = 'new content'
+        tweets[1].save()
+        with self.assertNumQueries(1):
+            cached_tweets = MemcachedHelper.get_objects_through_memcached(
+                Tweet,
+                tweet_ids,
+            )
+        self.assertEqual(cached_tweets[tweets[1].id].content, 'new content')
+
+    def test_versioned_keys(self):
+        tweet = self.create_tweet(self.user)
+        self.assertEqual(
+            MemcachedHelper.get_key(Tweet, tweet.id),
+            'tweets.tweet:v1:{}'.format(tweet.id),
+        )
+        # objects of different models with the same id do not share a key
+        self.assertNotEqual(
+            MemcachedHelper.get_key(Tweet, 1),
+            MemcachedHelper.get_key(User, 1),
+        )
+        self.assertEqual(
+            MemcachedHelper.get_object_through_memcached(User, self.user.id),
+            self.user,
+        )
+        self.assertEqual(
+            MemcachedHelper.get_object_through_memcached(Tweet, tweet.id),
+            tweet,
+        )
+
+        with self.assertNumQueries(0):
+            MemcachedHelper.get_object_through_memcached(Tweet, tweet.id)
+
+        # a new version of a model misses all its old keys at once
+        with mock.patch.dict(OBJECT_CACHE_VERSIONS, {'tweets.tweet': 2}):
+            self.assertEqual(
+                MemcachedHelper.get_key(Tweet, tweet.id),
+                'tweets.tweet:v2:{}'.format(tweet.id),
+            )
+            with self.assertNumQueries(1):
+                MemcachedHelper.get_object_through_memcached(Tweet, tweet.id)
+            with self.assertNumQueries(0):
+                MemcachedHelper.get_object_through_memcached(Tweet, tweet.id)
+                MemcachedHelper.get_object_through_memcached(User, self.user.id)
+
+    def test_negative_cache(self):
+        tweet = self.create_tweet(self.user)
+        missing_id = tweet.id + 100
+        MemcachedHelper.get_object_through_memcached(Tweet, tweet.id)
+
+        with self.assertNumQueries(1):
+            with self.assertRaises(Tweet.DoesNotExist):
+                MemcachedHelper.get_object_through_memcached(Tweet, missing_id)
+        with self.assertNumQueries(0):
+            with self.assertRaises(Tweet.DoesNotExist):
+                MemcachedHelper.get_object_through_memcached(Tweet, missing_id)
+            self.assertEqual(
+                MemcachedHelper.get_objects_through_memcached(
+                    Tweet,
+                    [tweet.id, missing_id],
+                ),
+                {tweet.id: tweet},
+            )
+
+        other_id = missing_id + 1
+        with self.assertNumQueries(1):
+            MemcachedHelper.get_objects_through_memcached(Tweet, [other_id])
+        with self.assertNumQueries(0):
+            MemcachedHelper.get_objects_through_memcached(Tweet, [other_id])
+
+        # post_save clears the tombstone
+        Tweet.objects.create(id=missing_id, user=self.user, content='new')
+        self.assertEqual(
+            MemcachedHelper.get_object_through_memcached(Tweet, missing_id).content,
+            'new',
+        )
\ No newline at end of file
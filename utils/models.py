@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class CounterFlush(models.Model):
+    # a batch of counter deltas written to db by flush_counter_deltas, it is
+    # saved in the transaction of the update so a batch is never written twice
+    flush_id = models.CharField(max_length=32, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return '{} flushed at {}'.format(self.flush_id, self.created_at)
\ No newline at end of file
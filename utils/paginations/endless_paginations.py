@@ -1,42 +1,76 @@
+from bisect import bisect_left, bisect_right
 from dateutil import parser
 from django.conf import settings
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
+from utils.redis.redis_serializers import get_reverse_keys, to_sort_key
+
+# a page is cut by id__lt / id__gt or by created_at__lt / created_at__gt
+CURSOR_FIELDS = ('id', 'created_at')
 
 
 class EndlessPagination(BasePagination):
     page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
     has_next_page = False
+    # only the newest page is returned for created_at__gt, has_gap tells the
+    # client there are more new objects between the page and its cursor
+    has_gap = False
+
+    def set_page_size(self, request):
+        # ?page_size= is optional, bounded by max_page_size
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return
+        if page_size > 0:
+            self.page_size = min(page_size, self.max_page_size)
+
+    def get_cursor(self, request, lookup, fields=CURSOR_FIELDS):
+        # (field, value) of the first {field}__{lookup} cursor in the query,
+        # (None, None) without one. id cursors only work on lists of one model
+        for field in fields:
+            param = '{}__{}'.format(field, lookup)
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                if field == 'id':
+                    return field, int(value)
+                # '2021-11-02 13:21:23.123456'
+                return field, parser.isoparse(value)
+            except (ValueError, OverflowError):
+                raise ValidationError({param: '{} is not a valid cursor.'.format(value)})
+        return None, None
 
     def paginate_ordered_list(self, reverse_ordered_list, request):
-        if 'created_at__gt' in request.query_params:
-            # '2021-11-02 13:21:23.123456'
-            created_at__gt = parser.isoparse(request.query_params['created_at__gt'])
-            objects = []
-            for obj in reverse_ordered_list:
-                if obj.created_at > created_at__gt:
-                    objects.append(obj)
-                else:
-                    break
+        self.set_page_size(request)
+        field, value = self.get_cursor(request, 'gt')
+        if field is not None:
+            reverse_keys = get_reverse_keys(reverse_ordered_list, field)
+            end = bisect_left(reverse_keys, -to_sort_key(value))
             self.has_next_page = False
+            self.has_gap = end > self.page_size
 
-            return objects
+            return reverse_ordered_list[:min(end, self.page_size)]
 
         index = 0
-        if 'created_at__lt' in request.query_params:
-            created_at__lt = parser.isoparse(request.query_params['created_at__lt'])
-            for index, obj in enumerate(reverse_ordered_list):
-                if obj.created_at < created_at__lt:
-                    break
-            else:
-                reverse_ordered_list = []
+        field, value = self.get_cursor(request, 'lt')
+        if field is not None:
+            reverse_keys = get_reverse_keys(reverse_ordered_list, field)
+            index = bisect_right(reverse_keys, -to_sort_key(value))
         self.has_next_page = len(reverse_ordered_list) - 1 >= index + self.page_size
 
         return reverse_ordered_list[index: index + self.page_size]
 
     def get_paginated_cached_list_in_redis(self, cached_list, request):
         paginated_list = self.paginate_ordered_list(cached_list, request)
-        if 'created_at__gt' in request.query_params:
+        if self.get_cursor(request, 'gt')[0] is not None:
+            # every cached object is new, older new ones may only be in db
+            if len(paginated_list) == len(cached_list) >= settings.REDIS_LIST_LENGTH_LIMIT:
+                self.has_gap = True
             return paginated_list
 
         if self.has_next_page:
@@ -46,24 +80,65 @@ class EndlessPagination(BasePagination):
             return paginated_list
         return None
 
-    def paginate_queryset(self, queryset, request, view=None):
-        if 'created_at__gt' in request.query_params:
-            queryset = queryset.filter(
-                created_at__gt=request.query_params['created_at__gt']
+    def paginate_load_page(self, load_page, request):
+        # load_page(created_at__gt, created_at__lt, count) returns the
+        # objects in the range and the created_at under which it may miss
+        # objects (a cache), None means it has everything. Returns None when
+        # the page is not complete. Only created_at cursors are used, pages
+        # may mix newsfeeds and pulled tweets
+        self.set_page_size(request)
+        for lookup in ('gt', 'lt'):
+            param = 'id__{}'.format(lookup)
+            if param in request.query_params:
+                raise ValidationError({
+                    param: 'use created_at__{} to page this list.'.format(lookup),
+                })
+        _, created_at__gt = self.get_cursor(request, 'gt', fields=('created_at', ))
+        if created_at__gt is not None:
+            objects, horizon = load_page(
+                created_at__gt=created_at__gt,
+                count=self.page_size + 1,
             )
             self.has_next_page = False
-            return queryset.order_by('-created_at')
-
-        if 'created_at__lt' in request.query_params:
-            queryset = queryset.filter(
-                created_at__lt=request.query_params['created_at__lt']
+            self.has_gap = len(objects) > self.page_size or (
+                horizon is not None and created_at__gt < horizon
             )
-        queryset = queryset.order_by('-created_at')[:self.page_size + 1]
+            return objects[:self.page_size]
+
+        _, created_at__lt = self.get_cursor(request, 'lt', fields=('created_at', ))
+        objects, horizon = load_page(
+            created_at__lt=created_at__lt,
+            count=self.page_size + 1,
+        )
+        self.has_next_page = len(objects) > self.page_size
+        objects = objects[:self.page_size]
+        if horizon is None:
+            return objects
+        # the page is complete only when it ends before reaching the horizon
+        if self.has_next_page and objects[-1].created_at >= horizon:
+            return objects
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.set_page_size(request)
+        field, value = self.get_cursor(request, 'gt')
+        if field is not None:
+            queryset = queryset.filter(**{'{}__gt'.format(field): value})
+            queryset = queryset.order_by('-' + field)[:self.page_size + 1]
+            self.has_next_page = False
+            self.has_gap = len(queryset) > self.page_size
+            return queryset[:self.page_size]
+
+        field, value = self.get_cursor(request, 'lt')
+        if field is not None:
+            queryset = queryset.filter(**{'{}__lt'.format(field): value})
+        queryset = queryset.order_by('-' + (field or 'created_at'))[:self.page_size + 1]
         self.has_next_page = len(queryset) > self.page_size
         return queryset[:self.page_size]
 
     def get_paginated_response(self, data):
         return Response({
             'has_next_page': self.has_next_page,
+            'has_gap': self.has_gap,
             'results': data,
         })
\ No newline at end of file
@@ -0,0 +1,50 @@
+from bisect import bisect
+from twitter.cache import REDIS_KEY_PATTERNS
+import hashlib
+import re
+
+
+def hash_value(value):
+    # stable across processes, unlike hash()
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+def pattern_to_shard_regex(pattern):
+    # 'user_tweet:{user_id}' -> ^user_tweet:([^:]+), the last field of a
+    # pattern is the id its keys are sharded by
+    parts = re.split(r'\{\w+\}', pattern)
+    regex = '^'
+    for index, part in enumerate(parts[:-1]):
+        regex += re.escape(part)
+        regex += '([^:]+)' if index == len(parts) - 2 else '[^:]+'
+    return re.compile(regex)
+
+
+SHARD_REGEXES = [pattern_to_shard_regex(pattern) for pattern in REDIS_KEY_PATTERNS]
+
+
+def get_shard_key(key):
+    # keys made from a cached key ('{key}:lock', '{key}:tmp:...') go to the
+    # node of that key, other keys are sharded by their first segment
+    for regex in SHARD_REGEXES:
+        match = regex.match(key)
+        if match:
+            return match.group(1)
+    return key.split(':', 1)[0]
+
+
+class ConsistentHashRing:
+
+    def __init__(self, nodes, virtual_nodes=160):
+        # each node is put on the ring virtual_nodes times, adding a node
+        # only moves about 1 / len(nodes) of the keys
+        self.ring = sorted(
+            (hash_value('{}#{}'.format(node, index)), node)
+            for node in nodes
+            for index in range(virtual_nodes)
+        )
+        self.positions = [position for position, _ in self.ring]
+
+    def get_node(self, key):
+        index = bisect(self.positions, hash_value(get_shard_key(key)))
+        return self.ring[index % len(self.ring)][1]
\ No newline at end of file
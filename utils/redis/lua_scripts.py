@@ -0,0 +1,154 @@
+# server side scripts of RedisHelper, each of them runs atomically in one
+# round trip. They are loaded once and called by sha (EVALSHA)
+
+# add a member only when the sorted set is cached, cold caches are left to
+# be rebuilt from db on the next read. While a rebuild holds the lock KEYS[2]
+# its db snapshot may miss the member, it is kept in KEYS[3] and merged by
+# the rebuild
+PUSH_SORTED_MEMBER_IF_CACHED = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return 0
+    end
+    redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+    redis.call('EXPIRE', KEYS[3], ARGV[4])
+    return 1
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# push to the head of a cached list, keep the newest ARGV[2] items and
+# refresh its ttl to ARGV[3]. While a rebuild holds the lock KEYS[2] the
+# object is kept in KEYS[3] and put in front of the db snapshot by the rebuild
+PUSH_OBJECT_IF_CACHED = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return 0
+    end
+    redis.call('LPUSH', KEYS[3], ARGV[1])
+    redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[2]) - 1)
+    redis.call('EXPIRE', KEYS[3], ARGV[3])
+    return 1
+end
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+# record a pending delta of a counter in KEYS[2] and change the cached
+# counter KEYS[1] and its ttl ARGV[3], returns false when the counter is
+# not cached
+INCR_COUNT = """
+redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return redis.call('INCRBY', KEYS[1], ARGV[2])
+"""
+
+# set a counter to its db value plus the deltas not flushed to db yet,
+# unless another client set it first. The value in redis wins and is
+# returned. ARGV[4] is the flush id KEYS[4] had before db was read and
+# ARGV[5] is '1' when db included that flush. Returns false when it can not
+# tell which deltas db included, a flush started or finished meanwhile
+SET_COUNT_IF_MISSING = """
+local flush_id = redis.call('GET', KEYS[4]) or ''
+if flush_id ~= ARGV[4] then
+    return false
+end
+local count = tonumber(ARGV[1])
+    + tonumber(redis.call('HGET', KEYS[2], ARGV[3]) or 0)
+if flush_id ~= '' and ARGV[5] ~= '1' then
+    if redis.call('EXISTS', KEYS[3]) == 0 then
+        return false
+    end
+    count = count + tonumber(redis.call('HGET', KEYS[3], ARGV[3]) or 0)
+end
+redis.call('SET', KEYS[1], count, 'EX', ARGV[2], 'NX')
+return tonumber(redis.call('GET', KEYS[1]))
+"""
+
+# move the pending deltas KEYS[1] aside to KEYS[2] as flush ARGV[1] and
+# return its id. A flush that failed halfway is returned instead, false
+# when there is nothing to flush
+START_FLUSH = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    local flush_id = redis.call('GET', KEYS[3])
+    if not flush_id then
+        redis.call('SET', KEYS[3], ARGV[1])
+        flush_id = ARGV[1]
+    end
+    return flush_id
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('SET', KEYS[3], ARGV[1])
+return ARGV[1]
+"""
+
+# drop the deltas of flush ARGV[1] once they are in db
+FINISH_FLUSH = """
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+# delete a lock only when it is still held by the token that set it
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+# lease the first worker id from 0 to ARGV[1] that is free or whose lease
+# expired, to token ARGV[2] for ARGV[3] milliseconds. Expiry is on the redis
+# clock so the clocks of the processes do not matter
+LEASE_WORKER_ID = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now_ms = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+for worker_id = 0, tonumber(ARGV[1]) do
+    local lease = redis.call('HGET', KEYS[1], worker_id)
+    if not lease or tonumber(string.match(lease, ':(%d+)$')) < now_ms then
+        redis.call('HSET', KEYS[1], worker_id, ARGV[2] .. ':' .. (now_ms + tonumber(ARGV[3])))
+        return worker_id
+    end
+end
+return false
+"""
+
+# extend the lease of worker id ARGV[1] when it is still held by token
+# ARGV[2] and has not expired, returns 0 when it was lost
+RENEW_WORKER_ID = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now_ms = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local lease = redis.call('HGET', KEYS[1], ARGV[1])
+if not lease or string.sub(lease, 1, #ARGV[2] + 1) ~= ARGV[2] .. ':'
+        or tonumber(string.match(lease, ':(%d+)$')) < now_ms then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. ':' .. (now_ms + tonumber(ARGV[3])))
+return 1
+"""
+
+# drop the lease of worker id ARGV[1] when it is still held by token ARGV[2]
+RELEASE_WORKER_ID = """
+local lease = redis.call('HGET', KEYS[1], ARGV[1])
+if lease and string.sub(lease, 1, #ARGV[2] + 1) == ARGV[2] .. ':' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
\ No newline at end of file
@@ -1,27 +1,173 @@
 from django.conf import settings
+from redis.exceptions import ConnectionError, TimeoutError
+from utils.redis.consistent_hash import ConsistentHashRing
+import os
 import redis
+import time
+
+# read only commands and writes that give the same result when run twice,
+# they are safe to resend after the connection dropped in the middle
+IDEMPOTENT_COMMANDS = {
+    'DEL',
+    'EXISTS',
+    'EXPIRE',
+    'GET',
+    'LLEN',
+    'LRANGE',
+    'MGET',
+    'PING',
+    'SET',
+    'TTL',
+    'ZCARD',
+    'ZCOUNT',
+    'ZRANGE',
+    'ZRANGEBYSCORE',
+    'ZREVRANGE',
+    'ZREVRANGEBYSCORE',
+    'ZSCORE',
+}
+
+
+class RetryingRedis(redis.Redis):
+
+    def execute_command(self, *args, **options):
+        if args[0].upper() not in IDEMPOTENT_COMMANDS:
+            return super().execute_command(*args, **options)
+
+        attempt = 0
+        while True:
+            try:
+                return super().execute_command(*args, **options)
+            except (ConnectionError, TimeoutError):
+                # the broken connection is disconnected by redis-py, the
+                # next attempt takes a fresh one from the pool
+                if attempt >= settings.REDIS_RETRY_ATTEMPTS:
+                    raise
+                time.sleep(settings.REDIS_RETRY_BACKOFF * (2 ** attempt))
+                attempt += 1
 
 
 class RedisClient:
-    conn = None
+    # one client per node of REDIS_NODES, keys are routed to the nodes by
+    # consistent hashing of the id in their twitter/cache.py pattern
+    conns = None
+    ring = None
+    nodes = None
+    pid = None
+
+    @classmethod
+    def get_node_name(cls, node):
+        return '{}:{}/{}'.format(node['host'], node['port'], node.get('db', 0))
 
     @classmethod
-    def get_connection(cls):
-        if cls.conn != None:
-            return cls.conn
+    def get_connection_options(cls, node):
+        return {
+            'host': node['host'],
+            'port': node['port'],
+            'db': node.get('db', 0),
+            'socket_connect_timeout': settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            'socket_keepalive': True,
+            'health_check_interval': settings.REDIS_HEALTH_CHECK_INTERVAL,
+        }
 
-        cls.conn = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
+    @classmethod
+    def create_connection_pool(cls, node):
+        # a blocking pool waits for a free connection when all of them are
+        # in use instead of opening new ones without limit
+        return redis.BlockingConnectionPool(
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            **cls.get_connection_options(node),
         )
 
-        return cls.conn
+    @classmethod
+    def connect(cls):
+        # a client inherited through fork() (celery prefork, wsgi workers)
+        # shares sockets with the parent process, so each process builds
+        # its own pools
+        if cls.conns is not None and cls.pid == os.getpid() \
+                and cls.nodes is settings.REDIS_NODES:
+            return
+
+        cls.conns = {
+            cls.get_node_name(node): RetryingRedis(
+                connection_pool=cls.create_connection_pool(node),
+            )
+            for node in settings.REDIS_NODES
+        }
+        cls.ring = ConsistentHashRing(cls.conns, settings.REDIS_VIRTUAL_NODES)
+        cls.nodes = settings.REDIS_NODES
+        cls.pid = os.getpid()
+
+    @classmethod
+    def get_connection(cls, key=None):
+        # the node of key, keys that are not sharded live on the first node
+        cls.connect()
+        if key is None:
+            return cls.conns[cls.get_node_name(cls.nodes[0])]
+        return cls.conns[cls.ring.get_node(key)]
+
+    @classmethod
+    def get_pubsub(cls):
+        # a subscription keeps its connection for good, so it gets its own
+        # instead of taking one of the pooled connections
+        cls.connect()
+        pool = redis.ConnectionPool(
+            max_connections=1,
+            **cls.get_connection_options(cls.nodes[0]),
+        )
+        return redis.Redis(connection_pool=pool).pubsub(
+            ignore_subscribe_messages=True,
+        )
+
+    @classmethod
+    def get_connections(cls):
+        cls.connect()
+        return list(cls.conns.values())
+
+    @classmethod
+    def get_connections_by_name(cls):
+        cls.connect()
+        return dict(cls.conns)
+
+    @classmethod
+    def group_keys_by_connection(cls, keys):
+        # {conn: keys of its node}, to send one pipeline per node
+        keys_by_connection = {}
+        for key in keys:
+            keys_by_connection.setdefault(cls.get_connection(key), []).append(key)
+        return keys_by_connection
+
+    @classmethod
+    def get_pool_stats(cls):
+        nodes = []
+        for name, conn in cls.get_connections_by_name().items():
+            pool = conn.connection_pool
+            created = len(pool._connections)
+            available = len([c for c in pool.pool.queue if c is not None])
+            nodes.append({
+                'node': name,
+                'max_connections': pool.max_connections,
+                'created_connections': created,
+                'in_use_connections': created - available,
+                'available_connections': available,
+            })
+
+        stats = {'pid': cls.pid, 'nodes': nodes}
+        for field in [
+            'max_connections',
+            'created_connections',
+            'in_use_connections',
+            'available_connections',
+        ]:
+            stats[field] = sum(node[field] for node in nodes)
+        return stats
 
     @classmethod
     def clear(cls):
         if not settings.TESTING:
             raise Exception("You can not flush redis in production environment")
 
-        conn = cls.get_connection()
-        conn.flushdb()
\ No newline at end of file
+        for conn in cls.get_connections():
+            conn.flushdb()
\ No newline at end of file
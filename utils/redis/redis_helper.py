@@ -1,84 +1,641 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.apps import apps
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from functools import partial
+from twitter.cache import (
+    COUNT_PATTERN,
+    COUNTER_DELTAS_KEY,
+    COUNTER_FLUSH_ID_KEY,
+    FLUSHING_COUNTER_DELTAS_KEY,
+)
+from utils.models import CounterFlush
+from utils.redis.lua_scripts import (
+    FINISH_FLUSH,
+    INCR_COUNT,
+    PUSH_OBJECT_IF_CACHED,
+    PUSH_SORTED_MEMBER_IF_CACHED,
+    RELEASE_LOCK,
+    SET_COUNT_IF_MISSING,
+    START_FLUSH,
+)
 from utils.redis.redis_client import RedisClient
-from utils.redis.redis_serializers import DjangoModelSerializer
+from utils.redis.redis_serializers import DeserializedList, DjangoModelSerializer
+from utils.time_helpers import datetime_to_score, score_to_datetime, utc_now
+import time
+import uuid
+
 
 
 class RedisHelper:
+    scripts = {}
+
+    @classmethod
+    def get_script(cls, source):
+        # Script objects send EVALSHA and only load the source again when
+        # redis answers NOSCRIPT, e.g. after a restart
+        if source not in cls.scripts:
+            cls.scripts[source] = RedisClient.get_connection().register_script(source)
+        return cls.scripts[source]
+
+    @classmethod
+    def acquire_lock(cls, key):
+        # returns the token of the lock, or None when it is held by others
+        token = uuid.uuid4().hex
+        conn = RedisClient.get_connection(key)
+        if conn.set(
+            '{}:lock'.format(key),
+            token,
+            nx=True,
+            px=settings.REDIS_LOCK_TIMEOUT,
+        ):
+            return token
+        return None
+
+    @classmethod
+    def release_lock(cls, key, token):
+        cls.get_script(RELEASE_LOCK)(
+            keys=['{}:lock'.format(key)],
+            args=[token],
+            client=RedisClient.get_connection(key),
+        )
 
     @classmethod
     def _load_objects_to_cache(cls, key, queryset):
-        conn = RedisClient.get_connection()
-        serialized_list = []
-        for obj in queryset[:settings.REDIS_LIST_LENGTH_LIMIT]:
-            serialized_data = DjangoModelSerializer.serialize(obj)
-            serialized_list.append(serialized_data)
+        # only one client rebuilds a missing list, returns the objects it
+        # cached or None when another one is doing it. Objects pushed while
+        # the lock is held are kept in the pending list, the ones missing in
+        # the db snapshot are put in front of it
+        token = cls.acquire_lock(key)
+        if token is None:
+            return None
+
+        try:
+            objects = list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
+            serialized_list = [
+                DjangoModelSerializer.serialize(obj)
+                for obj in objects
+            ]
+            loaded_ids = {obj.id for obj in objects}
+            pending_key = '{}:pending'.format(key)
+            tmp_key = '{}:tmp:{}'.format(key, token)
+
+            def rebuild(pipe):
+                pushed_list, pushed_objects = [], []
+                for serialized_data in pipe.lrange(pending_key, 0, -1):
+                    obj = DjangoModelSerializer.deserializer(serialized_data)
+                    if obj.id not in loaded_ids:
+                        pushed_list.append(serialized_data)
+                        pushed_objects.append(obj)
+                # readers never see a half built list
+                pipe.multi()
+                if pushed_list or serialized_list:
+                    pipe.rpush(tmp_key, *pushed_list, *serialized_list)
+                    pipe.ltrim(tmp_key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+                    pipe.expire(tmp_key, settings.REDIS_KEY_EXPIRE_TIME)
+                    pipe.rename(tmp_key, key)
+                pipe.delete(pending_key)
+                return pushed_objects
 
-        if serialized_list:
-            conn.rpush(key, *serialized_list)
+            # a push to the pending list while it is merged runs it again
+            pushed_objects = RedisClient.get_connection(key).transaction(
+                rebuild,
+                pending_key,
+                value_from_callable=True,
+            )
+        finally:
+            cls.release_lock(key, token)
+        return (pushed_objects + objects)[:settings.REDIS_LIST_LENGTH_LIMIT]
 
     @classmethod
-    def load_objects(cls, key, queryset):
-        conn = RedisClient.get_connection()
-        if conn.exists(key):
+    def _wait_for_objects(cls, key):
+        conn = RedisClient.get_connection(key)
+        deadline = time.monotonic() + settings.REDIS_LOCK_WAIT_TIME
+        while time.monotonic() < deadline:
+            time.sleep(settings.REDIS_LOCK_POLL_INTERVAL)
             serialized_list = conn.lrange(key, 0, -1)
-            objects = []
-            for serialized_data in serialized_list:
-                deserialized_data = DjangoModelSerializer.deserializer(serialized_data)
-                objects.append(deserialized_data)
-            return objects
+            if serialized_list:
+                return serialized_list
+        return []
 
-        cls._load_objects_to_cache(key, queryset)
-        return list(queryset)
+    @classmethod
+    def load_objects(cls, key, queryset):
+        # reading a list keeps it cached for another REDIS_KEY_EXPIRE_TIME
+        pipe = RedisClient.get_connection(key).pipeline(transaction=False)
+        pipe.lrange(key, 0, -1)
+        pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        serialized_list, _ = pipe.execute()
+        if not serialized_list:
+            # what the cache keeps, a full list tells the caller older
+            # objects are only in db
+            objects = cls._load_objects_to_cache(key, queryset)
+            if objects is not None:
+                return objects
+            # another request is rebuilding the list, wait for it shortly
+            # and read from db when it takes too long
+            serialized_list = cls._wait_for_objects(key)
+            if not serialized_list:
+                return list(queryset[:settings.REDIS_LIST_LENGTH_LIMIT])
+
+        # deserialized when read, a page only builds the objects it returns
+        return DeserializedList(serialized_list)
 
     @classmethod
     def push_object(cls, key, obj, queryset):
-        conn = RedisClient.get_connection()
-        if not conn.exists(key):
+        pushed = cls.get_script(PUSH_OBJECT_IF_CACHED)(
+            keys=[key, '{}:lock'.format(key), '{}:pending'.format(key)],
+            args=[
+                DjangoModelSerializer.serialize(obj),
+                settings.REDIS_LIST_LENGTH_LIMIT,
+                settings.REDIS_KEY_EXPIRE_TIME,
+            ],
+            client=RedisClient.get_connection(key),
+        )
+        if not pushed:
             cls._load_objects_to_cache(key, queryset)
+
+    @classmethod
+    def _load_sorted_objects_to_cache(cls, key, queryset, serializer):
+        # the lock tells fanouts a rebuild is running, members they push
+        # meanwhile are merged from the pending set together with the db
+        # snapshot. Members are only ever added, so a client that did not
+        # get the lock rebuilds the set as well
+        conn = RedisClient.get_connection(key)
+        token = cls.acquire_lock(key)
+        try:
+            mapping = dict(
+                serializer.serialize(obj)
+                for obj in queryset[:settings.REDIS_LIST_LENGTH_LIMIT]
+            )
+            pending_key = '{}:pending'.format(key)
+            pipe = conn.pipeline()
+            if mapping:
+                pipe.zadd(key, mapping)
+            pipe.zunionstore(key, [key, pending_key], aggregate='MAX')
+            pipe.delete(pending_key)
+            pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+            pipe.execute()
+        finally:
+            if token is not None:
+                cls.release_lock(key, token)
+
+    @classmethod
+    def load_sorted_objects(
+        cls,
+        key,
+        queryset,
+        serializer,
+        created_at__gt=None,
+        created_at__lt=None,
+        count=None,
+    ):
+        # only the members in the requested range are deserialized. The
+        # created_at of the oldest cached member is returned when the sorted
+        # set is full (older objects may only be found in db), otherwise None
+        conn = RedisClient.get_connection(key)
+        if not conn.exists(key):
+            cls._load_sorted_objects_to_cache(key, queryset, serializer)
+
+        max_score = '+inf'
+        if created_at__lt is not None:
+            max_score = '({}'.format(datetime_to_score(created_at__lt))
+        min_score = '-inf'
+        if created_at__gt is not None:
+            min_score = '({}'.format(datetime_to_score(created_at__gt))
+
+        pipe = conn.pipeline()
+        pipe.zrevrangebyscore(
+            key,
+            max_score,
+            min_score,
+            start=0 if count is not None else None,
+            num=count,
+            withscores=True,
+        )
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        members, cached_size, oldest, _ = pipe.execute()
+
+        objects = [
+            serializer.deserializer(member, score)
+            for member, score in members
+        ]
+        if cached_size < settings.REDIS_LIST_LENGTH_LIMIT:
+            return objects, None
+        return objects, score_to_datetime(oldest[0][1])
+
+    @classmethod
+    def count_sorted_objects(cls, key, queryset, serializer, created_at__gt):
+        # how many cached members are newer than created_at__gt without
+        # reading them, and the horizon like load_sorted_objects
+        conn = RedisClient.get_connection(key)
+        if not conn.exists(key):
+            cls._load_sorted_objects_to_cache(key, queryset, serializer)
+
+        pipe = conn.pipeline()
+        pipe.zcount(key, '({}'.format(datetime_to_score(created_at__gt)), '+inf')
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        count, cached_size, oldest, _ = pipe.execute()
+        if cached_size < settings.REDIS_LIST_LENGTH_LIMIT:
+            return count, None
+        return count, score_to_datetime(oldest[0][1])
+
+    @classmethod
+    def push_sorted_object(cls, key, obj, queryset, serializer):
+        conn = RedisClient.get_connection(key)
+        if not conn.exists(key):
+            cls._load_sorted_objects_to_cache(key, queryset, serializer)
             return
 
-        serialized_data = DjangoModelSerializer.serialize(obj)
-        conn.lpush(key, serialized_data)
-        conn.ltrim(key, 0, settings.REDIS_LIST_LENGTH_LIMIT - 1)
+        member, score = serializer.serialize(obj)
+        pipe = conn.pipeline()
+        pipe.zadd(key, {member: score})
+        # only keep the newest REDIS_LIST_LENGTH_LIMIT members
+        pipe.zremrangebyrank(key, 0, -settings.REDIS_LIST_LENGTH_LIMIT - 1)
+        pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        pipe.execute()
+
+    @classmethod
+    def push_sorted_objects_if_cached(cls, key_object_pairs, serializer):
+        # one round trip per node, returns how many keys were updated
+        objects = dict(key_object_pairs)
+        script = cls.get_script(PUSH_SORTED_MEMBER_IF_CACHED)
+        pushed = 0
+        for conn, keys in RedisClient.group_keys_by_connection(objects).items():
+            pipe = conn.pipeline(transaction=False)
+            for key in keys:
+                member, score = serializer.serialize(objects[key])
+                script(
+                    keys=[key, '{}:lock'.format(key), '{}:pending'.format(key)],
+                    args=[
+                        member,
+                        score,
+                        settings.REDIS_LIST_LENGTH_LIMIT,
+                        settings.REDIS_KEY_EXPIRE_TIME,
+                    ],
+                    client=pipe,
+                )
+            pushed += sum(pipe.execute())
+        return pushed
 
     @classmethod
     def get_key(cls, obj, attr):
-        return '{}.{}:{}'.format(obj.__class__.__name__, attr, obj.id)
+        return COUNT_PATTERN.format(
+            model_name=obj.__class__.__name__,
+            attr=attr,
+            object_id=obj.id,
+        )
 
     @classmethod
-    def incr_count(cls, obj, attr):
+    def get_delta_field(cls, obj, attr):
+        return '{}.{}:{}'.format(obj._meta.label_lower, attr, obj.id)
+
+    @classmethod
+    def set_count_if_missing(cls, obj, attr, db_count, flush_id, applied, client=None):
+        # db_count is read from db, pending deltas are added in redis. Each
+        # node keeps the deltas of its own counters. flush_id is the last
+        # flush of the node read before db_count, applied tells whether
+        # db_count includes it. Returns None when the flush changed meanwhile
+        key = cls.get_key(obj, attr)
+        return cls.get_script(SET_COUNT_IF_MISSING)(
+            keys=[
+                key,
+                COUNTER_DELTAS_KEY,
+                FLUSHING_COUNTER_DELTAS_KEY,
+                COUNTER_FLUSH_ID_KEY,
+            ],
+            args=[
+                db_count or 0,
+                settings.REDIS_KEY_EXPIRE_TIME,
+                cls.get_delta_field(obj, attr),
+                flush_id,
+                int(applied),
+            ],
+            client=client or RedisClient.get_connection(key),
+        )
+
+    @classmethod
+    def load_counts(cls, counters):
+        # counters is {key: (obj, attr)} of counters missing in redis, they
+        # are read with one values() query per model and written back with
+        # one pipeline per node. The flush ids of the nodes are read first
+        # and checked in the same query, so a flush committed while loading
+        # is neither missed nor counted twice. Counters whose flush changed
+        # meanwhile are loaded again, objects missing in db are left out
+        counts = {}
+        for _ in range(settings.COUNTER_LOAD_ATTEMPTS):
+            keys_by_connection = RedisClient.group_keys_by_connection(counters)
+            flush_ids = {
+                conn: (conn.get(COUNTER_FLUSH_ID_KEY) or b'').decode()
+                for conn in keys_by_connection
+            }
+            flush_fields = {
+                flush_id: 'flush_{}'.format(index)
+                for index, flush_id in enumerate(set(flush_ids.values()) - {''})
+            }
+
+            fields = defaultdict(set)
+            for obj, attr in counters.values():
+                fields[obj.__class__].add(attr)
+            rows = {}
+            for model_class, attrs in fields.items():
+                queryset = model_class.objects.filter(id__in={
+                    obj.id for obj, _ in counters.values()
+                    if obj.__class__ is model_class
+                }).annotate(**{
+                    field: Exists(CounterFlush.objects.filter(flush_id=flush_id))
+                    for flush_id, field in flush_fields.items()
+                })
+                for row in queryset.values('id', *attrs, *flush_fields.values()):
+                    rows[(model_class, row['id'])] = row
+
+            retry = {}
+            for conn, keys in keys_by_connection.items():
+                keys = [
+                    key for key in keys
+                    if (counters[key][0].__class__, counters[key][0].id) in rows
+                ]
+                flush_id = flush_ids[conn]
+                pipe = conn.pipeline(transaction=False)
+                for key in keys:
+                    obj, attr = counters[key]
+                    row = rows[(obj.__class__, obj.id)]
+                    cls.set_count_if_missing(
+                        obj,
+                        attr,
+                        row[attr],
+                        flush_id,
+                        flush_id == '' or row[flush_fields[flush_id]],
+                        client=pipe,
+                    )
+                for key, count in zip(keys, pipe.execute()):
+                    if count is None:
+                        retry[key] = counters[key]
+                    else:
+                        counts[key] = count
+            counters = retry
+            if not counters:
+                return counts
+
+        # flushes keep going on, the db values are returned without caching
+        for key, (obj, attr) in counters.items():
+            counts[key] = rows[(obj.__class__, obj.id)][attr] or 0
+        return counts
+
+    @classmethod
+    def change_count(cls, obj, attr, delta):
+        # db is not updated here, the delta is kept in redis until
+        # flush_counter_deltas writes it to db
         key = cls.get_key(obj, attr)
-        conn = RedisClient.get_connection()
-        if conn.exists(key):
-            return conn.incr(key, 1) # increase count by 1 and return
+        count = cls.get_script(INCR_COUNT)(
+            keys=[key, COUNTER_DELTAS_KEY],
+            args=[
+                cls.get_delta_field(obj, attr),
+                delta,
+                settings.REDIS_KEY_EXPIRE_TIME,
+            ],
+            client=RedisClient.get_connection(key),
+        )
+        if count is not None:
+            return count
 
-        # refresh form db, don't need to add 1 before set key value
-        obj.refresh_from_db()
-        conn.set(key, getattr(obj, attr))
-        conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-        return getattr(obj, attr)
+        return cls.load_counts({key: (obj, attr)}).get(key, 0)
+
+    @classmethod
+    def incr_count(cls, obj, attr):
+        return cls.change_count(obj, attr, 1)
 
     @classmethod
     def decr_count(cls, obj, attr):
-        key = cls.get_key(obj, attr)
-        conn = RedisClient.get_connection()
-        if conn.exists(key):
-            return conn.decr(key, 1)
+        return cls.change_count(obj, attr, -1)
+
+    @classmethod
+    def flush_counter_deltas(cls):
+        # pending deltas of every node are moved aside with RENAME as a flush
+        # with its own id, changes made while flushing go to a new hash. The
+        # flush ids are saved in the transaction of the update, so a flush
+        # is written to db once even when redis fails after the commit.
+        # Returns how many counters are updated
+        token = cls.acquire_lock(FLUSHING_COUNTER_DELTAS_KEY)
+        if token is None:
+            return 0
+
+        try:
+            flush_ids = {}
+            for conn in RedisClient.get_connections():
+                flush_id = cls._start_flush(conn)
+                if flush_id is not None:
+                    flush_ids[conn] = flush_id
+            # a flush that failed after its commit is only dropped from
+            # redis, the deltas made since are flushed in this run
+            applied = set(CounterFlush.objects.filter(
+                flush_id__in=flush_ids.values(),
+            ).values_list('flush_id', flat=True))
+            for conn, flush_id in list(flush_ids.items()):
+                if flush_id not in applied:
+                    continue
+                cls._finish_flush(conn, flush_id)
+                flush_id = cls._start_flush(conn)
+                if flush_id is None:
+                    del flush_ids[conn]
+                else:
+                    flush_ids[conn] = flush_id
 
-        # refresh form db, don't need to minus 1 before set key value
-        obj.refresh_from_db()
-        conn.set(key, getattr(obj, attr))
-        conn.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
-        return getattr(obj, attr)
+            deltas = defaultdict(lambda: defaultdict(int))
+            for conn in flush_ids:
+                for field, delta in conn.hgetall(FLUSHING_COUNTER_DELTAS_KEY).items():
+                    name, object_id = field.decode().rsplit(':', 1)
+                    label, attr = name.rsplit('.', 1)
+                    # a counter moved to another node after nodes are added
+                    # may have deltas on both of them
+                    deltas[(label, attr)][int(object_id)] += int(delta)
+
+            with transaction.atomic():
+                for (label, attr), object_deltas in deltas.items():
+                    object_deltas = {
+                        object_id: delta
+                        for object_id, delta in object_deltas.items()
+                        if delta != 0
+                    }
+                    deltas[(label, attr)] = object_deltas
+                    cls._update_counts(apps.get_model(label), attr, object_deltas)
+                if flush_ids:
+                    CounterFlush.objects.bulk_create([
+                        CounterFlush(flush_id=flush_id)
+                        for flush_id in flush_ids.values()
+                    ])
+                    CounterFlush.objects.filter(created_at__lt=utc_now() - timedelta(
+                        seconds=settings.COUNTER_FLUSH_ID_RETENTION,
+                    )).delete()
+                # the deltas are dropped from redis only after they are in db
+                for conn, flush_id in flush_ids.items():
+                    transaction.on_commit(
+                        partial(cls._finish_flush, conn, flush_id),
+                    )
+        finally:
+            cls.release_lock(FLUSHING_COUNTER_DELTAS_KEY, token)
+
+        return sum(len(object_deltas) for object_deltas in deltas.values())
+
+    @classmethod
+    def _start_flush(cls, conn):
+        # the id of the flush of the node, None when there is nothing to flush
+        flush_id = cls.get_script(START_FLUSH)(
+            keys=[COUNTER_DELTAS_KEY, FLUSHING_COUNTER_DELTAS_KEY, COUNTER_FLUSH_ID_KEY],
+            args=[uuid.uuid4().hex],
+            client=conn,
+        )
+        return flush_id.decode() if flush_id is not None else None
 
     @classmethod
-    def get_count(cls, obj, attr):
+    def _finish_flush(cls, conn, flush_id):
+        cls.get_script(FINISH_FLUSH)(
+            keys=[FLUSHING_COUNTER_DELTAS_KEY, COUNTER_FLUSH_ID_KEY],
+            args=[flush_id],
+            client=conn,
+        )
+
+    @classmethod
+    def _case_by_id(cls, values):
+        return Case(
+            *[When(id=object_id, then=Value(value)) for object_id, value in values.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+    @classmethod
+    def _update_counts(cls, model_class, attr, object_deltas):
+        # one UPDATE ... SET attr = attr + CASE id WHEN ... END per batch
+        object_ids = sorted(object_deltas)
+        batch_size = settings.COUNTER_FLUSH_BATCH_SIZE
+        for start in range(0, len(object_ids), batch_size):
+            batch_deltas = {
+                object_id: object_deltas[object_id]
+                for object_id in object_ids[start:start + batch_size]
+            }
+            model_class.objects.filter(id__in=batch_deltas).update(**{
+                attr: Coalesce(F(attr), 0) + cls._case_by_id(batch_deltas),
+            })
+
+    @classmethod
+    def reconcile_counts(cls, model_class, attr, actual_counts):
+        # actual_counts is {object id: count} computed from the source rows.
+        # Counters with pending deltas are changing and left to the next
+        # run, the others are fixed in db with one UPDATE ... CASE and
+        # dropped from redis when the cached value is off
+        object_ids = sorted(actual_counts)
+        if not object_ids:
+            return {'checked': 0, 'db_fixed': 0, 'cache_fixed': 0, 'drift': 0}
+
+        objects = {}
+        for object_id in object_ids:
+            obj = model_class(id=object_id)
+            objects[cls.get_key(obj, attr)] = obj
+        pending_deltas, cached_counts = {}, {}
+        keys_by_connection = RedisClient.group_keys_by_connection(objects)
+        for conn, keys in keys_by_connection.items():
+            fields = [cls.get_delta_field(objects[key], attr) for key in keys]
+            pipe = conn.pipeline(transaction=False)
+            pipe.hmget(COUNTER_DELTAS_KEY, fields)
+            pipe.hmget(FLUSHING_COUNTER_DELTAS_KEY, fields)
+            pipe.mget(keys)
+            deltas, flushing_deltas, counts = pipe.execute()
+            for key, delta, flushing_delta, count in zip(
+                keys,
+                deltas,
+                flushing_deltas,
+                counts,
+            ):
+                pending_deltas[key] = int(delta or 0) or int(flushing_delta or 0)
+                cached_counts[key] = count
+
+        settled_ids = [
+            obj.id for key, obj in objects.items() if not pending_deltas[key]
+        ]
+        db_counts = dict(
+            model_class.objects.filter(id__in=settled_ids).values_list('id', attr)
+        )
+        drifted_counts = {
+            object_id: actual_counts[object_id]
+            for object_id, db_count in db_counts.items()
+            if (db_count or 0) != actual_counts[object_id]
+        }
+        if drifted_counts:
+            model_class.objects.filter(id__in=drifted_counts).update(**{
+                attr: cls._case_by_id(drifted_counts),
+            })
+
+        stale_keys, cache_fixed = [], 0
+        for key, obj in objects.items():
+            if obj.id not in db_counts:
+                continue
+            cache_drifted = cached_counts[key] is not None \
+                and int(cached_counts[key]) != actual_counts[obj.id]
+            if cache_drifted:
+                cache_fixed += 1
+            if cache_drifted or obj.id in drifted_counts:
+                stale_keys.append(key)
+        for conn, keys in RedisClient.group_keys_by_connection(stale_keys).items():
+            conn.delete(*keys)
+
+        return {
+            'checked': len(object_ids),
+            'db_fixed': len(drifted_counts),
+            'cache_fixed': cache_fixed,
+            'drift': sum(
+                abs((db_counts[object_id] or 0) - count)
+                for object_id, count in drifted_counts.items()
+            ),
+        }
+
+    @classmethod
+    def get_counts(cls, objects, attrs):
+        # {key: count} of every attr of every object with one MGET per
+        # node, which also refreshes their ttl. Misses are read with one
+        # values() query per model and written back with one pipeline per
+        # node
+        counters = {
+            cls.get_key(obj, attr): (obj, attr)
+            for obj in objects if obj is not None
+            for attr in attrs
+        }
+        if not counters:
+            return {}
+
+        counts, missing_counters = {}, {}
+        for conn, keys in RedisClient.group_keys_by_connection(counters).items():
+            pipe = conn.pipeline(transaction=False)
+            pipe.mget(keys)
+            for key in keys:
+                pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+            for key, value in zip(keys, pipe.execute()[0]):
+                if value is not None:
+                    counts[key] = int(value)
+                else:
+                    missing_counters[key] = counters[key]
+        if missing_counters:
+            counts.update(cls.load_counts(missing_counters))
+        return counts
+
+    @classmethod
+    def get_count(cls, obj, attr, counts=None):
+        # counts are the prefetched results of get_counts for a page
         key = cls.get_key(obj, attr)
-        conn = RedisClient.get_connection()
-        if conn.exists(key):
-            return int(conn.get(key)) # use int(), otherwise, return b'1'
-
-        # refresh, because not sure obj is retrieved from db or cache
-        obj.refresh_from_db()
-        conn.set(key, getattr(obj, attr))
-        return getattr(obj, attr)
\ No newline at end of file
+        if counts is not None and key in counts:
+            return counts[key]
+
+        pipe = RedisClient.get_connection(key).pipeline(transaction=False)
+        pipe.get(key)
+        pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        count, _ = pipe.execute()
+        if count is not None:
+            return int(count) # use int(), otherwise, return b'1'
+
+        # read from db, because not sure obj is retrieved from db or cache
+        return cls.load_counts({key: (obj, attr)}).get(key, 0)
\ No newline at end of file
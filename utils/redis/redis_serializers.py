@@ -1,8 +1,27 @@
+from collections.abc import Sequence
+from datetime import datetime
+from django.apps import apps
 from django.core import serializers
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.fields.files import FieldFile
+from functools import lru_cache
 from utils.redis.json_encoder import JSONEncoder
+from utils.time_helpers import datetime_to_score, score_to_datetime
+import msgpack
 
+# field types msgpack can not keep as they are, they are stored as strings
+# and converted back with field.to_python
+TO_PYTHON_FIELD_TYPES = {
+    'DateField',
+    'DecimalField',
+    'DurationField',
+    'TimeField',
+    'UUIDField',
+}
 
-class DjangoModelSerializer:
+
+class DjangoJSONModelSerializer:
+    # the old format, a django json document of one instance
 
     @classmethod
     def serialize(cls, instance):
@@ -11,4 +30,169 @@ class DjangoModelSerializer:
 
     @classmethod
     def deserializer(cls, serialized_data):
-        return list(serializers.deserialize('json', serialized_data))[0].object
\ No newline at end of file
+        return list(serializers.deserialize('json', serialized_data))[0].object
+
+
+class DjangoModelSerializer:
+    # version byte + msgpack of [model label, concrete field values], the
+    # json documents written before start with '[' and are still readable
+    VERSION = 1
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _get_fields(cls, label):
+        model_class = apps.get_model(label)
+        return model_class, model_class._meta.concrete_fields
+
+    @classmethod
+    def _encode(cls, value):
+        if isinstance(value, FieldFile):
+            return value.name
+        return str(value)
+
+    @classmethod
+    def serialize(cls, instance):
+        label = instance._meta.label_lower
+        _, fields = cls._get_fields(label)
+        values = [field.value_from_object(instance) for field in fields]
+        return bytes([cls.VERSION]) + msgpack.packb(
+            [label, values],
+            default=cls._encode,
+            datetime=True,
+        )
+
+    @classmethod
+    def deserializer(cls, serialized_data):
+        if serialized_data[:1] in (b'[', '['):
+            return DjangoJSONModelSerializer.deserializer(serialized_data)
+        if serialized_data[0] != cls.VERSION:
+            raise ValueError(
+                'Unknown serializer version {}'.format(serialized_data[0])
+            )
+
+        label, values = msgpack.unpackb(serialized_data[1:], timestamp=3)
+        model_class, fields = cls._get_fields(label)
+        # fields added after the data was cached get their default value
+        values += [field.get_default() for field in fields[len(values):]]
+        values = [
+            field.to_python(value)
+            if value is not None and field.get_internal_type() in TO_PYTHON_FIELD_TYPES
+            else value
+            for field, value in zip(fields, values)
+        ]
+        return model_class.from_db(
+            DEFAULT_DB_ALIAS,
+            [field.attname for field in fields],
+            values,
+        )
+
+    @classmethod
+    def get_field_value(cls, serialized_data, attname):
+        # reads one field without building the instance, only for fields
+        # msgpack keeps as they are (ids, datetimes)
+        if serialized_data[:1] in (b'[', '['):
+            return getattr(cls.deserializer(serialized_data), attname)
+
+        label, values = msgpack.unpackb(serialized_data[1:], timestamp=3)
+        _, fields = cls._get_fields(label)
+        for index, field in enumerate(fields):
+            if field.attname == attname:
+                break
+        else:
+            raise AttributeError(attname)
+        if index >= len(values):
+            return field.get_default()
+        return values[index]
+
+
+def to_sort_key(value):
+    # ids and created_at are both compared as integers
+    if isinstance(value, datetime):
+        return datetime_to_score(value)
+    return value
+
+
+class ReverseKeys(Sequence):
+    # -sort keys of one field of a DeserializedList, ascending when the list
+    # is in reverse order of that field so bisect can search it. A key is
+    # only read from the serialized data when bisect asks for it
+
+    def __init__(self, objects, attname):
+        self.objects = objects
+        self.attname = attname
+        self.keys = [None] * len(objects)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        if self.keys[index] is None:
+            value = self.objects.get_field_value(index, self.attname)
+            self.keys[index] = -to_sort_key(value)
+        return self.keys[index]
+
+
+def get_reverse_keys(reverse_ordered_list, attname='created_at'):
+    # ascending -sort keys of a list in reverse order of attname for bisect,
+    # a DeserializedList reads them without deserializing objects
+    if isinstance(reverse_ordered_list, DeserializedList):
+        return reverse_ordered_list.get_reverse_keys(attname)
+    return [-to_sort_key(getattr(obj, attname)) for obj in reverse_ordered_list]
+
+
+class DeserializedList(Sequence):
+    # a cached list of serialized instances, an instance is deserialized
+    # the first time it is read
+
+    def __init__(self, serialized_list, serializer=DjangoModelSerializer):
+        self.serialized_list = serialized_list
+        self.serializer = serializer
+        self.objects = [None] * len(serialized_list)
+        self.reverse_keys = {}
+
+    def __len__(self):
+        return len(self.serialized_list)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.objects[index] is None:
+            self.objects[index] = self.serializer.deserializer(
+                self.serialized_list[index],
+            )
+        return self.objects[index]
+
+    def get_field_value(self, index, attname):
+        if self.objects[index] is not None:
+            return getattr(self.objects[index], attname)
+        return self.serializer.get_field_value(self.serialized_list[index], attname)
+
+    def get_reverse_keys(self, attname):
+        if attname not in self.reverse_keys:
+            self.reverse_keys[attname] = ReverseKeys(self, attname)
+        return self.reverse_keys[attname]
+
+
+class DjangoModelIdSerializer:
+    # only keeps the id fields of an instance as a sorted set member,
+    # created_at is stored as the score
+    model_class = None
+    id_fields = ('id', )
+
+    @classmethod
+    def serialize(cls, instance):
+        member = ':'.join(
+            '' if getattr(instance, field) is None else str(getattr(instance, field))
+            for field in cls.id_fields
+        )
+        return member, datetime_to_score(instance.created_at)
+
+    @classmethod
+    def deserializer(cls, member, score):
+        if isinstance(member, bytes):
+            member = member.decode()
+        values = [int(value) if value else None for value in member.split(':')]
+        return cls.model_class(
+            created_at=score_to_datetime(score),
+            **dict(zip(cls.id_fields, values))
+        )
\ No newline at end of file
@@ -1,5 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from io import StringIO
+from newsfeeds.services import NewsFeedService
+from newsfeeds.storages import get_newsfeed_storage
+from redis.exceptions import ConnectionError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 from testing.testcases import TestCase
+from tweets.models import Tweet
+from tweets.services import TweetService
+from unittest import mock
+from utils.paginations.endless_paginations import EndlessPagination
+from utils.redis.consistent_hash import ConsistentHashRing
 from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
+from utils.redis.redis_serializers import (
+    DeserializedList,
+    DjangoJSONModelSerializer,
+    DjangoModelSerializer,
+)
+import redis
+
+# three databases of the local redis server stand in for three nodes
+SHARDED_REDIS_NODES = [
+    {'host': settings.REDIS_HOST, 'port': settings.REDIS_PORT, 'db': db}
+    for db in (settings.REDIS_DB, 3, 4)
+]
 
 
 class RedisTest(TestCase):
@@ -17,4 +48,496 @@ class RedisTest(TestCase):
         # clear redis cache
         RedisClient.clear()
         cached_list = conn.lrange('test_key', 0, -1)
-        self.assertEqual(cached_list, [])
\ No newline at end of file
+        self.assertEqual(cached_list, [])
+
+    def test_redis_client_after_fork(self):
+        conn = RedisClient.get_connection()
+        self.assertIs(RedisClient.get_connection(), conn)
+
+        # a forked process gets its own client and connection pool
+        with mock.patch('os.getpid', return_value=RedisClient.pid + 1):
+            forked_conn = RedisClient.get_connection()
+        self.assertIsNot(forked_conn, conn)
+        self.assertIsNot(forked_conn.connection_pool, conn.connection_pool)
+        forked_conn.set('test_key', 1)
+        self.assertEqual(forked_conn.get('test_key'), b'1')
+
+    def test_redis_client_retry(self):
+        conn = RedisClient.get_connection()
+        conn.set('test_key', 1)
+        original = redis.Redis.execute_command
+        calls = []
+
+        def flaky_execute_command(client, *args, **options):
+            calls.append(args[0])
+            if len(calls) == 1:
+                raise ConnectionError('connection dropped')
+            return original(client, *args, **options)
+
+        with mock.patch('redis.Redis.execute_command', flaky_execute_command):
+            # idempotent commands are sent again
+            self.assertEqual(conn.get('test_key'), b'1')
+            self.assertEqual(calls, ['GET', 'GET'])
+
+            # other commands are not, the error is raised to the caller
+            calls.clear()
+            with self.assertRaises(ConnectionError):
+                conn.incr('test_key')
+            self.assertEqual(calls, ['INCRBY'])
+        self.assertEqual(conn.get('test_key'), b'1')
+
+    def test_pool_stats(self):
+        RedisClient.get_connection().ping()
+        stats = RedisClient.get_pool_stats()
+        self.assertEqual(stats['max_connections'], 50)
+        self.assertGreaterEqual(stats['created_connections'], 1)
+        self.assertEqual(stats['in_use_connections'], 0)
+        self.assertEqual(
+            stats['available_connections'],
+            stats['created_connections'],
+        )
+
+    def test_get_counts(self):
+        user = self.create_user('testuser')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        self.create_like(user, tweets[0])
+        self.create_comment(user, tweets[1])
+        RedisHelper.flush_counter_deltas()
+        RedisClient.clear()
+
+        # cache miss, counters are loaded in one query
+        with self.assertNumQueries(1):
+            counts = RedisHelper.get_counts(tweets, ['likes_count', 'comments_count'])
+        self.assertEqual(len(counts), 6)
+        self.assertEqual(counts[RedisHelper.get_key(tweets[0], 'likes_count')], 1)
+        self.assertEqual(counts[RedisHelper.get_key(tweets[1], 'likes_count')], 0)
+        self.assertEqual(counts[RedisHelper.get_key(tweets[1], 'comments_count')], 1)
+        conn = RedisClient.get_connection()
+        key = RedisHelper.get_key(tweets[2], 'comments_count')
+        self.assertEqual(conn.get(key), b'0')
+        self.assertGreater(conn.ttl(key), 0)
+
+        # cache hit
+        with self.assertNumQueries(0):
+            cached_counts = RedisHelper.get_counts(
+                tweets,
+                ['likes_count', 'comments_count'],
+            )
+        self.assertEqual(cached_counts, counts)
+        self.assertEqual(
+            RedisHelper.get_count(tweets[0], 'likes_count', cached_counts),
+            1,
+        )
+
+    def test_django_model_serializer(self):
+        user = self.create_user('testuser')
+        tweet = self.create_tweet(user, 'hello')
+
+        data = DjangoModelSerializer.serialize(tweet)
+        self.assertEqual(data[0], DjangoModelSerializer.VERSION)
+        self.assertLess(len(data), len(DjangoJSONModelSerializer.serialize(tweet)))
+        cached_tweet = DjangoModelSerializer.deserializer(data)
+        self.assertEqual(cached_tweet.id, tweet.id)
+        self.assertEqual(cached_tweet.user_id, user.id)
+        self.assertEqual(cached_tweet.content, 'hello')
+        self.assertEqual(cached_tweet.created_at, tweet.created_at)
+        self.assertEqual(cached_tweet.likes_count, tweet.likes_count)
+        self.assertFalse(cached_tweet._state.adding)
+
+        # data cached in the old json format can still be read
+        json_data = DjangoJSONModelSerializer.serialize(tweet)
+        cached_tweet = DjangoModelSerializer.deserializer(json_data.encode())
+        self.assertEqual(cached_tweet.id, tweet.id)
+        self.assertEqual(cached_tweet.created_at, tweet.created_at)
+
+    def test_push_object(self):
+        user = self.create_user('testuser')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        conn = RedisClient.get_connection()
+
+        # cold cache is loaded from the queryset
+        RedisHelper.push_object('test_key', tweets[0], [tweets[1], tweets[0]])
+        self.assertEqual(conn.llen('test_key'), 2)
+
+        # warm cache is pushed to and trimmed in one script call
+        for _ in range(20):
+            RedisHelper.push_object('test_key', tweets[2], [])
+        self.assertEqual(conn.llen('test_key'), 20)
+        cached_tweets = RedisHelper.load_objects('test_key', [])
+        self.assertEqual(cached_tweets[0].id, tweets[2].id)
+
+        # a push while another client rebuilds the list is merged into it
+        conn.delete('test_key')
+        token = RedisHelper.acquire_lock('test_key')
+        RedisHelper.push_object('test_key', tweets[2], [])
+        RedisHelper.push_object('test_key', tweets[1], [])
+        self.assertFalse(conn.exists('test_key'))
+        RedisHelper.release_lock('test_key', token)
+        # the snapshot was read before tweets[2] was saved
+        objects = RedisHelper._load_objects_to_cache(
+            'test_key',
+            [tweets[1], tweets[0]],
+        )
+        self.assertEqual(
+            [obj.id for obj in objects],
+            [tweets[2].id, tweets[1].id, tweets[0].id],
+        )
+        cached_tweets = RedisHelper.load_objects('test_key', [])
+        self.assertEqual(
+            [tweet.id for tweet in cached_tweets],
+            [tweets[2].id, tweets[1].id, tweets[0].id],
+        )
+        self.assertFalse(conn.exists('test_key:pending'))
+
+    def test_paginate_deserialized_list(self):
+        user = self.create_user('testuser')
+        tweets = [self.create_tweet(user) for _ in range(10)][::-1]
+        serialized_list = [DjangoModelSerializer.serialize(tweet) for tweet in tweets]
+        factory = APIRequestFactory()
+
+        def paginate(**params):
+            paginator = EndlessPagination()
+            request = Request(factory.get('/', params))
+            cached_list = DeserializedList(serialized_list)
+            with mock.patch.object(
+                DjangoModelSerializer,
+                'deserializer',
+                wraps=DjangoModelSerializer.deserializer,
+            ) as deserializer:
+                page = paginator.paginate_ordered_list(cached_list, request)
+            return page, paginator.has_next_page, deserializer.call_count
+
+        # only the objects of the page are deserialized
+        page, has_next_page, call_count = paginate(
+            created_at__lt=tweets[3].created_at,
+            page_size=3,
+        )
+        self.assertEqual([tweet.id for tweet in page], [tweet.id for tweet in tweets[4:7]])
+        self.assertEqual(has_next_page, True)
+        self.assertEqual(call_count, 3)
+
+        page, has_next_page, call_count = paginate(created_at__gt=tweets[2].created_at)
+        self.assertEqual([tweet.id for tweet in page], [tweet.id for tweet in tweets[:2]])
+        self.assertEqual(has_next_page, False)
+        self.assertEqual(call_count, 2)
+
+        page, has_next_page, call_count = paginate(
+            created_at__lt=tweets[-1].created_at,
+        )
+        self.assertEqual(page, [])
+        self.assertEqual(has_next_page, False)
+        self.assertEqual(call_count, 0)
+
+        # page_size is bounded
+        page, has_next_page, _ = paginate(page_size=1000)
+        self.assertEqual(len(page), 10)
+        paginator = EndlessPagination()
+        paginator.set_page_size(Request(factory.get('/', {'page_size': 1000})))
+        self.assertEqual(paginator.page_size, EndlessPagination.max_page_size)
+        paginator.set_page_size(Request(factory.get('/', {'page_size': 'a'})))
+        self.assertEqual(paginator.page_size, EndlessPagination.max_page_size)
+        self.assertEqual(EndlessPagination().page_size, EndlessPagination.page_size)
+
+    def test_change_count(self):
+        user = self.create_user('testuser')
+        tweet = self.create_tweet(user)
+        tweet.likes_count = 5
+        tweet.save()
+        key = RedisHelper.get_key(tweet, 'likes_count')
+        conn = RedisClient.get_connection()
+
+        # db is not changed, cold counter is loaded from db plus the delta
+        self.assertEqual(RedisHelper.incr_count(tweet, 'likes_count'), 6)
+        self.assertGreater(conn.ttl(key), 0)
+        self.assertEqual(RedisHelper.incr_count(tweet, 'likes_count'), 7)
+        self.assertEqual(RedisHelper.decr_count(tweet, 'likes_count'), 6)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 6)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 5)
+
+        # concurrent changes of a warm counter are not lost
+        def change(i):
+            if i % 3 == 0:
+                return RedisHelper.decr_count(tweet, 'likes_count')
+            return RedisHelper.incr_count(tweet, 'likes_count')
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(change, range(300)))
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 106)
+
+        # an expired counter is read from db plus the pending delta
+        conn.delete(key)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 106)
+        conn.delete(key)
+        counts = RedisHelper.get_counts([tweet], ['likes_count'])
+        self.assertEqual(counts[key], 106)
+
+    def test_flush_counter_deltas(self):
+        user = self.create_user('testuser')
+        tweets = [self.create_tweet(user) for _ in range(5)]
+        comment = self.create_comment(user, tweets[0])
+        for tweet in tweets:
+            self.create_like(user, tweet)
+        self.create_like(user, comment)
+        RedisHelper.decr_count(tweets[4], 'likes_count')
+
+        # one update per model and counter, likes of tweets are updated in
+        # 2 batches. The other queries check, save and prune the flush ids
+        # and are the savepoint of atomic()
+        with self.settings(COUNTER_FLUSH_BATCH_SIZE=3):
+            with self.assertNumQueries(9):
+                self.assertEqual(RedisHelper.flush_counter_deltas(), 6)
+        self.assertEqual(
+            [tweet.likes_count for tweet in Tweet.objects.order_by('id')],
+            [1, 1, 1, 1, 0],
+        )
+        tweets[0].refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(tweets[0].comments_count, 1)
+        self.assertEqual(comment.likes_count, 1)
+
+        # nothing is written twice, cached counters are kept
+        self.assertEqual(RedisHelper.flush_counter_deltas(), 0)
+        tweets[0].refresh_from_db()
+        self.assertEqual(tweets[0].likes_count, 1)
+        self.assertEqual(RedisHelper.get_count(tweets[0], 'likes_count'), 1)
+
+        # deltas left by a flush that failed halfway are written first
+        RedisHelper.incr_count(tweets[1], 'likes_count')
+        conn = RedisClient.get_connection()
+        RedisHelper._start_flush(conn)
+        RedisHelper.incr_count(tweets[1], 'likes_count')
+        self.assertEqual(RedisHelper.get_count(tweets[1], 'likes_count'), 3)
+        self.assertEqual(RedisHelper.flush_counter_deltas(), 1)
+        tweets[1].refresh_from_db()
+        self.assertEqual(tweets[1].likes_count, 2)
+        self.assertEqual(RedisHelper.flush_counter_deltas(), 1)
+        tweets[1].refresh_from_db()
+        self.assertEqual(tweets[1].likes_count, 3)
+
+        # the flushed deltas are dropped from redis on commit, a test never
+        # commits. That is a flush whose delete failed after the commit: a
+        # counter loaded meanwhile does not count the deltas twice, and the
+        # next flush does not write them again
+        RedisHelper.incr_count(tweets[2], 'likes_count')
+        self.assertEqual(RedisHelper.flush_counter_deltas(), 1)
+        self.assertEqual(conn.hlen('counter_deltas:flushing'), 1)
+        conn.delete(RedisHelper.get_key(tweets[2], 'likes_count'))
+        self.assertEqual(RedisHelper.get_count(tweets[2], 'likes_count'), 2)
+        self.assertEqual(RedisHelper.flush_counter_deltas(), 0)
+        tweets[2].refresh_from_db()
+        self.assertEqual(tweets[2].likes_count, 2)
+        self.assertEqual(conn.exists('counter_deltas:flushing'), 0)
+
+        # a counter whose flush changed while it was read from db is read
+        # again, its db value already has the flushed delta
+        RedisHelper.incr_count(tweets[3], 'likes_count')
+        conn.delete(RedisHelper.get_key(tweets[3], 'likes_count'))
+        get = redis.Redis.get
+        flushed = []
+
+        def get_then_flush(conn, name):
+            value = get(conn, name)
+            if name == 'counter_deltas:flush_id' and not flushed:
+                flushed.append(RedisHelper.flush_counter_deltas())
+            return value
+
+        with mock.patch('redis.Redis.get', autospec=True, side_effect=get_then_flush):
+            self.assertEqual(RedisHelper.get_count(tweets[3], 'likes_count'), 2)
+        self.assertEqual(flushed, [1])
+
+    def test_load_objects_single_flight(self):
+        user = self.create_user('testuser')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        conn = RedisClient.get_connection()
+
+        # another client is rebuilding the list, readers use db meanwhile
+        token = RedisHelper.acquire_lock('test_key')
+        self.assertIsNotNone(token)
+        self.assertIsNone(RedisHelper.acquire_lock('test_key'))
+        objects = RedisHelper.load_objects('test_key', tweets)
+        self.assertEqual(objects, tweets)
+        self.assertFalse(conn.exists('test_key'))
+        RedisHelper.release_lock('test_key', token)
+        self.assertFalse(conn.exists('test_key:lock'))
+
+        # concurrent readers of a cold list build it only once
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(
+                lambda _: RedisHelper.load_objects('test_key', tweets),
+                range(50),
+            ))
+        self.assertEqual(conn.llen('test_key'), 3)
+        for objects in results:
+            self.assertEqual([obj.id for obj in objects], [t.id for t in tweets])
+        self.assertEqual(conn.keys('test_key:*'), [])
+
+    def test_ttl_refreshed_on_read(self):
+        user = self.create_user('testuser')
+        tweet = self.create_tweet(user)
+        self.create_newsfeed(user, tweet)
+        self.clear_cache()
+        conn = RedisClient.get_connection()
+
+        TweetService.get_cached_tweets_from_redis(user.id)
+        NewsFeedService.get_cached_newsfeeds_page(user.id)
+        RedisHelper.get_counts([tweet], ['likes_count'])
+        keys = [
+            'user_tweet:{}'.format(user.id),
+            'user_newsfeed_ids:{}'.format(user.id),
+            RedisHelper.get_key(tweet, 'likes_count'),
+        ]
+        for key in keys:
+            self.assertGreater(conn.ttl(key), 0)
+            conn.expire(key, 10)
+
+        # reading keeps the keys for another REDIS_KEY_EXPIRE_TIME
+        TweetService.get_cached_tweets_from_redis(user.id)
+        NewsFeedService.get_cached_newsfeeds_page(user.id)
+        RedisHelper.get_count(tweet, 'likes_count')
+        for key in keys:
+            self.assertGreater(conn.ttl(key), 10)
+
+        out = StringIO()
+        call_command('redis_memory_report', stdout=out)
+        report = {
+            line.split()[0]: line.split()[1:]
+            for line in out.getvalue().splitlines()[1:-1]
+        }
+        self.assertEqual(report['user_tweet:{user_id}'][0], '1')
+        self.assertEqual(report['user_newsfeed_ids:{user_id}'][0], '1')
+        self.assertEqual(report['{model_name}.{attr}:{object_id}'][0], '1')
+        self.assertEqual(report['user_tweet:{user_id}'][2], '0')
+        self.assertGreater(int(report['user_tweet:{user_id}'][1]), 0)
+
+        # the budget is not applied to an instance shared with the broker
+        config = conn.config_get('maxmemory*')
+        with self.assertRaises(CommandError):
+            call_command('redis_memory_report', apply_budget=True, stdout=StringIO())
+        self.assertEqual(conn.config_get('maxmemory*'), config)
+        broker_url = 'redis://127.0.0.1:6380/0'
+        try:
+            with override_settings(CELERY_BROKER_URL=broker_url):
+                call_command('redis_memory_report', apply_budget=True, stdout=StringIO())
+            self.assertEqual(int(conn.config_get('maxmemory')['maxmemory']), 1024 ** 3)
+        finally:
+            conn.config_set('maxmemory', config['maxmemory'])
+            conn.config_set('maxmemory-policy', config['maxmemory-policy'])
+
+
+class ConsistentHashRingTests(TestCase):
+
+    def test_distribution_and_rebalancing(self):
+        keys = ['user_tweet:{}'.format(user_id) for user_id in range(10000)]
+        ring = ConsistentHashRing(['node1', 'node2', 'node3', 'node4'])
+        nodes = {key: ring.get_node(key) for key in keys}
+        for node in ['node1', 'node2', 'node3', 'node4']:
+            share = list(nodes.values()).count(node) / len(keys)
+            self.assertGreater(share, 0.15)
+            self.assertLess(share, 0.35)
+
+        # keys are sharded by the id in their pattern
+        self.assertEqual(ring.get_node('user_tweet:7:lock'), nodes['user_tweet:7'])
+        self.assertEqual(ring.get_node('user_newsfeed_ids:7'), nodes['user_tweet:7'])
+        self.assertEqual(ring.get_node('Tweet.likes_count:7'), nodes['user_tweet:7'])
+
+        # a new node only takes keys, about a fifth of them
+        ring = ConsistentHashRing(['node1', 'node2', 'node3', 'node4', 'node5'])
+        moved_keys = [key for key in keys if ring.get_node(key) != nodes[key]]
+        self.assertLess(len(moved_keys) / len(keys), 0.3)
+        for key in moved_keys:
+            self.assertEqual(ring.get_node(key), 'node5')
+
+
+@override_settings(REDIS_NODES=SHARDED_REDIS_NODES)
+class ShardedRedisTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+
+    def tearDown(self):
+        self.clear_cache()
+
+    def test_sharded_cache(self):
+        users = [self.create_user('user{}'.format(i)) for i in range(8)]
+        tweets = [self.create_tweet(user) for user in users]
+        conns = RedisClient.get_connections()
+        self.assertEqual(len(conns), 3)
+
+        # a user's list is only cached on the node of the user
+        for user in users:
+            TweetService.get_cached_tweets_from_redis(user.id)
+        used_conns = set()
+        for user in users:
+            key = 'user_tweet:{}'.format(user.id)
+            conn = RedisClient.get_connection(key)
+            used_conns.add(conn)
+            self.assertEqual(
+                [c.exists(key) for c in conns],
+                [int(c is conn) for c in conns],
+            )
+        self.assertGreater(len(used_conns), 1)
+
+        # counters on all nodes are read and flushed together
+        for tweet in tweets:
+            self.create_like(users[0], tweet)
+        counts = RedisHelper.get_counts(tweets, ['likes_count', 'comments_count'])
+        self.assertEqual(len(counts), 16)
+        for tweet in tweets:
+            self.assertEqual(counts[RedisHelper.get_key(tweet, 'likes_count')], 1)
+        self.assertEqual(RedisHelper.flush_counter_deltas(), 8)
+        self.assertEqual(
+            [tweet.likes_count for tweet in Tweet.objects.order_by('id')],
+            [1] * 8,
+        )
+
+        # sorted sets on several nodes are pushed to with one pipeline each
+        for user in users:
+            self.create_newsfeed(user, tweets[0])
+        newsfeeds = get_newsfeed_storage().bulk_create(
+            [user.id for user in users],
+            tweets[1].id,
+        )
+        self.assertEqual(NewsFeedService.push_newsfeeds_to_cached_redis(newsfeeds), 8)
+        for user in users:
+            page, _ = NewsFeedService.get_cached_newsfeeds_page(user.id)
+            self.assertEqual([nf.tweet_id for nf in page], [tweets[1].id, tweets[0].id])
+        self.clear_cache()
+        self.assertEqual(NewsFeedService.push_newsfeeds_to_cached_redis(newsfeeds), 0)
+
+
+class RedisCounterConcurrencyTest(TransactionTestCase):
+    # committed rows, the threads read db on their own connections
+
+    def setUp(self):
+        RedisClient.clear()
+
+    def test_change_cold_count(self):
+        user = User.objects.create_user('testuser')
+        tweet = Tweet.objects.create(user=user, content='a tweet')
+        Tweet.objects.filter(id=tweet.id).update(likes_count=5)
+        key = RedisHelper.get_key(tweet, 'likes_count')
+        conn = RedisClient.get_connection(key)
+
+        # clients load the counter from db together while it keeps
+        # expiring, the deltas are flushed to db between the rounds
+        def change(i):
+            try:
+                if i % 10 == 0:
+                    conn.delete(key)
+                if i % 3 == 0:
+                    return RedisHelper.decr_count(tweet, 'likes_count')
+                return RedisHelper.incr_count(tweet, 'likes_count')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for start in range(0, 300, 100):
+                list(executor.map(change, range(start, start + 100)))
+                RedisHelper.flush_counter_deltas()
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 105)
+        RedisHelper.flush_counter_deltas()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 105)
+        conn.delete(key)
+        self.assertEqual(RedisHelper.get_count(tweet, 'likes_count'), 105)
\ No newline at end of file
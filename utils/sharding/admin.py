@@ -0,0 +1,83 @@
+from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import ValidationError
+from utils.sharding.shard_helper import ShardHelper
+
+
+class ShardDatabaseFilter(admin.SimpleListFilter):
+    # the change list pages a queryset of one database, this picks it
+    title = 'database'
+    parameter_name = 'database'
+
+    @classmethod
+    def get_database(cls, value):
+        databases = ShardHelper.get_databases()
+        return value if value in databases else databases[0]
+
+    def lookups(self, request, model_admin):
+        return [(database, database) for database in ShardHelper.get_databases()]
+
+    def queryset(self, request, queryset):
+        # ShardedModelAdmin.get_queryset is already on the database
+        return queryset
+
+    def choices(self, changelist):
+        # no "All" choice, rows of several databases can not be paged together
+        database = self.get_database(self.value())
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': lookup == database,
+                'query_string': changelist.get_query_string({
+                    self.parameter_name: lookup,
+                }),
+                'display': title,
+            }
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    # rows of a sharded model are listed one database at a time, a row is
+    # found by fan in over every database. A view runs on the database of
+    # its rows, see ShardHelper.use_database
+    list_filter = (ShardDatabaseFilter, )
+    # users and tweets are on default, they can not be joined
+    list_select_related = ()
+
+    def get_database(self, request, object_id=None):
+        if object_id is not None:
+            obj = self.get_object(request, unquote(object_id))
+            if obj is not None:
+                return obj._state.db
+        return ShardDatabaseFilter.get_database(
+            request.GET.get(ShardDatabaseFilter.parameter_name),
+        )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(self.get_database(request))
+
+    def get_object(self, request, object_id, from_field=None):
+        if from_field is None:
+            field = self.model._meta.pk
+        else:
+            field = self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except ValidationError:
+            return None
+        objects = ShardHelper.fan_in(
+            self.model,
+            lambda queryset: queryset.filter(**{field.name: object_id}),
+            limit=1,
+        )
+        return objects[0] if objects else None
+
+    def changelist_view(self, request, extra_context=None):
+        with ShardHelper.use_database(self.get_database(request)):
+            return super().changelist_view(request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        with ShardHelper.use_database(self.get_database(request, object_id)):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with ShardHelper.use_database(self.get_database(request, object_id)):
+            return super().delete_view(request, object_id, extra_context)
\ No newline at end of file
@@ -0,0 +1,44 @@
+from utils.sharding.shard_helper import SHARD_KEYS, ShardHelper
+
+
+class ShardRouter:
+    # rows of sharded models are read and written on the database of their
+    # shard key, queries without an instance are sent there with
+    # ShardHelper.get_queryset. Other models stay on default
+
+    def _db_for(self, model, **hints):
+        if not ShardHelper.is_sharded(model):
+            return 'default'
+        instance = hints.get('instance')
+        if isinstance(instance, model):
+            return ShardHelper.get_database(ShardHelper.get_shard_key(instance))
+        if instance is not None:
+            # a related object assigned to an unsaved row, its database is
+            # set by the queryset that saves it
+            return None
+        database = ShardHelper.get_scoped_database()
+        if database is not None:
+            return database
+        # falling back to default would only see the rows of one database
+        raise ValueError(
+            '{} is sharded, query it with ShardHelper.get_queryset or '
+            'ShardHelper.fan_in'.format(model._meta.label),
+        )
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a sharded row points to users and tweets on default
+        if ShardHelper.is_sharded(obj1.__class__) or ShardHelper.is_sharded(obj2.__class__):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # sharded tables are created on every database
+        if '{}.{}'.format(app_label, model_name) in SHARD_KEYS:
+            return True
+        return db == 'default'
\ No newline at end of file
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from utils.redis.consistent_hash import hash_value
+import threading
+
+# sharded models and the field their rows are placed by, every query of
+# them is scoped by that field except the few fan-in ones
+SHARD_KEYS = {
+    'newsfeeds.newsfeed': 'user_id',
+    'likes.like': 'object_id',
+}
+
+
+class ShardHelper:
+    # a key goes to one of LOGICAL_SHARD_COUNT logical shards by hash, and
+    # logical shard i is kept in SHARD_DATABASES[i % len(SHARD_DATABASES)].
+    # Adding databases moves whole logical shards, see reshard_tables
+    scope = threading.local()
+
+    @classmethod
+    def is_sharded(cls, model_class):
+        return model_class._meta.label_lower in SHARD_KEYS
+
+    @classmethod
+    def get_shard_key(cls, instance):
+        return getattr(instance, SHARD_KEYS[instance._meta.label_lower])
+
+    @classmethod
+    def get_logical_shard(cls, key):
+        return hash_value(str(key)) % settings.LOGICAL_SHARD_COUNT
+
+    @classmethod
+    def get_database(cls, key):
+        databases = settings.SHARD_DATABASES
+        return databases[cls.get_logical_shard(key) % len(databases)]
+
+    @classmethod
+    def get_databases(cls):
+        return list(dict.fromkeys(settings.SHARD_DATABASES))
+
+    @classmethod
+    @contextmanager
+    def use_database(cls, database):
+        # queries of sharded models that are not scoped by a key go to
+        # database in this thread, for code that does not pick the database
+        # itself (the views of the admin)
+        previous = getattr(cls.scope, 'database', None)
+        cls.scope.database = database
+        try:
+            yield
+        finally:
+            cls.scope.database = previous
+
+    @classmethod
+    def get_scoped_database(cls):
+        return getattr(cls.scope, 'database', None)
+
+    @classmethod
+    def get_queryset(cls, model_class, key):
+        # model_class.objects on the database of key
+        return model_class.objects.using(cls.get_database(key))
+
+    @classmethod
+    def group_by_database(cls, keys):
+        # {database: keys on it}, to send one query per database
+        keys_by_database = defaultdict(list)
+        for key in keys:
+            keys_by_database[cls.get_database(key)].append(key)
+        return keys_by_database
+
+    @classmethod
+    def fan_in(cls, model_class, build_queryset, order_by=None, limit=None):
+        # runs build_queryset(model_class.objects.using(database)) on every
+        # database and merges the rows, for the queries not scoped by a key
+        objects = []
+        for database in cls.get_databases():
+            queryset = build_queryset(model_class.objects.using(database))
+            if order_by is not None:
+                queryset = queryset.order_by(order_by)
+            if limit is not None:
+                queryset = queryset[:limit]
+            objects.extend(queryset)
+        if order_by is not None:
+            field = order_by.lstrip('-')
+            objects.sort(
+                key=lambda obj: getattr(obj, field),
+                reverse=order_by.startswith('-'),
+            )
+        return objects[:limit]
+
+    @classmethod
+    def count(cls, model_class, build_queryset=None):
+        build_queryset = build_queryset or (lambda queryset: queryset)
+        return sum(
+            build_queryset(model_class.objects.using(database)).count()
+            for database in cls.get_databases()
+        )
\ No newline at end of file
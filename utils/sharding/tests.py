@@ -0,0 +1,188 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.db.models.query import QuerySet
+from django.test import Client, override_settings
+from io import StringIO
+from likes.models import Like
+from likes.services import LikeService
+from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
+from testing.testcases import TestCase
+from tweets.models import Tweet
+from unittest import mock
+from utils.sharding.shard_helper import ShardHelper
+
+SHARD_DATABASES = ['default', 'shard_1', 'shard_2']
+
+
+@override_settings(SHARD_DATABASES=SHARD_DATABASES)
+class ShardingTests(TestCase):
+    databases = set(SHARD_DATABASES)
+
+    def setUp(self):
+        self.clear_cache()
+        self.users = [self.create_user('user{}'.format(i)) for i in range(10)]
+
+    def get_databases_of(self, model_class, **filters):
+        return [
+            database for database in SHARD_DATABASES
+            if model_class.objects.using(database).filter(**filters).exists()
+        ]
+
+    def test_routing(self):
+        tweet = self.create_tweet(self.users[0])
+        for user in self.users:
+            NewsFeedService.create_newsfeed(user.id, tweet.id)
+        # every row is on the database of its user_id, and only there
+        for user in self.users:
+            self.assertEqual(
+                self.get_databases_of(NewsFeed, user_id=user.id),
+                [ShardHelper.get_database(user.id)],
+            )
+        self.assertGreater(len(self.get_databases_of(NewsFeed)), 1)
+        self.assertEqual(ShardHelper.count(NewsFeed), len(self.users))
+        cached_list = NewsFeedService.get_cached_newsfeeds_from_redis(self.users[3].id)
+        self.assertEqual(cached_list[0].tweet_id, tweet.id)
+
+        tweets = [self.create_tweet(self.users[0]) for _ in range(6)]
+        for tweet in tweets:
+            for user in self.users[:3]:
+                self.create_like(user, tweet)
+        for tweet in tweets:
+            self.assertEqual(
+                self.get_databases_of(Like, object_id=tweet.id),
+                [ShardHelper.get_database(tweet.id)],
+            )
+            self.assertEqual(LikeService.has_liked(self.users[1], tweet), True)
+            self.assertEqual(tweet.like_set.count(), 3)
+        self.assertEqual(
+            LikeService.get_liked_object_ids(self.users[1], tweets)[Tweet],
+            {tweet.id for tweet in tweets},
+        )
+        self.assertEqual(
+            LikeService.get_likes_counts(Tweet, [tweet.id for tweet in tweets]),
+            {tweet.id: 3 for tweet in tweets},
+        )
+
+        # fan-in over every database
+        since = tweets[0].created_at
+        self.assertEqual(
+            LikeService.get_recently_liked_object_ids(Tweet, since),
+            {tweet.id for tweet in tweets},
+        )
+        likes = ShardHelper.fan_in(
+            Like,
+            lambda queryset: queryset.filter(user=self.users[2]),
+            order_by='-created_at',
+            limit=4,
+        )
+        self.assertEqual(
+            [like.object_id for like in likes],
+            [tweet.id for tweet in tweets[::-1][:4]],
+        )
+        like = likes[0]
+        self.assertEqual(like.user, self.users[2])
+        self.assertEqual(like.content_object, tweets[-1])
+
+        # queries that are not scoped by a shard key fail
+        with self.assertRaises(ValueError):
+            Like.objects.filter(user=self.users[2]).count()
+
+    def test_admin(self):
+        tweet = self.create_tweet(self.users[0])
+        for user in self.users:
+            NewsFeedService.create_newsfeed(user.id, tweet.id)
+        User.objects.create_superuser('admin', password='password')
+        client = Client()
+        client.login(username='admin', password='password')
+
+        # the change list shows one database at a time
+        newsfeed_ids = []
+        for database in SHARD_DATABASES:
+            response = client.get('/admin/newsfeeds/newsfeed/', {'database': database})
+            self.assertEqual(response.status_code, 200)
+            newsfeed_ids += [
+                newsfeed.id for newsfeed in response.context['cl'].result_list
+            ]
+        newsfeeds = ShardHelper.fan_in(NewsFeed, lambda queryset: queryset)
+        self.assertEqual(
+            sorted(newsfeed_ids),
+            sorted(newsfeed.id for newsfeed in newsfeeds),
+        )
+
+        # a row is found on its database
+        newsfeed = ShardHelper.get_queryset(NewsFeed, self.users[1].id).get(
+            user=self.users[1],
+        )
+        url = '/admin/newsfeeds/newsfeed/{}/change/'.format(newsfeed.id)
+        self.assertEqual(client.get(url).status_code, 200)
+        response = client.post(
+            '/admin/newsfeeds/newsfeed/{}/delete/'.format(newsfeed.id),
+            {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ShardHelper.count(NewsFeed), len(self.users) - 1)
+        self.assertEqual(client.get('/admin/likes/like/').status_code, 200)
+
+    def test_reshard_tables(self):
+        tweets = [self.create_tweet(self.users[0]) for _ in range(6)]
+        with override_settings(SHARD_DATABASES=['default']):
+            for user in self.users:
+                NewsFeedService.create_newsfeed(user.id, tweets[0].id)
+            for tweet in tweets:
+                self.create_like(self.users[1], tweet)
+        self.assertEqual(NewsFeed.objects.using('default').count(), 10)
+        self.assertEqual(Like.objects.using('default').count(), 6)
+
+        out = StringIO()
+        call_command('reshard_tables', '--dry-run', stdout=out)
+        self.assertIn('would move', out.getvalue())
+        self.assertEqual(NewsFeed.objects.using('default').count(), 10)
+
+        call_command('reshard_tables', '--batch-size', '3', stdout=StringIO())
+        for user in self.users:
+            self.assertEqual(
+                self.get_databases_of(NewsFeed, user_id=user.id),
+                [ShardHelper.get_database(user.id)],
+            )
+        for tweet in tweets:
+            self.assertEqual(
+                self.get_databases_of(Like, object_id=tweet.id),
+                [ShardHelper.get_database(tweet.id)],
+            )
+        self.assertEqual(ShardHelper.count(NewsFeed), 10)
+        self.assertEqual(ShardHelper.count(Like), 6)
+
+        # nothing is left to move
+        out = StringIO()
+        call_command('reshard_tables', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_reshard_tables_failed_copy(self):
+        with override_settings(SHARD_DATABASES=['default']):
+            for user in self.users:
+                NewsFeedService.create_newsfeed(user.id, 1)
+
+        # the copy fails to commit on the target
+        with mock.patch.object(QuerySet, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                call_command('reshard_tables', stdout=StringIO())
+        self.assertEqual(NewsFeed.objects.using('default').count(), 10)
+        self.assertEqual(ShardHelper.count(NewsFeed), 10)
+
+        # the copy silently misses rows on the target
+        with mock.patch.object(QuerySet, 'bulk_create', return_value=[]):
+            with self.assertRaises(CommandError):
+                call_command('reshard_tables', stdout=StringIO())
+        self.assertEqual(NewsFeed.objects.using('default').count(), 10)
+        self.assertEqual(ShardHelper.count(NewsFeed), 10)
+
+        call_command('reshard_tables', stdout=StringIO())
+        self.assertEqual(ShardHelper.count(NewsFeed), 10)
+        for user in self.users:
+            self.assertEqual(
+                self.get_databases_of(NewsFeed, user_id=user.id),
+                [ShardHelper.get_database(user.id)],
+            )
\ No newline at end of file
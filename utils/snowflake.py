@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from redis.exceptions import RedisError
+from twitter.cache import SNOWFLAKE_WORKERS_KEY
+from utils.redis.lua_scripts import (
+    LEASE_WORKER_ID,
+    RELEASE_WORKER_ID,
+    RENEW_WORKER_ID,
+)
+from utils.redis.redis_client import RedisClient
+from utils.redis.redis_helper import RedisHelper
+import atexit
+import os
+import pytz
+import threading
+import time
+import uuid
+
+# 53 bit ids so a redis score or a javascript number keeps them exact:
+# 41 bits of milliseconds since EPOCH (69 years), 5 bits of worker id and
+# 7 bits of sequence (128 ids per millisecond per worker)
+EPOCH = datetime(2021, 1, 1, tzinfo=pytz.utc)
+EPOCH_MS = int(EPOCH.timestamp() * 1000)
+WORKER_ID_BITS = 5
+SEQUENCE_BITS = 7
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_ID_BITS + SEQUENCE_BITS
+
+
+class SnowflakeGenerator:
+    # ids of a process only go up, the lock is never waited on across
+    # processes and is held for a few instructions
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.worker_id = None
+        self.lease_token = None
+        self.lease_renewed_at = None
+        self.last_ms = -1
+        self.sequence = 0
+
+    def get_worker_id(self):
+        # two processes with the same worker id generate the same ids, so a
+        # worker id is either configured per process or leased from redis
+        if settings.SNOWFLAKE_WORKER_ID is None:
+            return self.lease_worker_id()
+        if not 0 <= settings.SNOWFLAKE_WORKER_ID <= MAX_WORKER_ID:
+            raise ImproperlyConfigured(
+                'SNOWFLAKE_WORKER_ID must be from 0 to {}'.format(MAX_WORKER_ID),
+            )
+        return settings.SNOWFLAKE_WORKER_ID
+
+    def lease_worker_id(self):
+        token = uuid.uuid4().hex
+        try:
+            worker_id = RedisHelper.get_script(LEASE_WORKER_ID)(
+                keys=[SNOWFLAKE_WORKERS_KEY],
+                args=[
+                    MAX_WORKER_ID,
+                    token,
+                    settings.SNOWFLAKE_WORKER_LEASE_TIME * 1000,
+                ],
+                client=RedisClient.get_connection(),
+            )
+        except RedisError as e:
+            raise ImproperlyConfigured(
+                'SNOWFLAKE_WORKER_ID is not set and no worker id could be '
+                'leased from redis: {}'.format(e),
+            )
+        if worker_id is None:
+            raise ImproperlyConfigured(
+                'all {} snowflake worker ids are leased'.format(MAX_WORKER_ID + 1),
+            )
+        self.lease_token = token
+        self.lease_renewed_at = time.monotonic()
+        return worker_id
+
+    def renew_worker_id(self):
+        # renewed at half of the lease time, a lease that was lost (the
+        # process stalled longer than the lease) is replaced by a new one
+        # before any other id is generated
+        if self.lease_token is None:
+            return
+        held_for = time.monotonic() - self.lease_renewed_at
+        if held_for < settings.SNOWFLAKE_WORKER_LEASE_TIME / 2:
+            return
+        try:
+            renewed = RedisHelper.get_script(RENEW_WORKER_ID)(
+                keys=[SNOWFLAKE_WORKERS_KEY],
+                args=[
+                    self.worker_id,
+                    self.lease_token,
+                    settings.SNOWFLAKE_WORKER_LEASE_TIME * 1000,
+                ],
+                client=RedisClient.get_connection(),
+            )
+        except RedisError:
+            if held_for < settings.SNOWFLAKE_WORKER_LEASE_TIME:
+                # the lease still holds, try again on the next id
+                return
+            raise
+        if renewed:
+            self.lease_renewed_at = time.monotonic()
+        else:
+            self.worker_id = self.lease_worker_id()
+
+    def release(self):
+        # called at exit, a leased worker id is free again at once instead of
+        # after the lease time
+        with self.lock:
+            if self.lease_token is None or self.pid != os.getpid():
+                return
+            try:
+                RedisHelper.get_script(RELEASE_WORKER_ID)(
+                    keys=[SNOWFLAKE_WORKERS_KEY],
+                    args=[self.worker_id, self.lease_token],
+                    client=RedisClient.get_connection(),
+                )
+            except RedisError:
+                # the lease expires on its own
+                pass
+            self.lease_token = None
+
+    def check(self):
+        # called at startup, only a configured worker id is checked. A worker
+        # id is leased by the first generate(), so processes that never
+        # insert (manage.py commands, the parents of forked workers) neither
+        # need redis nor hold one of the 32 worker ids
+        if settings.SNOWFLAKE_WORKER_ID is not None:
+            self.get_worker_id()
+
+    def generate(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                # forked, the lease of the parent is not ours
+                self.pid = os.getpid()
+                self.lease_token = None
+                self.worker_id = self.get_worker_id()
+            else:
+                self.renew_worker_id()
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms < self.last_ms:
+                # the clock went back, keep counting on the last millisecond
+                now_ms = self.last_ms
+            if now_ms == self.last_ms:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # 128 ids in this millisecond, wait for the next one
+                    while now_ms <= self.last_ms:
+                        now_ms = int(time.time() * 1000) - EPOCH_MS
+            else:
+                self.sequence = 0
+            self.last_ms = now_ms
+            return (
+                (now_ms << TIMESTAMP_SHIFT)
+                | (self.worker_id << SEQUENCE_BITS)
+                | self.sequence
+            )
+
+
+generator = SnowflakeGenerator()
+atexit.register(generator.release)
+
+
+def generate_id():
+    return generator.generate()
+
+
+def id_to_datetime(snowflake_id):
+    # the millisecond the id was generated at
+    return EPOCH + timedelta(milliseconds=snowflake_id >> TIMESTAMP_SHIFT)
\ No newline at end of file
@@ -0,0 +1,9 @@
+from celery import shared_task
+from utils.redis.redis_helper import RedisHelper
+from utils.time_constants import ONE_HOUR
+
+@shared_task(time_limit=ONE_HOUR, routing_key='default')
+def flush_counter_deltas_task():
+    # scheduled by CELERY_BEAT_SCHEDULE
+    count = RedisHelper.flush_counter_deltas()
+    return '{} counters are flushed.'.format(count)
\ No newline at end of file
@@ -1,5 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
 def utc_now():
-    return datetime.now().replace(tzinfo=pytz.utc)
\ No newline at end of file
+    return datetime.now().replace(tzinfo=pytz.utc)
+
+def datetime_to_score(dt):
+    # microseconds since epoch, an integer < 2^53 is exact as a redis score
+    return (dt - EPOCH) // ONE_MICROSECOND
+
+def score_to_datetime(score):
+    return EPOCH + timedelta(microseconds=int(score))
\ No newline at end of file
@@ -0,0 +1,111 @@
+from django.conf import settings
+import msgpack
+import os
+import sqlite3
+import threading
+
+
+class SQLiteTable:
+    # a table of rows sorted by the bytes of their row key, each row holds a
+    # dict of columns. It stands in for an hbase / bigtable table, a range of
+    # rows is read with one scan over [row_start, row_stop)
+
+    def __init__(self, conn, lock, name):
+        self.conn = conn
+        self.lock = lock
+        self.name = name
+
+    def put_many(self, rows):
+        # rows: [(row_key, columns)], a row with the same key is replaced
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO "{}" (row_key, columns) VALUES (?, ?)'.format(
+                    self.name,
+                ),
+                [(row_key, msgpack.packb(columns)) for row_key, columns in rows],
+            )
+
+    def put(self, row_key, columns):
+        self.put_many([(row_key, columns)])
+
+    def get_many(self, row_keys):
+        # {row_key: columns} of the rows that exist
+        row_keys = list(row_keys)
+        if not row_keys:
+            return {}
+        sql = 'SELECT row_key, columns FROM "{}" WHERE row_key IN ({})'.format(
+            self.name,
+            ', '.join('?' for _ in row_keys),
+        )
+        with self.lock:
+            rows = self.conn.execute(sql, row_keys).fetchall()
+        return {bytes(row_key): msgpack.unpackb(columns) for row_key, columns in rows}
+
+    def scan(self, row_start=b'', row_stop=None, limit=None):
+        # [(row_key, columns)] in row key order
+        sql = 'SELECT row_key, columns FROM "{}" WHERE row_key >= ?'.format(self.name)
+        params = [row_start]
+        if row_stop is not None:
+            sql += ' AND row_key < ?'
+            params.append(row_stop)
+        sql += ' ORDER BY row_key LIMIT ?'
+        params.append(-1 if limit is None else limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [(bytes(row_key), msgpack.unpackb(columns)) for row_key, columns in rows]
+
+    def delete_many(self, row_keys):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'DELETE FROM "{}" WHERE row_key = ?'.format(self.name),
+                [(row_key, ) for row_key in row_keys],
+            )
+
+    def truncate(self):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM "{}"'.format(self.name))
+
+
+class WideColumnClient:
+    # tables of the wide column store, a sqlite file (WIDE_COLUMN_SQLITE_PATH)
+    # until the newsfeeds are moved to hbase / bigtable
+    conn = None
+    lock = None
+    pid = None
+    tables = None
+
+    @classmethod
+    def connect(cls):
+        # like RedisClient, a process does not reuse a connection it got
+        # through fork()
+        if cls.conn is not None and cls.pid == os.getpid():
+            return
+
+        cls.conn = sqlite3.connect(
+            settings.WIDE_COLUMN_SQLITE_PATH,
+            check_same_thread=False,
+        )
+        cls.lock = threading.Lock()
+        cls.pid = os.getpid()
+        cls.tables = {}
+
+    @classmethod
+    def get_table(cls, name):
+        cls.connect()
+        if name not in cls.tables:
+            with cls.lock, cls.conn:
+                # WITHOUT ROWID keeps the rows clustered by row key
+                cls.conn.execute(
+                    'CREATE TABLE IF NOT EXISTS "{}" ('
+                    'row_key BLOB PRIMARY KEY, columns BLOB NOT NULL'
+                    ') WITHOUT ROWID'.format(name)
+                )
+            cls.tables[name] = SQLiteTable(cls.conn, cls.lock, name)
+        return cls.tables[name]
+
+    @classmethod
+    def clear(cls):
+        # for testing purpose, empties every table
+        cls.connect()
+        for table in cls.tables.values():
+            table.truncate()
\ No newline at end of file